@@ -1,15 +1,24 @@
 #!/bin/bash
 
+# Usage: rebuild_vectorstore.sh [chunk_size] [--incremental]
+# --incremental keeps the database volume and only applies changed chunks
+
 # Set default chunk size
 CHUNK_SIZE=${1:-1000}
+INCREMENTAL=${2:-}
 
-# Stop and remove the existing container and its volumes if they exist
-echo "Stopping and removing existing containers..."
-docker-compose down -v
+if [ "$INCREMENTAL" = "--incremental" ]; then
+    echo "Starting database container..."
+    docker-compose up db -d
+else
+    # Stop and remove the existing container and its volumes if they exist
+    echo "Stopping and removing existing containers..."
+    docker-compose down -v
 
-# Build and start the containers
-echo "Building and starting containers..."
-docker-compose up db -d
+    # Build and start the containers
+    echo "Building and starting containers..."
+    docker-compose up db -d
+fi
 
 # Wait for PostgreSQL to be ready
 echo "Waiting for PostgreSQL to be ready..."
@@ -17,6 +26,6 @@ sleep 10
 
 # Run the vectorstore preparation script
 echo "Running vectorstore preparation script..."
-python prepare_vectorstore/3-add_to_vectorstore.py --chunk_size $CHUNK_SIZE
+python prepare_vectorstore/3-add_to_vectorstore.py --chunk_size $CHUNK_SIZE $INCREMENTAL
 
-echo "Database setup completed!" 
\ No newline at end of file
+echo "Database setup completed!"
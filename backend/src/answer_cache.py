@@ -0,0 +1,170 @@
+"""Semantic cache of verified answers to first questions.
+
+A question with no earlier messages in its conversation is looked up after the
+next_step and reword calls and the retrieval, by the embedding of its reworded
+query: an entry is a hit when it was stored for the same retrieved documents and
+its query embedding is at least `threshold` cosine-similar. A hit is returned as
+the answer, saving the select_rules, answer and verify calls; the next_step and
+reword calls are still made.
+
+Entries expire after `ttl` seconds, and all entries are dropped when
+`corpus_version` changes, since the documents behind the answers did.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from .embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 0))  # 0 disables the cache; e.g. 1000 to enable it
+DEFAULT_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+DEFAULT_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 60 * 60))
+# Model name of the llm_calls rows that record lookups (response "hit" or "miss")
+ANSWER_CACHE_MODEL = "answer_cache"
+
+
+def retrieval_key(documents: list[dict]) -> tuple[int, ...]:
+    """Sorted ids of the retrieved documents, counting each member of a doc merged by context expansion."""
+    return tuple(sorted(doc_id for doc in documents for doc_id in doc.get("ids", [doc["id"]])))
+
+
+def _unit(embedding) -> np.ndarray:
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm > 0 else embedding
+
+
+class CachedAnswer:
+    def __init__(self, embedding: np.ndarray, answer: str, created_at: float):
+        self.embedding = embedding
+        self.answer = answer
+        self.created_at = created_at
+
+
+class AnswerCache:
+    """In-process LRU of verified answers by (retrieved document ids, query)."""
+
+    def __init__(
+            self,
+            threshold: float = DEFAULT_THRESHOLD,
+            ttl: float = DEFAULT_TTL,
+            max_size: int = DEFAULT_CACHE_SIZE
+        ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.version = None
+        self._entries = OrderedDict()  # (doc ids, normalized query) -> CachedAnswer
+        self._keys_by_doc_ids = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, embedding, doc_ids: tuple[int, ...], version: int | None) -> str | None:
+        """
+        The cached answer for a query embedding and its retrieved document ids, or None.
+
+        `version` is the current corpus version; None (unknown) never hits.
+        """
+        embedding = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            answer = None
+            if version is not None and self._check_version(version):
+                best_similarity = self.threshold
+                for key in list(self._keys_by_doc_ids.get(doc_ids, ())):
+                    entry = self._entries[key]
+                    if now - entry.created_at > self.ttl:
+                        self._remove(key)
+                        continue
+                    similarity = float(entry.embedding @ embedding)
+                    if similarity >= best_similarity:
+                        best_similarity, answer = similarity, entry.answer
+                        best_key = key
+                if answer is not None:
+                    self._entries.move_to_end(best_key)
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                logger.info(f"Answer cache hit (similarity {best_similarity:.3f})")
+            return answer
+
+    def put(self, query: str, embedding, doc_ids: tuple[int, ...], answer: str, version: int | None) -> None:
+        """Store a verified answer; not stored when the corpus version is unknown."""
+        if self.max_size <= 0 or version is None:
+            return
+        key = (doc_ids, normalize_text(query))
+        with self._lock:
+            if not self._check_version(version):
+                return
+            self._entries[key] = CachedAnswer(_unit(embedding), answer, time.time())
+            self._entries.move_to_end(key)
+            self._keys_by_doc_ids.setdefault(doc_ids, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _check_version(self, version: int) -> bool:
+        """Drop every entry when the documents changed. Caller holds the lock.
+
+        Returns False for a version older than the cache's, from a caller whose view is stale.
+        """
+        if self.version is not None and version < self.version:
+            return False
+        if version != self.version:
+            if self._entries:
+                logger.info(f"Documents changed (version {self.version} -> {version}), clearing answer cache")
+                self.invalidations += 1
+            self._entries.clear()
+            self._keys_by_doc_ids.clear()
+            self.version = version
+        return True
+
+    def _remove(self, key) -> None:
+        """Remove an entry. Caller holds the lock."""
+        del self._entries[key]
+        keys = self._keys_by_doc_ids[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_doc_ids[key[0]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_doc_ids.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "version": self.version
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache | None:
+    """Process-wide answer cache configured from ANSWER_CACHE_* environment variables; None when disabled."""
+    global _default_cache
+    if DEFAULT_CACHE_SIZE <= 0:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnswerCache()
+        return _default_cache
@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from ..response_formats import (
     PasswordChange, 
     ChatRequest, 
@@ -9,14 +10,20 @@ from ..response_formats import (
     ForgotPasswordRequest,
     ResetPasswordRequest
 )
-from ..db_client import DBClient
-from ..rag_chat import RagChat
+from ..async_db_client import AsyncDBClient
+from ..db_pool import close_db_pools, close_async_db_pools
+from ..audit_log import close_audit_logs
+from ..prompt_rendering import get_prompt_token_counter
+from ..token_count import get_encoding
+from ..async_rag_chat import AsyncRagChat
 from ..simple_gmail_client import SimpleGmailClient
 import jwt
 from datetime import datetime, timedelta, UTC
 import os
+import asyncio
 import traceback
 import logging
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,6 +35,7 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "http://192.168.0.163:3000")
 
 DEFAULT_CLIENT_TYPE = "openai"
 DEFAULT_MEMORY_SIZE = 5
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
 RETRIEVER_KWARGS = {
     "search_type": "semantic",
     "fts_operator": "OR",
@@ -55,10 +63,11 @@ app.add_middleware(
 )
 
 # Initialize clients
-db_client = DBClient()
-rag_chat = RagChat(
+db_client = AsyncDBClient()
+rag_chat = AsyncRagChat(
     llm_client_type=DEFAULT_CLIENT_TYPE, 
-    memory_size=DEFAULT_MEMORY_SIZE
+    memory_size=DEFAULT_MEMORY_SIZE,
+    speculative=SPECULATIVE_RETRIEVAL
 )
 
 # JWT settings
@@ -96,7 +105,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> str:
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    if not db_client.check_password(form_data.username, form_data.password):
+    if not await db_client.check_password(form_data.username, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -111,10 +120,10 @@ async def change_password(
     password_change: PasswordChange,
     current_user: str = Depends(get_current_user)
 ):
-    if not db_client.check_password(password_change.email, password_change.old_password):
+    if not await db_client.check_password(password_change.email, password_change.old_password):
         raise HTTPException(status_code=400, detail="Invalid old password")
     
-    db_client.change_password(password_change.email, password_change.new_password)
+    await db_client.change_password(password_change.email, password_change.new_password)
     return {"message": "Password changed successfully"}
 
 @app.post("/chat", response_model=ChatResponse)
@@ -124,11 +133,11 @@ async def chat(
 ):
     try:
         # Create new conversation if none exists
-        conversation_id = chat_request.conversation_id or rag_chat.create_conversation(current_user)
+        conversation_id = chat_request.conversation_id or await rag_chat.create_conversation(current_user)
         
         
         # Get response from RAG system
-        response = rag_chat.answer_question(
+        response = await rag_chat.answer_question(
             chat_request.message,
             str(conversation_id),
             retriever_kwargs=RETRIEVER_KWARGS
@@ -142,12 +151,38 @@ async def chat(
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}\n{error_details}")
 
 
+@app.post("/chat/stream")
+async def chat_stream(
+    chat_request: ChatRequest,
+    current_user: str = Depends(get_current_user)
+):
+    """Stream the answer as server-sent events (token, rules, verified, done)."""
+    conversation_id = chat_request.conversation_id or await rag_chat.create_conversation(current_user)
+
+    async def event_stream():
+        try:
+            async for event in rag_chat.answer_question_stream(
+                chat_request.message,
+                str(conversation_id),
+                retriever_kwargs=RETRIEVER_KWARGS
+            ):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}\n{traceback.format_exc()}")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/conversation")
 async def create_conversation(
     current_user: str = Depends(get_current_user)
 ) -> dict:
     try:
-        conversation_id = rag_chat.create_conversation(user_email=current_user)
+        conversation_id = await rag_chat.create_conversation(user_email=current_user)
         logger.info(f"Created conversation: {conversation_id}")
         return {"conversation_id": conversation_id}
     except Exception as e:
@@ -159,14 +194,14 @@ async def signup(request: SignupRequest):
         logger.info(f"Attempting to signup user: {request.email}")
         
         # Check if user already exists
-        existing_user = db_client.get_user_id(request.email)
+        existing_user = await db_client.get_user_id(request.email)
         if existing_user:
             logger.info(f"User already exists: {request.email}")
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # Create user with unverified status
         logger.info(f"Creating new user: {request.email}")
-        user_id = db_client.create_user(request.email, request.password)
+        user_id = await db_client.create_user(request.email, request.password)
         if not user_id:
             logger.error(f"Failed to create user: {request.email}")
             raise HTTPException(status_code=500, detail="Failed to create user")
@@ -226,7 +261,7 @@ async def verify_email(token: str):
             raise HTTPException(status_code=400, detail="Invalid token")
         
         # Update user's verified status
-        if not db_client.verify_user_email(email):
+        if not await db_client.verify_user_email(email):
             raise HTTPException(status_code=400, detail="Failed to verify email")
         
         return {"message": "Email verified successfully"}
@@ -244,7 +279,7 @@ async def forgot_password(request: ForgotPasswordRequest):
         logger.info(f"Processing forgot password request for: {request.email}")
         
         # Check if user exists
-        user_id = db_client.get_user_id(request.email)
+        user_id = await db_client.get_user_id(request.email)
         if not user_id:
             logger.info(f"No user found for email: {request.email}")
             return {"message": "If the email exists, you will receive a password reset link"}
@@ -306,8 +341,7 @@ async def reset_password(request: ResetPasswordRequest):
             raise HTTPException(status_code=400, detail="Invalid token")
         
         # Update password in database
-        db_client = DBClient()
-        success = db_client.update_password(email, request.new_password)
+        success = await db_client.update_password(email, request.new_password)
         
         if not success:
             logger.error(f"Failed to update password for {email}")
@@ -322,4 +356,27 @@ async def reset_password(request: ResetPasswordRequest):
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "service": "ultimate-rules-api"}
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "service": "ultimate-rules-api",
+        "db_pool": await db_client.pool_stats(),
+        "embedding_cache": rag_chat.retriever.embedding_cache.stats(),
+        "answer_cache": rag_chat.answer_cache.stats() if rag_chat.answer_cache is not None else None,
+        "history_tokens": rag_chat.history_manager.stats() if rag_chat.history_manager is not None else None,
+        "prompt_tokens": get_prompt_token_counter().stats(),
+        "audit_log": db_client.audit_log.stats() if db_client.audit_log is not None else None,
+        "history_cache": db_client.history_cache.stats() if db_client.history_cache is not None else None
+    }
+
+@app.on_event("startup")
+async def startup():
+    # The tokenizer for history budgets may download its BPE file on first load, so load it
+    # before serving and off the event loop; counts fall back to an estimate if it fails
+    await asyncio.to_thread(get_encoding)
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Write the queued messages and llm_calls while the pools are still open
+    await asyncio.to_thread(close_audit_logs)
+    await close_async_db_pools()
+    close_db_pools()
\ No newline at end of file
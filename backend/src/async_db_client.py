@@ -0,0 +1,248 @@
+from dotenv import load_dotenv
+import asyncio
+import logging
+import psycopg
+from psycopg.rows import dict_row
+from pydantic import BaseModel
+from uuid import uuid4
+from .db_pool import get_async_db_pool, get_db_settings
+from .audit_log import get_audit_log, merge_pending
+from .model_prices import get_model_prices
+from .history_cache import get_history_cache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDBClient(BaseModel):
+    """Asyncio version of DBClient backed by the shared psycopg 3 async pool.
+
+    Every method mirrors the DBClient method of the same name but must be awaited.
+    """
+    db_settings: dict = None
+
+    def model_post_init(self, __context) -> None:
+        self.db_settings = get_db_settings()
+
+    @property
+    def audit_log(self):
+        """The background writer for messages and llm_calls (see DBClient.audit_log)."""
+        return get_audit_log(self.db_settings)
+
+    @property
+    def prices(self):
+        """In-process copy of the models price table."""
+        return get_model_prices(self.db_settings)
+
+    @property
+    def history_cache(self):
+        """Recent messages of active conversations, written through by add_message; None when disabled."""
+        return get_history_cache()
+
+    async def pool_stats(self) -> dict:
+        pool = await get_async_db_pool(self.db_settings)
+        return pool.get_stats()
+
+    async def query_db_sql(self, sql_query, args):
+        try:
+            pool = await get_async_db_pool(self.db_settings)
+            async with pool.connection() as conn:
+                async with conn.cursor(row_factory=dict_row) as cursor:
+                    await cursor.execute(sql_query, args)
+                    # Only fetch if the statement returns rows (SELECT or RETURNING)
+                    if cursor.description is not None:
+                        return await cursor.fetchall()
+                    return None
+        except psycopg.Error as e:
+            logger.error(f"Database connection error: {e}")
+            raise
+
+    async def get_conversation_history(self, conversation_id, message_limit):
+        cache = self.history_cache
+        if cache is not None:
+            history = cache.get(conversation_id, message_limit)
+            if history is not None:
+                return history
+            token = cache.begin_load()
+        sql_query = """
+        SELECT * FROM get_conversation_history(%s, %s)
+        """
+        args = (conversation_id, message_limit)
+
+        response = await self.query_db_sql(sql_query, args)
+        audit_log = self.audit_log
+        if audit_log is not None:
+            pending = audit_log.pending_messages(conversation_id)
+            if pending:
+                response = merge_pending(response, pending, message_limit)
+        history = []
+        for row in response:
+            history.append({
+                "role": row['conversation_role'],
+                "content": row['content']
+            })
+        if cache is not None:
+            cache.load(conversation_id, response, message_limit, token)
+        return history[::-1]  # Reverse to get chronological order
+
+    async def get_conversation(self, conversation_id):
+        if self.audit_log is not None:
+            await asyncio.to_thread(self.audit_log.flush)
+        sql_query = """SELECT * FROM get_conversation(%s)"""
+        args = (conversation_id,)
+        return await self.query_db_sql(sql_query, args)
+
+    async def add_message(
+            self,
+            conversation_id,
+            conversation_role,
+            content,
+            created_at=None
+        ):
+        # Queuing does not block, so the audit log is used directly from the event loop
+        audit_log = self.audit_log
+        if audit_log is not None:
+            message_id = audit_log.add_message(conversation_id, conversation_role, content, created_at)
+            self._cache_message(conversation_id, message_id, conversation_role, content, created_at)
+            return message_id
+        sql_query = """
+        INSERT INTO messages
+        (conversation_id, conversation_role, content, created_at)
+        VALUES (%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+        RETURNING id
+        """
+        args = (conversation_id, conversation_role, content.strip(), created_at)
+        response = await self.query_db_sql(sql_query, args)
+        message_id = response[0]['id'] if response else None
+        self._cache_message(conversation_id, message_id, conversation_role, content, created_at)
+        return message_id
+
+    def _cache_message(self, conversation_id, message_id, conversation_role, content, created_at):
+        cache = self.history_cache
+        if cache is None:
+            return
+        if created_at is None and message_id is not None:
+            cache.append(conversation_id, message_id, conversation_role, content.strip())
+        else:
+            # A message with its own timestamp may not be the newest one
+            cache.invalidate(conversation_id)
+
+    async def add_llm_call(
+            self,
+            message_id,
+            message_type,
+            prompt,
+            response,
+            model,
+            usage,
+            ttft_ms=None
+        ):
+        """Add an LLM call to the database (see DBClient.add_llm_call)."""
+        audit_log = self.audit_log
+        if audit_log is not None:
+            return audit_log.add_llm_call(message_id, message_type, prompt, response, model, usage, ttft_ms)
+        sql_query = """
+        INSERT INTO llm_calls
+        (message_id, message_type, prompt, response, model, input_tokens, output_tokens, ttft_ms, cost)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id, cost
+        """
+        input_tokens = int(usage.get('input_tokens', 0))
+        output_tokens = int(usage.get('output_tokens', 0))
+
+        args = (
+            message_id,
+            message_type,
+            prompt.strip(),
+            response.strip(),
+            model,
+            input_tokens,
+            output_tokens,
+            ttft_ms,
+            await self.calculate_token_cost(model, input_tokens, output_tokens)
+        )
+
+        response = await self.query_db_sql(sql_query, args)
+        return response[0] if response else None
+
+    async def create_user(self, email, password):
+        user_id = await self.get_user_id(email)
+        if user_id:
+            logger.debug("User already exists")
+            return user_id
+        else:
+            sql_query = "INSERT INTO users (email, password) VALUES (%s, %s) RETURNING id"
+            args = (email, password,)
+            response = await self.query_db_sql(sql_query, args)
+            return response[0]['id'] if response else None
+
+    async def get_user_id(self, email):
+        sql_query = "SELECT id FROM users WHERE email = %s"
+        args = (email,)
+        response = await self.query_db_sql(sql_query, args)
+        return response[0]['id'] if response else None
+
+    async def change_password(self, email, new_password):
+        sql_query = "UPDATE users SET password = %s WHERE email = %s"
+        args = (new_password, email)
+        return await self.query_db_sql(sql_query, args)
+
+    async def check_password(self, email, password):
+        sql_query = "SELECT 1 FROM users WHERE email = %s AND password = %s"
+        args = (email, password)
+        response = await self.query_db_sql(sql_query, args)
+        return len(response) > 0
+
+    async def create_conversation(self, user_email: str|None = None, user_id: str|None = None, conversation_id: str|None = None):
+        if not user_id:
+            user_id = await self.get_user_id(user_email)
+
+        conversation_id = str(uuid4()) if conversation_id is None else conversation_id
+        sql_query = """
+        INSERT INTO conversations (id, user_id)
+        VALUES (%s, %s)
+        RETURNING id"""
+        args = (conversation_id, user_id)
+        response = await self.query_db_sql(sql_query, args)
+        if response and self.history_cache is not None:
+            self.history_cache.start(response[0]['id'])
+        return response[0]['id'] if response else None
+
+    async def calculate_token_cost(self, model_name, input_tokens, output_tokens):
+        # Loading the price table queries the database, keep it off the event loop
+        return await asyncio.to_thread(self.prices.cost, model_name, input_tokens, output_tokens)
+
+    async def calculate_conversation_cost(self, conversation_id):
+        if self.audit_log is not None:
+            await asyncio.to_thread(self.audit_log.flush)
+        sql_query = "SELECT cost FROM conversation_costs WHERE conversation_id = %s"
+        args = (conversation_id,)
+        response = await self.query_db_sql(sql_query, args)
+        return response[0]['cost'] if response else 0
+
+    async def verify_user_email(self, email: str) -> bool:
+        sql_query = """
+        UPDATE users
+        SET verified = true
+        WHERE email = %s
+        RETURNING id
+        """
+        args = (email,)
+        response = await self.query_db_sql(sql_query, args)
+        return bool(response)
+
+    async def update_password(self, email: str, new_password: str) -> bool:
+        try:
+            sql_query = """
+            UPDATE users
+            SET password = %s
+            WHERE email = %s
+            RETURNING id
+            """
+            args = (new_password, email)
+            response = await self.query_db_sql(sql_query, args)
+            return bool(response)
+        except Exception as e:
+            logger.error(f"Error updating password: {e}")
+            return False
@@ -0,0 +1,427 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import time
+from typing import AsyncIterator, Optional
+from pydantic import BaseModel
+from .rag_chat import RagChat, AnswerStreamSplitter, RELEVANT_RULES_HEADER
+from .async_retriever import AsyncRetriever
+from .async_db_client import AsyncDBClient
+from .answer_cache import get_answer_cache
+from .history_manager import get_history_manager
+from .stage_timer import StageTimer
+from .clients.get_abstract_client import get_abstract_client
+from .clients.llm_models import CLIENT_MODEL_MAP
+from .prompts import *
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRagChat(RagChat):
+    """Asyncio version of RagChat.
+
+    All LLM calls go through `BaseClient.ainvoke`, retrieval through AsyncRetriever
+    and logging through AsyncDBClient, so awaiting `answer_question` never blocks
+    the event loop. Context preparation and answer formatting are inherited from RagChat.
+    """
+    retriever: AsyncRetriever
+    db_client: AsyncDBClient
+
+    def __init__(self,
+                 llm_client_type: str,
+                 memory_size: int = 3,
+                 speculative: bool = False):
+        BaseModel.__init__(
+            self,
+            llm_client=get_abstract_client(llm_client_type),
+            retriever=AsyncRetriever(),
+            db_client=AsyncDBClient(),
+            memory_size=memory_size,
+            default_model=CLIENT_MODEL_MAP[llm_client_type]["default"],
+            light_model=CLIENT_MODEL_MAP[llm_client_type]["light"],
+            speculative=speculative,
+            answer_cache=get_answer_cache(),
+            history_manager=get_history_manager()
+        )
+
+    async def answer_question(
+            self,
+            query: str,
+            conversation_id: str,
+            retriever_kwargs: dict = {}
+        ) -> str:
+        """Async version of RagChat.answer_question."""
+        timer = StageTimer()
+        with timer.stage("add_message"):
+            message_id = await self.db_client.add_message(
+                conversation_id,
+                "user",
+                query
+            )
+        logger.debug(f"message created with message_id: {message_id}")
+
+        with timer.stage("history"):
+            conversation_history = await self._get_conversation_history(
+                conversation_id,
+                message_limit=self.memory_size,
+                system_prompt=False
+            )
+        next_step, reworded_query, retrieved_docs = await self._get_next_step_and_docs(
+            query,
+            message_id,
+            conversation_history,
+            retriever_kwargs,
+            timer
+        )
+        cache_key = None
+        if next_step.lower() == "retrieve":
+            await self.retriever.refresh_parsed_documents()
+            context = self._prepare_context(retrieved_docs)
+            logger.info(f"{len(context['rules'])} raw rules,    {len(context['definitions'])} raw definitions")
+
+            if self._uses_answer_cache(conversation_history):
+                with timer.stage("answer_cache"):
+                    cached_answer, cache_key = await self._lookup_cached_answer(reworded_query, retrieved_docs, message_id)
+                if cached_answer is not None:
+                    with timer.stage("add_answer"):
+                        await self.db_client.add_message(conversation_id, "assistant", cached_answer)
+                    timer.log()
+                    return cached_answer
+
+            with timer.stage("select_rules"):
+                relevant_rules_definitions = await self._select_relevant_rules_definitions(
+                    reworded_query,
+                    context,
+                    conversation_id,
+                    message_id,
+                    conversation_history,
+                    light_model=True
+                )
+            context = self._filter_context(context, relevant_rules_definitions)
+            logger.info(f"{len(context['rules'])} filtered rules, {len(context['definitions'])} filtered definitions")
+
+        elif next_step.lower() == "answer":
+            context = {}
+        else:
+            logger.warning(f"Invalid next step: {next_step}")
+            context = {}
+
+        with timer.stage("answer"):
+            answer = await self._get_llm_answer(
+                query,
+                context,
+                message_id,
+                conversation_history,
+                light_model=False,
+                verify=False
+            )
+        with timer.stage("verify"):
+            answer = await self._verify_answer(
+                answer,
+                query,
+                message_id,
+                conversation_history,
+                light_model=True
+            )
+        if cache_key is not None:
+            self._cache_answer(cache_key, answer)
+
+        with timer.stage("add_answer"):
+            await self.db_client.add_message(
+                conversation_id,
+                "assistant",
+                answer
+            )
+        timer.log()
+
+        return answer
+
+    async def answer_question_stream(
+            self,
+            query: str,
+            conversation_id: str,
+            retriever_kwargs: dict = {}
+        ) -> AsyncIterator[dict]:
+        """Answer the user's question, streaming the answer as it is generated.
+
+        The context is prepared and narrowed to the relevant rules and definitions as
+        in `answer_question`, so both endpoints answer from the same context. The
+        answer is requested as plain text so it can be streamed, and the relevant-rules
+        formatting and verification run after the last token.
+
+        Yields:
+            dict: Events of the form {"event": <name>, "data": <payload>}:
+                - "token": a chunk of answer text
+                - "rules": full text of the relevant rules cited by the answer
+                - "verified": the final answer with rules, and whether verification revised it
+                - "done": conversation/message ids and timings (ttft_ms, total_ms, per-stage breakdown)
+        """
+        timer = StageTimer()
+        start = timer.start
+        with timer.stage("add_message"):
+            message_id = await self.db_client.add_message(
+                conversation_id,
+                "user",
+                query
+            )
+        with timer.stage("history"):
+            conversation_history = await self._get_conversation_history(
+                conversation_id,
+                message_limit=self.memory_size,
+                system_prompt=False
+            )
+        next_step, reworded_query, retrieved_docs = await self._get_next_step_and_docs(
+            query,
+            message_id,
+            conversation_history,
+            retriever_kwargs,
+            timer
+        )
+        if next_step.lower() == "retrieve":
+            await self.retriever.refresh_parsed_documents()
+            context = self._prepare_context(retrieved_docs)
+            with timer.stage("select_rules"):
+                relevant_rules_definitions = await self._select_relevant_rules_definitions(
+                    reworded_query,
+                    context,
+                    conversation_id,
+                    message_id,
+                    conversation_history,
+                    light_model=True
+                )
+            context = self._filter_context(context, relevant_rules_definitions)
+        else:
+            context = {}
+
+        request = self._answer_request(query, context, conversation_history, stream=True)
+        splitter = AnswerStreamSplitter()
+        raw_response = []
+        ttft_ms = None
+        with timer.stage("answer"):
+            text_stream, usage = await self.llm_client.ainvoke(**request.invoke_kwargs())
+            async for text in text_stream:
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                    logger.info(f"time to first token: {ttft_ms:.0f} ms")
+                raw_response.append(text)
+                visible = splitter.feed(text)
+                if visible:
+                    yield {"event": "token", "data": visible}
+            visible = splitter.finish()
+            if visible:
+                yield {"event": "token", "data": visible}
+
+        answer = splitter.answer.strip()
+        rules_list_str = ""
+        if context.get("rules"):
+            rules_list_str = self._extract_rules_list(splitter.rule_numbers(), context["rules"])
+        yield {"event": "rules", "data": rules_list_str}
+        answer_with_rules = f"{answer}{RELEVANT_RULES_HEADER}{rules_list_str}" if rules_list_str else answer
+
+        await self.db_client.add_llm_call(**request.llm_call(message_id, "".join(raw_response), usage, ttft_ms=ttft_ms))
+
+        with timer.stage("verify"):
+            verified_answer = await self._verify_answer(
+                answer_with_rules,
+                query,
+                message_id,
+                conversation_history,
+                light_model=True
+            )
+        yield {"event": "verified", "data": {
+            "message": verified_answer,
+            "revised": verified_answer != answer_with_rules
+        }}
+
+        await self.db_client.add_message(
+            conversation_id,
+            "assistant",
+            verified_answer
+        )
+        timings = timer.log()
+        yield {"event": "done", "data": {
+            "conversation_id": str(conversation_id),
+            "message_id": str(message_id),
+            "ttft_ms": ttft_ms,
+            "total_ms": timings["total_ms"],
+            "stages": timings["stages"]
+        }}
+
+    async def _lookup_cached_answer(
+            self,
+            reworded_query: str,
+            retrieved_docs: list[dict],
+            message_id: str
+        ) -> tuple[Optional[str], dict]:
+        """Async version of RagChat._lookup_cached_answer."""
+        cache_key = self._answer_cache_key(reworded_query, retrieved_docs, await self.retriever.create_embedding(reworded_query))
+        answer = self.answer_cache.get(cache_key["embedding"], cache_key["doc_ids"], cache_key["version"])
+        await self.db_client.add_llm_call(**self._answer_cache_call(message_id, cache_key, answer))
+        return answer, cache_key
+
+    async def _get_next_step_and_docs(
+            self,
+            query: str,
+            message_id: str,
+            conversation_history: list[dict],
+            retriever_kwargs: dict,
+            timer: StageTimer
+        ) -> tuple[str, Optional[str], Optional[list]]:
+        """Async version of RagChat._get_next_step_and_docs (speculative stages run with asyncio.gather)."""
+        if self.speculative:
+            next_step, (reworded_query, retrieved_docs) = await asyncio.gather(
+                self._timed_next_step(message_id, conversation_history, query, timer),
+                self._reword_and_retrieve(query, message_id, conversation_history, retriever_kwargs, timer)
+            )
+        else:
+            next_step = await self._timed_next_step(message_id, conversation_history, query, timer)
+            reworded_query, retrieved_docs = None, None
+            if next_step.lower() == "retrieve":
+                reworded_query, retrieved_docs = await self._reword_and_retrieve(
+                    query, message_id, conversation_history, retriever_kwargs, timer
+                )
+        logger.info(f"next_step: '{next_step}' ")
+
+        if next_step.lower() != "retrieve":
+            if retrieved_docs is not None:
+                logger.info("Discarding speculative retrieval")
+            return next_step, None, None
+        return next_step, reworded_query, retrieved_docs
+
+    async def _timed_next_step(
+            self,
+            message_id: str,
+            conversation_history: list[dict],
+            query: str,
+            timer: StageTimer
+        ) -> str:
+        with timer.stage("next_step"):
+            return await self._get_next_step(message_id, conversation_history, query)
+
+    async def _reword_and_retrieve(
+            self,
+            query: str,
+            message_id: str,
+            conversation_history: list[dict],
+            retriever_kwargs: dict,
+            timer: StageTimer
+        ) -> tuple[str, list]:
+        with timer.stage("reword"):
+            reworded_query = await self._reword_query(
+                query,
+                message_id,
+                conversation_history,
+                light_model=True
+            )
+        logger.info(f"reworded_query: '{reworded_query[0:75]}...'")
+        with timer.stage("retrieve"):
+            retrieved_docs = await self._get_docs(reworded_query, **retriever_kwargs)
+        return reworded_query, retrieved_docs
+
+    async def _get_conversation_history(
+            self,
+            conversation_id: str,
+            message_limit: int = 10,
+            system_prompt: bool = True
+        ) -> list[dict]:
+        history = await self.db_client.get_conversation_history(conversation_id, message_limit)
+        if system_prompt:
+            history = [{"role": "system", "content": RAG_SYSTEM_PROMPT}] + history
+        return history
+
+    async def _get_docs(self, query: str, **kwargs) -> list:
+        logger.debug(f"Getting similar documents for query: {query[0:100]}")
+        return await self.retriever.search(query, **kwargs)
+
+    async def _get_next_step(
+            self,
+            message_id: str,
+            conversation_history: list[dict],
+            query: str
+        ) -> str:
+        request = self._next_step_request(conversation_history, query)
+        response, usage = await self.llm_client.ainvoke(**request.invoke_kwargs())
+        await self.db_client.add_llm_call(**request.llm_call(message_id, response, usage))
+        return response.lower()
+
+    async def _reword_query(
+            self,
+            query: str,
+            message_id: str,
+            conversation_history: list[dict],
+            light_model: bool = True
+        ) -> str:
+        request = self._reword_request(conversation_history, query, light_model)
+        response, usage = await self.llm_client.ainvoke(**request.invoke_kwargs())
+        reworded_query = self._parse_reword(query, response)
+        await self.db_client.add_llm_call(**request.llm_call(message_id, reworded_query, usage))
+        return reworded_query
+
+    async def _select_relevant_rules_definitions(
+            self,
+            query: str,
+            context: list[dict],
+            conversation_id: str,
+            message_id: str,
+            conversation_history: list[dict],
+            light_model: bool = True
+        ) -> list[str]:
+        request = self._select_rules_request(query, conversation_history, context, light_model)
+        relevant_rules_definitions, usage = await self.llm_client.ainvoke(**request.invoke_kwargs())
+        await self.db_client.add_llm_call(**request.llm_call(message_id, repr(relevant_rules_definitions), usage))
+        return relevant_rules_definitions.model_dump()
+
+    async def _get_llm_answer(
+            self,
+            query: str,
+            context: list[dict],
+            message_id: str,
+            conversation_history: list[dict],
+            light_model: bool = False,
+            verify: bool = True
+        ) -> str:
+        request = self._answer_request(query, context, conversation_history, light_model)
+        response, usage = await self.llm_client.ainvoke(**request.invoke_kwargs())
+        answer = self._format_answer(response, context)
+        await self.db_client.add_llm_call(**request.llm_call(message_id, repr(response), usage))
+
+        if verify:
+            answer = await self._verify_answer(
+                answer,
+                query,
+                message_id,
+                conversation_history,
+                light_model=True
+            )
+        return answer
+
+    async def _verify_answer(
+            self,
+            answer_with_rules: str,
+            query: str,
+            message_id: str,
+            conversation_history: list[dict],
+            light_model: bool = True
+        ) -> str:
+        request = self._verify_request(query, answer_with_rules, conversation_history, light_model)
+        response, usage = await self.llm_client.ainvoke(**request.invoke_kwargs())
+        logger.info(f"raw verification response:\n{repr(response)}")
+        verified_answer_with_rules = self._apply_verification(response, answer_with_rules)
+        await self.db_client.add_llm_call(**request.llm_call(message_id, repr(response), usage))
+        return verified_answer_with_rules
+
+    async def create_conversation(self, user_email: str):
+        """Create a new conversation entry in database."""
+        user_id = await self.db_client.get_user_id(user_email)
+        if not user_id:
+            logger.warning(f"User {user_email} not found, creating new user")
+
+        conversation_id = await self.db_client.create_conversation(user_id=user_id)
+        logger.info(f"Created conversation: {conversation_id}")
+        return conversation_id
+
+    async def calculate_conversation_cost(self, conversation_id):
+        """Calculate the total cost of a conversation from its per-conversation cost aggregate."""
+        return await self.db_client.calculate_conversation_cost(conversation_id)
@@ -0,0 +1,315 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import logging
+import numpy as np
+import psycopg
+from openai import AsyncOpenAI
+from .retriever import Retriever, EMBEDDING_MODEL, DEFAULT_RETRIEVAL_BACKEND, DEFAULT_HYBRID_CANDIDATES, EXPANSION_SQL
+from .embedding_cache import EmbeddingCache
+from .fusion import FusionCandidates, fuse
+from .db_pool import get_async_db_pool
+from .vector_index import VectorIndex
+from .parsed_documents import find_rule_references
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRetriever(Retriever):
+    """Asyncio version of Retriever.
+
+    Uses AsyncOpenAI for embeddings and the shared psycopg 3 async pool for
+    queries. Query building and result post-processing are inherited from Retriever.
+    """
+    def __init__(
+            self,
+            embedding_cache: EmbeddingCache|None = None,
+            backend: str = DEFAULT_RETRIEVAL_BACKEND,
+            hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES,
+            vector_index: VectorIndex|None = None
+        ):
+        super().__init__(embedding_cache, backend, hybrid_candidates, vector_index)
+        self.async_client = AsyncOpenAI()
+
+    async def _cache_call(self, fn, *args):
+        # The persistent tier of the embedding cache does blocking I/O, keep it off the event loop
+        if self.embedding_cache.store is None:
+            return fn(*args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def create_embedding(self, text):
+        embedding = await self._cache_call(self.embedding_cache.get, text, EMBEDDING_MODEL)
+        if embedding is not None:
+            return embedding
+        logger.debug("creating embedding...")
+        response = await self.async_client.embeddings.create(input=text, model=EMBEDDING_MODEL)
+        embedding = response.data[0].embedding
+        await self._cache_call(self.embedding_cache.put, text, EMBEDDING_MODEL, embedding)
+        return embedding
+
+    async def query_db_sql(self, sql_query, args):
+        try:
+            pool = await get_async_db_pool(self.db_settings)
+            async with pool.connection() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(sql_query, args)
+                    return await cursor.fetchall()
+        except psycopg.Error as e:
+            logger.error(f"Database connection error: {e}")
+            raise
+
+    async def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Async version of Retriever.create_embeddings."""
+        embeddings = [await self._cache_call(self.embedding_cache.get, text, EMBEDDING_MODEL) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            logger.debug(f"creating {len(missing)} embeddings...")
+            response = await self.async_client.embeddings.create(input=[texts[i] for i in missing], model=EMBEDDING_MODEL)
+            for i, item in zip(missing, response.data):
+                embeddings[i] = item.embedding
+                await self._cache_call(self.embedding_cache.put, texts[i], EMBEDDING_MODEL, item.embedding)
+        return embeddings
+
+    async def _refresh_vector_index(self):
+        # The corpus version check and reload use the blocking pool, keep them off the event loop
+        if self.vector_index.needs_check():
+            await asyncio.to_thread(self.vector_index.refresh)
+
+    async def refresh_parsed_documents(self):
+        # Loading the parsed documents queries the database, keep it off the event loop
+        if self.parsed_documents.needs_check():
+            await asyncio.to_thread(self.parsed_documents.refresh)
+
+    async def search(self,
+        query: str,
+        search_type: str = "hybrid",
+        limit: int = 3,
+        expand_context: bool|int = False,
+        fts_operator: str = "|",
+        k: int = 60,
+        semantic_weight: float = 0.5,
+        fts_weight: float = 0.5,
+        query_embedding: list|None = None,
+        fusion: str|None = None,
+        rule_lookup: bool = True
+    ) -> list[dict]:
+        """Async version of Retriever.search (same arguments and return value)."""
+        search_type = search_type.lower()
+
+        if rule_lookup and find_rule_references(query):
+            await self.refresh_parsed_documents()
+            retrieved_docs = self._rule_lookup(query)
+            if retrieved_docs is not None:
+                expansion_size = self._get_expansion_size(expand_context)
+                if expansion_size > 0:
+                    retrieved_docs = await self.get_expanded_context(retrieved_docs, expansion_size)
+                return retrieved_docs
+
+        if search_type == "hybrid" and fusion is not None:
+            results = await self.search_many(
+                [query], search_type=search_type, limit=limit, expand_context=expand_context,
+                fts_operator=fts_operator, k=k, semantic_weight=semantic_weight, fts_weight=fts_weight,
+                query_embeddings=[query_embedding], fusion=fusion
+            )
+            return results[0]
+
+        if search_type not in ["semantic", "fts", "hybrid"]:
+            raise ValueError(f"Invalid search_type: {search_type}. Must be one of: 'semantic', 'fts', or 'hybrid'")
+
+        expansion_size = self._get_expansion_size(expand_context)
+        if expansion_size > 0 and self.vector_index is None:
+            # Search and expansion in one round trip
+            if search_type != "fts" and query_embedding is None:
+                query_embedding = await self.create_embedding(query)
+            if query_embedding is not None:
+                query_embedding = np.asarray(query_embedding, dtype=np.float32)
+            sql_query, args = self._expanded_search_sql(
+                search_type, query, limit, expansion_size, fts_operator, k, semantic_weight, fts_weight,
+                query_embedding, "%s"
+            )
+            return self._merge_expanded_rows(await self.query_db_sql(sql_query, args))
+
+        if search_type == "semantic":
+            retrieved_docs = await self.similarity_search(query=query, limit=limit, query_embedding=query_embedding)
+        elif search_type == "fts":
+            retrieved_docs = await self.fts_search(query=query, limit=limit, fts_operator=fts_operator)
+        else:
+            retrieved_docs = await self.hybrid_search(
+                query=query, limit=limit, fts_operator=fts_operator,
+                k=k, semantic_weight=semantic_weight, fts_weight=fts_weight,
+                query_embedding=query_embedding
+            )
+
+        retrieved_docs = self._format_docs(retrieved_docs)
+
+        if expansion_size > 0:
+            retrieved_docs = await self.get_expanded_context(retrieved_docs, expansion_size)
+
+        return retrieved_docs
+
+    async def search_many(self,
+        queries: list[str],
+        search_type: str = "hybrid",
+        limit: int = 3,
+        expand_context: bool|int = False,
+        fts_operator: str = "OR",
+        k: int = 60,
+        semantic_weight: float = 0.5,
+        fts_weight: float = 0.5,
+        query_embeddings: list|None = None,
+        fusion: str|None = None
+    ) -> list[list[dict]]:
+        """Async version of Retriever.search_many (same arguments and return value)."""
+        search_type = search_type.lower()
+        if search_type not in ["semantic", "fts", "hybrid"]:
+            raise ValueError(f"Invalid search_type: {search_type}. Must be one of: 'semantic', 'fts', or 'hybrid'")
+        if not queries:
+            return []
+
+        rows_per_query = await self._search_many_rows(
+            queries, search_type, limit, fts_operator, k, semantic_weight, fts_weight, query_embeddings, fusion
+        )
+
+        results = [self._format_docs(rows) for rows in rows_per_query]
+
+        expansion_size = self._get_expansion_size(expand_context)
+        if expansion_size > 0:
+            ids_per_query = [self._get_expansion_ids(docs) for docs in results]
+            all_ids = set().union(*ids_per_query)
+            if all_ids:
+                adjacent_docs = await self.query_db_sql(EXPANSION_SQL, {"ids": list(all_ids), "size": expansion_size})
+                results = [
+                    self._merge_expanded_context(docs, [row for row in adjacent_docs if row[0] in ids]) if ids else docs
+                    for docs, ids in zip(results, ids_per_query)
+                ]
+        return results
+
+    async def _search_many_rows(
+            self,
+            queries: list[str],
+            search_type: str,
+            limit: int,
+            fts_operator: str,
+            k: int,
+            semantic_weight: float,
+            fts_weight: float,
+            query_embeddings: list|None,
+            fusion: str|None = None
+        ) -> list[list[tuple]]:
+        """Async version of Retriever._search_many_rows."""
+        if search_type != "fts":
+            query_embeddings = await self._fill_query_embeddings(queries, query_embeddings)
+
+        if search_type == "hybrid" and fusion is not None:
+            candidates = await self.get_fusion_candidates(
+                queries, max(self.hybrid_candidates or 100, limit), fts_operator, query_embeddings
+            )
+            return fuse(candidates, fusion, limit, k, semantic_weight, fts_weight)
+
+        if self.vector_index is not None and search_type != "fts":
+            await self._refresh_vector_index()
+        if self.vector_index is not None and search_type == "semantic":
+            return self.vector_index.similarity_search_many(query_embeddings, limit)
+        if self.vector_index is not None and search_type == "hybrid":
+            sql_query, args = self._search_many_sql("fts", queries, None, len(self.vector_index), fts_operator)
+            fts_rows_per_query = self._group_rows_by_query(await self.query_db_sql(sql_query, args), len(queries))
+            return self.vector_index.hybrid_search_many(
+                query_embeddings, fts_rows_per_query, limit, k, semantic_weight, fts_weight
+            )
+
+        sql_query, args = self._search_many_sql(
+            search_type, queries, query_embeddings, limit, fts_operator, k, semantic_weight, fts_weight
+        )
+        return self._group_rows_by_query(await self.query_db_sql(sql_query, args), len(queries))
+
+    async def get_fusion_candidates(
+            self,
+            queries: list[str],
+            candidate_num: int = 100,
+            fts_operator: str = "OR",
+            query_embeddings: list|None = None
+        ) -> FusionCandidates:
+        """Async version of Retriever.get_fusion_candidates."""
+        query_embeddings = await self._fill_query_embeddings(queries, query_embeddings)
+        if self.vector_index is not None:
+            await self._refresh_vector_index()
+            semantic_rows = self.vector_index.similarity_search_many(query_embeddings, candidate_num)
+        else:
+            sql_query, args = self._search_many_sql("semantic", queries, query_embeddings, candidate_num)
+            semantic_rows = self._group_rows_by_query(await self.query_db_sql(sql_query, args), len(queries))
+        sql_query, args = self._search_many_sql("fts", queries, None, candidate_num, fts_operator)
+        fts_rows = self._group_rows_by_query(await self.query_db_sql(sql_query, args), len(queries))
+        return FusionCandidates(semantic_rows, fts_rows)
+
+    async def _fill_query_embeddings(self, queries: list[str], query_embeddings: list|None) -> list:
+        """Async version of Retriever._fill_query_embeddings."""
+        query_embeddings = list(query_embeddings) if query_embeddings is not None else [None] * len(queries)
+        missing = [i for i, embedding in enumerate(query_embeddings) if embedding is None]
+        if missing:
+            for i, embedding in zip(missing, await self.create_embeddings([queries[i] for i in missing])):
+                query_embeddings[i] = embedding
+        return [np.asarray(embedding, dtype=np.float32) for embedding in query_embeddings]
+
+    async def similarity_search(
+            self,
+            query: str,
+            limit: int = 3,
+            query_embedding: list|None = None
+        ) -> list[tuple]:
+        """Async version of Retriever.similarity_search."""
+        if query_embedding is None:
+            query_embedding = await self.create_embedding(query)
+        if self.vector_index is not None:
+            await self._refresh_vector_index()
+            return self.vector_index.similarity_search(query_embedding, limit)
+        search_call, args = self._search_call(
+            "semantic", query, limit, query_embedding=np.asarray(query_embedding, dtype=np.float32), embedding_arg="%s"
+        )
+        return await self.query_db_sql(f"SELECT * FROM {search_call};", args)
+
+    async def fts_search(
+            self,
+            query: str,
+            limit: int = 3,
+            fts_operator: str = "OR"
+        ) -> list[tuple]:
+        """Async version of Retriever.fts_search."""
+        search_call, args = self._search_call("fts", query, limit, fts_operator)
+        return await self.query_db_sql(f"SELECT * FROM {search_call};", args)
+
+    async def hybrid_search(
+            self,
+            query: str,
+            limit: int = 3,
+            fts_operator: str = "OR",
+            k: int = 60,
+            semantic_weight: float = 0.5,
+            fts_weight: float = 0.5,
+            query_embedding: list|None = None
+        ) -> list[tuple]:
+        """Async version of Retriever.hybrid_search."""
+        if query_embedding is None:
+            query_embedding = await self.create_embedding(query)
+
+        if self.vector_index is not None:
+            await self._refresh_vector_index()
+            fts_rows = await self.fts_search(query=query, limit=len(self.vector_index), fts_operator=fts_operator)
+            return self.vector_index.hybrid_search(
+                query_embedding, fts_rows, limit, k, semantic_weight, fts_weight
+            )
+
+        search_call, args = self._search_call(
+            "hybrid", query, limit, fts_operator, k, semantic_weight, fts_weight,
+            np.asarray(query_embedding, dtype=np.float32), "%s"
+        )
+        return await self.query_db_sql(f"SELECT * FROM {search_call};", args)
+
+    async def get_expanded_context(self, retrieved_docs: list[dict], expansion_size: int) -> list[dict]:
+        """Async version of Retriever.get_expanded_context."""
+        hit_ids = self._get_expansion_ids(retrieved_docs)
+        if not hit_ids:
+            return retrieved_docs
+
+        adjacent_docs = await self.query_db_sql(EXPANSION_SQL, {"ids": list(hit_ids), "size": expansion_size})
+        return self._merge_expanded_context(retrieved_docs, adjacent_docs)
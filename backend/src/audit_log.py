@@ -0,0 +1,340 @@
+"""Background writer for the `messages` and `llm_calls` audit records.
+
+Every question writes a user message, an assistant message and one llm_calls
+row per LLM call. Written inline, each of those is a round trip (and a pool
+checkout) inside the request. With the audit log enabled, DBClient and
+AsyncDBClient only put the record on an in-memory queue and return; a daemon
+thread takes records off the queue and writes them in batches, one multi-row
+INSERT per table per batch, messages before the llm_calls that reference them.
+
+Message ids and timestamps are assigned when the record is queued, so
+`add_message` still returns the id right away and history keeps the order
+the messages were added in. Messages that are queued but not yet written are
+merged into `get_conversation_history` reads, so a conversation never looks
+behind to the request that wrote it.
+
+Transient database errors (lost connection, pool timeout) are retried with
+backoff a bounded number of times before the batch is dropped; a batch that
+fails for any other reason is written record by record so one bad row only
+costs itself. The queue is bounded: when it is full, records are dropped
+rather than blocking the request. `close()` drains the queue; the API calls
+it on shutdown and scripts drain at exit. Records added after that are
+written inline.
+
+AUDIT_LOG_MODE=sync restores the inline inserts.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from uuid import uuid4
+from datetime import datetime, UTC
+import psycopg2
+from psycopg2.extras import execute_values
+from .db_pool import get_db_pool, get_db_settings
+from .model_prices import get_model_prices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODE = os.getenv("AUDIT_LOG_MODE", "background")  # background | sync
+DEFAULT_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", 200))
+# Seconds the writer waits for a batch to fill once it has a record
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", 0.5))
+DEFAULT_MAX_RETRIES = int(os.getenv("AUDIT_LOG_MAX_RETRIES", 3))
+DEFAULT_RETRY_BACKOFF = float(os.getenv("AUDIT_LOG_RETRY_BACKOFF", 0.5))
+DEFAULT_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", 10000))
+DEFAULT_CLOSE_TIMEOUT = float(os.getenv("AUDIT_LOG_CLOSE_TIMEOUT", 30))
+
+MESSAGES_INSERT = """
+INSERT INTO messages (id, conversation_id, conversation_role, content, created_at)
+VALUES %s
+"""
+LLM_CALLS_INSERT = """
+INSERT INTO llm_calls
+(message_id, message_type, prompt, response, model, input_tokens, output_tokens, ttft_ms, created_at, cost)
+VALUES %s
+"""
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+_STOP = object()
+
+
+class AuditLog:
+    """Queue of messages and llm_calls records written to the database by a background thread.
+
+    Args:
+        db_settings: Connection settings of the database to write to
+        batch_size: Maximum number of records written per batch
+        flush_interval: Seconds to wait for more records before writing a partial batch
+        max_retries: Attempts after the first for a batch that fails with a transient error
+        retry_backoff: Seconds before the first retry; doubled on each retry
+        queue_size: Maximum number of queued records; further records are dropped
+        pool: Optional connection pool (defaults to the shared pool for db_settings)
+        prices: Optional price table for llm_calls costs (defaults to the shared ModelPrices)
+    """
+
+    def __init__(
+            self,
+            db_settings: dict | None = None,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+            queue_size: int = DEFAULT_QUEUE_SIZE,
+            pool=None,
+            prices=None
+        ):
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        self.db_settings = db_settings or get_db_settings()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._pool = pool
+        self._prices = prices
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._pending = {}  # conversation_id -> queued message records, in the order they were added
+        self._closed = False
+
+        self.queued = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.write_time_total = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def pool(self):
+        return self._pool or get_db_pool(self.db_settings)
+
+    @property
+    def prices(self):
+        return self._prices or get_model_prices(self.db_settings)
+
+    def _put(self, record: tuple) -> bool:
+        if self._closed:
+            # Late records (e.g. a request finishing during shutdown) are written inline
+            self._write([record])
+            return True
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.error(f"Audit log queue is full; dropping a {record[0]} record")
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def add_message(self, conversation_id, conversation_role, content, created_at=None) -> str:
+        """Queue a message; returns the id it will be written with."""
+        message = {
+            "id": str(uuid4()),
+            "conversation_id": str(conversation_id),
+            "conversation_role": conversation_role,
+            "content": content.strip(),
+            "created_at": created_at or datetime.now(UTC)
+        }
+        with self._lock:
+            self._pending.setdefault(message["conversation_id"], []).append(message)
+        if not self._put(("messages", message)):
+            self._forget([message])
+        return message["id"]
+
+    def add_llm_call(self, message_id, message_type, prompt, response, model, usage, ttft_ms=None) -> None:
+        """Queue an llm_calls record (see DBClient.add_llm_call); its cost is computed by the writer."""
+        self._put(("llm_calls", (
+            str(message_id),
+            message_type,
+            prompt.strip(),
+            response.strip(),
+            model,
+            int(usage.get('input_tokens', 0)),
+            int(usage.get('output_tokens', 0)),
+            ttft_ms,
+            datetime.now(UTC)
+        )))
+
+    def pending_messages(self, conversation_id) -> list[dict]:
+        """Messages of a conversation that are queued but not written yet, oldest first."""
+        with self._lock:
+            return list(self._pending.get(str(conversation_id), ()))
+
+    def _forget(self, messages: list[dict]):
+        ids = {message["id"] for message in messages}
+        with self._lock:
+            for conversation_id in {message["conversation_id"] for message in messages}:
+                pending = [m for m in self._pending.get(conversation_id, ()) if m["id"] not in ids]
+                if pending:
+                    self._pending[conversation_id] = pending
+                else:
+                    self._pending.pop(conversation_id, None)
+
+    def _next_batch(self) -> tuple[list[tuple], bool]:
+        """Block for a record, then collect up to batch_size records for flush_interval; returns (batch, stop)."""
+        record = self._queue.get()
+        if record is _STOP:
+            return [], True
+        batch = [record]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                record = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception as e:
+                # Never let the writer thread die; the batch is lost but later ones are not
+                logger.exception(f"Audit log writer failed on a batch of {len(batch)} records: {e}")
+                with self._lock:
+                    self.dropped += len(batch)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+
+    def _insert(self, messages: list[dict], llm_calls: list[tuple]):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cursor:
+                if messages:
+                    execute_values(cursor, MESSAGES_INSERT, [
+                        (m["id"], m["conversation_id"], m["conversation_role"], m["content"], m["created_at"])
+                        for m in messages
+                    ], page_size=self.batch_size)
+                if llm_calls:
+                    execute_values(cursor, LLM_CALLS_INSERT, llm_calls, page_size=self.batch_size)
+
+    def _write(self, batch: list[tuple]):
+        messages = [record for table, record in batch if table == "messages"]
+        prices = self.prices
+        # Priced here rather than per row by the database; unknown models (cost None) are left to the trigger
+        llm_calls = [
+            record + (prices.cost(record[4], record[5], record[6]),)
+            for table, record in batch if table == "llm_calls"
+        ]
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                self._insert(messages, llm_calls)
+                written = len(batch)
+                break
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"Dropping {len(batch)} audit records after {attempt + 1} attempts: {e}")
+                    written = 0
+                    break
+                delay = self.retry_backoff * 2 ** attempt
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                logger.warning(f"Audit log write failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+            except psycopg2.Error as e:
+                logger.warning(f"Audit log batch rejected ({e}); writing its {len(batch)} records one by one")
+                written = self._write_each(messages, llm_calls)
+                break
+        self._forget(messages)
+        with self._lock:
+            self.batches += 1
+            self.written += written
+            self.dropped += len(batch) - written
+            self.write_time_total += time.monotonic() - start
+
+    def _write_each(self, messages: list[dict], llm_calls: list[tuple]) -> int:
+        written = 0
+        for record in [([m], []) for m in messages] + [([], [c]) for c in llm_calls]:
+            try:
+                self._insert(*record)
+                written += 1
+            except psycopg2.Error as e:
+                logger.error(f"Dropping audit record: {e}")
+        return written
+
+    def flush(self):
+        """Block until every record queued so far is written (or dropped)."""
+        self._queue.join()
+
+    def close(self, timeout: float = DEFAULT_CLOSE_TIMEOUT):
+        """Write the queued records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"Audit log did not drain within {timeout}s; {self._queue.qsize()} records lost")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "pending": self._queue.qsize(),
+                "written": self.written,
+                "batches": self.batches,
+                "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+                "retries": self.retries,
+                "dropped": self.dropped,
+                "write_time_total": self.write_time_total
+            }
+
+
+def merge_pending(rows: list[dict], pending: list[dict], message_limit: int) -> list[dict]:
+    """History rows read from the database (newest first) plus the queued messages not among them, limited like the query."""
+    written = {str(row['id']) for row in rows}
+    merged = rows + [
+        {"id": m["id"], "conversation_role": m["conversation_role"], "content": m["content"], "created_at": m["created_at"]}
+        for m in pending if m["id"] not in written
+    ]
+    merged.sort(key=lambda row: row['created_at'], reverse=True)
+    return merged[:message_limit]
+
+
+_audit_logs: dict[tuple, AuditLog] = {}
+_audit_logs_lock = threading.Lock()
+
+
+def get_audit_log(db_settings: dict | None = None) -> AuditLog | None:
+    """Process-wide audit log for the given connection settings; None when AUDIT_LOG_MODE=sync."""
+    if DEFAULT_MODE == "sync":
+        return None
+    if DEFAULT_MODE != "background":
+        raise ValueError(f"Invalid AUDIT_LOG_MODE: {DEFAULT_MODE}. Must be one of: 'background', 'sync'")
+    db_settings = db_settings or get_db_settings()
+    key = tuple(sorted((k, str(v)) for k, v in db_settings.items()))
+    with _audit_logs_lock:
+        if key not in _audit_logs:
+            _audit_logs[key] = AuditLog(db_settings)
+        return _audit_logs[key]
+
+
+def close_audit_logs():
+    """Drain and stop every shared audit log (e.g. on application shutdown, before the pools close)."""
+    with _audit_logs_lock:
+        audit_logs = list(_audit_logs.values())
+        _audit_logs.clear()
+    for audit_log in audit_logs:
+        audit_log.close()
+
+
+atexit.register(close_audit_logs)
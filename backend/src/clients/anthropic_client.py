@@ -1,8 +1,9 @@
 import os
-from typing import Dict, Any, List, Union, Optional, Type, Iterator
+import copy
+from typing import Dict, Any, List, Union, Optional, Type, Iterator, AsyncIterator
 import json
 from pydantic import BaseModel, Field
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from .base_client import BaseClient
 import logging
 from dotenv import load_dotenv
@@ -30,6 +31,7 @@ class AnthropicAbstractedClient(BaseClient):
     
     Attributes:
         client: The underlying Anthropic client instance
+        async_client: The underlying AsyncAnthropic client instance
         default_model: The default model to use for completions
     """
     
@@ -46,9 +48,10 @@ class AnthropicAbstractedClient(BaseClient):
         """Initialize the Anthropic client with API credentials.
         
         Requires ANTHROPIC_API_KEY environment variable to be set.
-        Sets up the client and default model configuration.
+        Sets up the sync and async clients and default model configuration.
         """
         self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.async_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
         self.default_model = default_model or os.getenv("DEFAULT_OPENAI_MODEL", DEFAULT_ANTHROPIC_MODEL)
         if not self.default_model:
             self.default_model = os.getenv("DEFAULT_ANTHROPIC_MODEL")
@@ -78,6 +81,32 @@ class AnthropicAbstractedClient(BaseClient):
             response_format: Optional output format specification
             return_usage: Whether to return the usage metrics from the API call
         """
+        message_list, config = self._prepare_request(messages, config, response_format)
+
+        if config.get('stream', False):
+            usage = {} if return_usage else None
+            text_stream = self.get_streaming_response(message_list, config, usage)
+            return (text_stream, usage) if return_usage else text_stream
+        else:
+            return self.get_non_streaming_response(message_list, config, response_format, return_usage)
+
+    async def ainvoke(self, 
+              messages: Union[str, List[Dict[str, str]]],
+              config: Optional[Dict[str, Any]] = None, 
+              response_format: Optional[Union[dict, Type[BaseModel]]] = None,
+              return_usage: bool = False) -> Union[str, dict, BaseModel, AsyncIterator[str]]:
+        """Async version of `invoke` using the AsyncAnthropic client."""
+        message_list, config = self._prepare_request(messages, config, response_format)
+
+        if config.get('stream', False):
+            usage = {} if return_usage else None
+            text_stream = self.aget_streaming_response(message_list, config, usage)
+            return (text_stream, usage) if return_usage else text_stream
+        else:
+            return await self.aget_non_streaming_response(message_list, config, response_format, return_usage)
+
+    def _prepare_request(self, messages, config, response_format):
+        """Normalize the messages, system prompt and config shared by the sync and async code paths."""
         config = config or {}
         config['model'] = config.get('model', self.default_model)
         config['max_tokens'] = config.get('max_tokens', DEFAULT_MAX_TOKENS)
@@ -118,14 +147,22 @@ class AnthropicAbstractedClient(BaseClient):
             system_prompt = config.get('system', '')
             system_prompt = (system_prompt + f"\n\n{format_instruction}").strip()
             config['system'] = system_prompt
-        
-        if config.get('stream', False):
-            return self.get_streaming_response(message_list, config)
-        else:
-            return self.get_non_streaming_response(message_list, config, response_format, return_usage)
-            
+
+        return message_list, config
             
-    def get_streaming_response(self, messages, config):
+    def batch_params(self, messages, config=None, response_format=None) -> dict:
+        """Messages request params of an `invoke` call, for a Message Batches API request."""
+        message_list, config = self._prepare_request(copy.deepcopy(messages), dict(config or {}), response_format)
+        return {"messages": message_list, **{k:v for k,v in config.items() if k != 'stream'}}
+
+    def parse_batch_result(self, message, response_format=None) -> tuple:
+        """(output, usage) of a message from the Message Batches API results."""
+        parsed = self._parse_response(message, response_format, return_usage=True)
+        if not isinstance(parsed, tuple):
+            raise ValueError(f"Could not parse batch result: {message}")
+        return parsed
+
+    def get_streaming_response(self, messages, config, usage=None):
             stream = self.client.messages.stream(
                 messages=messages,
                 **{k:v for k,v in config.items() if k != 'stream'}
@@ -135,13 +172,39 @@ class AnthropicAbstractedClient(BaseClient):
                 with stream as managed_stream:
                     for text in managed_stream.text_stream:
                         yield text
+                    if usage is not None:
+                        self._update_stream_usage(managed_stream.get_final_message(), usage)
             return stream_with_context()
+
+    async def aget_streaming_response(self, messages, config, usage=None) -> AsyncIterator[str]:
+        async with self.async_client.messages.stream(
+            messages=messages,
+            **{k:v for k,v in config.items() if k != 'stream'}
+        ) as managed_stream:
+            async for text in managed_stream.text_stream:
+                yield text
+            if usage is not None:
+                self._update_stream_usage(await managed_stream.get_final_message(), usage)
+
+    def _update_stream_usage(self, final_message, usage: dict):
+        usage["input_tokens"] = final_message.usage.input_tokens
+        usage["output_tokens"] = final_message.usage.output_tokens
     
     def get_non_streaming_response(self, messages, config, response_format, return_usage):
         response = self.client.messages.create(
             messages=messages,
             **config
         )
+        return self._parse_response(response, response_format, return_usage)
+
+    async def aget_non_streaming_response(self, messages, config, response_format, return_usage):
+        response = await self.async_client.messages.create(
+            messages=messages,
+            **config
+        )
+        return self._parse_response(response, response_format, return_usage)
+
+    def _parse_response(self, response, response_format, return_usage):
         usage = {
             "input_tokens": response.usage.input_tokens,
             "output_tokens": response.usage.output_tokens,
@@ -1,28 +1,88 @@
 from typing import Dict, Any, Optional, Type, Union
 from pydantic import BaseModel
+import asyncio
 import logging
 from typing import Any, List
-from typing import Generator, Iterator
+from typing import Generator, Iterator, AsyncIterator
+import functools
+from .response_cache import ResponseCache, get_response_cache, response_key
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Usage returned for a response served from the response cache: no tokens were paid for
+CACHED_USAGE = {"input_tokens": 0, "output_tokens": 0, "cached": True}
+
+
+def _cached_invoke(invoke):
+    """Wrap a provider's `invoke` with the client's response cache (non-streaming calls only)."""
+    @functools.wraps(invoke)
+    def cached_invoke(self, messages, config=None, response_format=None, return_usage=False):
+        if self.response_cache is None or (config or {}).get('stream', False):
+            return invoke(self, messages, config, response_format, return_usage)
+        key, model = self._response_key(messages, config, response_format)
+        cached = self.response_cache.get(key, response_format)
+        if cached is not None:
+            return (cached[0], dict(CACHED_USAGE)) if return_usage else cached[0]
+        output, usage = invoke(self, messages, config, response_format, return_usage=True)
+        self.response_cache.put(key, type(self).__name__, model, output, usage)
+        return (output, usage) if return_usage else output
+    return cached_invoke
+
+
+def _cached_ainvoke(ainvoke):
+    """Async counterpart of `_cached_invoke`; the SQLite reads and writes run in a worker thread."""
+    @functools.wraps(ainvoke)
+    async def cached_ainvoke(self, messages, config=None, response_format=None, return_usage=False):
+        if self.response_cache is None or (config or {}).get('stream', False):
+            return await ainvoke(self, messages, config, response_format, return_usage)
+        key, model = self._response_key(messages, config, response_format)
+        cached = await asyncio.to_thread(self.response_cache.get, key, response_format)
+        if cached is not None:
+            return (cached[0], dict(CACHED_USAGE)) if return_usage else cached[0]
+        output, usage = await ainvoke(self, messages, config, response_format, return_usage=True)
+        await asyncio.to_thread(self.response_cache.put, key, type(self).__name__, model, output, usage)
+        return (output, usage) if return_usage else output
+    return cached_ainvoke
+
 
 class BaseClient(BaseModel):
     """Base class the abstracted clients inherit from.
     
     Provides common functionality for handling text inputs across different LLM providers.
     
+    The `invoke` and `ainvoke` of every provider class go through `response_cache`
+    when one is set (see response_cache.py); by default it is set from LLM_RESPONSE_CACHE.
+
     Args:
         client: The abstracted client instance for the specific provider
+        async_client: The asyncio counterpart of `client`, used by `ainvoke`
+        response_cache: Optional ResponseCache for non-streaming calls
     """
     client: Any = None
+    async_client: Any = None
     default_model: str = None
+    response_cache: Optional[ResponseCache] = None
     model_config = {"arbitrary_types_allowed": True}
 
     def __init__(self, default_model: str, **data):
         super().__init__(**data)
         self.initialize_client(default_model)
+        if self.response_cache is None:
+            self.response_cache = get_response_cache()
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs):
+        super().__pydantic_init_subclass__(**kwargs)
+        if "invoke" in cls.__dict__:
+            cls.invoke = _cached_invoke(cls.__dict__["invoke"])
+        if "ainvoke" in cls.__dict__:
+            cls.ainvoke = _cached_ainvoke(cls.__dict__["ainvoke"])
+
+    def _response_key(self, messages, config, response_format) -> tuple[str, str]:
+        """(response cache key, model) of a request."""
+        model = (config or {}).get('model') or self.default_model
+        return response_key(type(self).__name__, messages, config, response_format, self.default_model), model
 
     def initialize_client(self, default_model: str):
         """Initialize the client and default model. Must be implemented by subclasses."""
@@ -40,11 +100,12 @@ class BaseClient(BaseModel):
         logger.debug(f"Processing user input of type: {type(user_input)}")
         return [{"type": "text", "text": user_input}]
     
-    def get_text_stream(self, stream) -> Iterator[str]:
+    def get_text_stream(self, stream, usage: Optional[dict] = None) -> Iterator[str]:
         """Convert provider-specific stream to standardized text stream.
         
         Args:
             stream: The raw stream from the provider's API
+            usage: Optional dict that is filled with the token usage once the stream is exhausted
             
         Returns:
             Iterator[str]: Stream of text chunks
@@ -78,8 +139,24 @@ class BaseClient(BaseModel):
                 - dict: JSON object when response_format is a dict
                 - BaseModel: Pydantic model instance when response_format is a Pydantic model class
                 - Iterator[str]: Stream of text chunks when config['stream']=True
-                - dict: Usage metrics when return_usage=True
+                - dict: Usage metrics when return_usage=True. For streams the usage dict
+                  is returned alongside the stream and filled in once it is exhausted
         Raises:
             NotImplementedError: Must be implemented by provider-specific classes
         """            
+        raise NotImplementedError
+
+    async def ainvoke(self, 
+            messages: Union[str, List[Dict[str, str]]], 
+            config: Optional[Dict[str, Any]] = None,
+            response_format: Optional[Union[dict, Type[BaseModel]]] = None, 
+            return_usage: bool = False) -> Union[str, dict, BaseModel, AsyncIterator[str]]:
+        """Async version of `invoke` that uses the provider's asyncio client.
+        
+        Takes the same arguments and returns the same formats as `invoke`, except that
+        streaming responses are returned as an AsyncIterator[str].
+
+        Raises:
+            NotImplementedError: Must be implemented by provider-specific classes
+        """
         raise NotImplementedError
\ No newline at end of file
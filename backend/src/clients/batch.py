@@ -0,0 +1,281 @@
+"""Batch execution of many `invoke` requests for offline jobs (evals, ingestion).
+
+`run_batch` takes a list of invoke arguments (messages, config, response_format)
+and returns one BatchResult per request, in order. Requests go through the
+provider's batch endpoint: the OpenAI Batch API (a JSONL input file) or the
+Anthropic Message Batches API, polled until the batch ends. Batch requests are
+billed at a discount and do not count against the per-minute rate limits, so
+there is nothing to throttle by hand. The "local" backend runs the requests
+through `invoke` in a thread pool instead; it is the stand-in for tests and the
+fallback for providers without a batch endpoint.
+
+Requests the client's response cache already holds are not submitted, and
+batch results are added to it.
+"""
+import os
+import io
+import json
+import time
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from .base_client import BaseClient, CACHED_USAGE
+from .openai_client import OpenaiAbstractedClient
+from .anthropic_client import AnthropicAbstractedClient
+
+logger = logging.getLogger(__name__)
+
+BATCH_BACKENDS = ["auto", "openai", "anthropic", "local"]
+DEFAULT_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", 30))
+DEFAULT_LOCAL_WORKERS = int(os.getenv("LLM_BATCH_LOCAL_WORKERS", 4))
+OPENAI_BATCH_ENDPOINT = "/v1/chat/completions"
+OPENAI_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchResult:
+    """Outcome of one batch request: `output` and `usage` as `invoke` returns them, or an `error`."""
+
+    def __init__(self, custom_id: str, output=None, usage: dict | None = None, error: str | None = None):
+        self.custom_id = custom_id
+        self.output = output
+        self.usage = usage or {}
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        return f"BatchResult({self.custom_id!r}, output={self.output!r}, error={self.error!r})"
+
+
+class BatchBackend(ABC):
+    """Runs (custom_id, invoke arguments) requests and returns their results by custom_id."""
+    # Whether requests go through `client.invoke`, which applies the response cache itself
+    uses_invoke = False
+
+    @abstractmethod
+    def run(self, client: BaseClient, requests: list[tuple[str, dict]]) -> dict[str, BatchResult]:
+        pass
+
+
+class LocalBatchBackend(BatchBackend):
+    """Calls `invoke` for each request from a thread pool."""
+    uses_invoke = True
+
+    def __init__(self, max_workers: int = DEFAULT_LOCAL_WORKERS):
+        self.max_workers = max_workers
+
+    def _invoke(self, client: BaseClient, custom_id: str, request: dict) -> BatchResult:
+        try:
+            output, usage = client.invoke(**request, return_usage=True)
+            return BatchResult(custom_id, output, usage)
+        except Exception as e:
+            logger.warning(f"Batch request {custom_id} failed: {e}")
+            return BatchResult(custom_id, error=str(e))
+
+    def run(self, client: BaseClient, requests: list[tuple[str, dict]]) -> dict[str, BatchResult]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda item: self._invoke(client, *item), requests)
+            return {result.custom_id: result for result in results}
+
+
+class RemoteBatchBackend(BatchBackend):
+    """Submits the requests as one provider batch and polls it until it ends."""
+
+    def __init__(self, poll_interval: float = DEFAULT_POLL_INTERVAL, timeout: float | None = None):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    @abstractmethod
+    def submit(self, client: BaseClient, requests: list[tuple[str, dict]]) -> str:
+        """Create the batch; returns its id."""
+
+    @abstractmethod
+    def is_done(self, client: BaseClient, batch_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def results(self, client: BaseClient, batch_id: str, requests: dict[str, dict]) -> dict[str, BatchResult]:
+        pass
+
+    def run(self, client: BaseClient, requests: list[tuple[str, dict]]) -> dict[str, BatchResult]:
+        batch_id = self.submit(client, requests)
+        logger.info(f"Submitted batch {batch_id} with {len(requests)} requests")
+        start = time.monotonic()
+        while not self.is_done(client, batch_id):
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"Batch {batch_id} did not finish within {self.timeout} s")
+            time.sleep(self.poll_interval)
+        logger.info(f"Batch {batch_id} ended after {time.monotonic() - start:.0f} s")
+        results = self.results(client, batch_id, dict(requests))
+        for custom_id, _ in requests:
+            if custom_id not in results:
+                results[custom_id] = BatchResult(custom_id, error="no result in batch output")
+        return results
+
+
+class OpenaiBatchBackend(RemoteBatchBackend):
+    """OpenAI Batch API: a JSONL file of chat completion requests in, a JSONL file of responses out."""
+
+    def submit(self, client: OpenaiAbstractedClient, requests: list[tuple[str, dict]]) -> str:
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": OPENAI_BATCH_ENDPOINT,
+                "body": client.batch_body(**request)
+            })
+            for custom_id, request in requests
+        ]
+        input_file = client.client.files.create(
+            file=("batch_input.jsonl", io.BytesIO("\n".join(lines).encode("utf-8"))),
+            purpose="batch"
+        )
+        batch = client.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=OPENAI_BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def is_done(self, client: OpenaiAbstractedClient, batch_id: str) -> bool:
+        return client.client.batches.retrieve(batch_id).status in OPENAI_FINAL_STATUSES
+
+    def results(self, client: OpenaiAbstractedClient, batch_id: str, requests: dict[str, dict]) -> dict[str, BatchResult]:
+        batch = client.client.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            logger.warning(f"Batch {batch_id} ended with status {batch.status}")
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in client.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                custom_id = entry["custom_id"]
+                response = entry.get("response") or {}
+                if entry.get("error") or response.get("status_code") != 200:
+                    error = entry.get("error") or response.get("body", {}).get("error")
+                    results[custom_id] = BatchResult(custom_id, error=json.dumps(error))
+                    continue
+                try:
+                    output, usage = client.parse_batch_result(
+                        response["body"], requests[custom_id].get("response_format")
+                    )
+                    results[custom_id] = BatchResult(custom_id, output, usage)
+                except Exception as e:
+                    results[custom_id] = BatchResult(custom_id, error=f"could not parse result: {e}")
+        return results
+
+
+class AnthropicBatchBackend(RemoteBatchBackend):
+    """Anthropic Message Batches API."""
+
+    def submit(self, client: AnthropicAbstractedClient, requests: list[tuple[str, dict]]) -> str:
+        batch = client.client.messages.batches.create(requests=[
+            {"custom_id": custom_id, "params": client.batch_params(**request)}
+            for custom_id, request in requests
+        ])
+        return batch.id
+
+    def is_done(self, client: AnthropicAbstractedClient, batch_id: str) -> bool:
+        return client.client.messages.batches.retrieve(batch_id).processing_status == "ended"
+
+    def results(self, client: AnthropicAbstractedClient, batch_id: str, requests: dict[str, dict]) -> dict[str, BatchResult]:
+        results = {}
+        for entry in client.client.messages.batches.results(batch_id):
+            custom_id = entry.custom_id
+            if entry.result.type != "succeeded":
+                error = getattr(entry.result, "error", None)
+                results[custom_id] = BatchResult(custom_id, error=f"{entry.result.type}: {error}" if error else entry.result.type)
+                continue
+            try:
+                output, usage = client.parse_batch_result(
+                    entry.result.message, requests[custom_id].get("response_format")
+                )
+                results[custom_id] = BatchResult(custom_id, output, usage)
+            except Exception as e:
+                results[custom_id] = BatchResult(custom_id, error=f"could not parse result: {e}")
+        return results
+
+
+def get_batch_backend(client: BaseClient, backend: str = "auto", **kwargs) -> BatchBackend:
+    """The batch backend for a client; "auto" uses the provider's batch endpoint when it has one."""
+    if backend not in BATCH_BACKENDS:
+        raise ValueError(f"Invalid batch backend: {backend}. Must be one of: {', '.join(BATCH_BACKENDS)}")
+    if backend == "auto":
+        if isinstance(client, OpenaiAbstractedClient):
+            backend = "openai"
+        elif isinstance(client, AnthropicAbstractedClient):
+            backend = "anthropic"
+        else:
+            backend = "local"
+    if backend == "openai":
+        if not isinstance(client, OpenaiAbstractedClient):
+            raise ValueError(f"The openai batch backend needs an OpenaiAbstractedClient, not {type(client).__name__}")
+        return OpenaiBatchBackend(**kwargs)
+    if backend == "anthropic":
+        if not isinstance(client, AnthropicAbstractedClient):
+            raise ValueError(f"The anthropic batch backend needs an AnthropicAbstractedClient, not {type(client).__name__}")
+        return AnthropicBatchBackend(**kwargs)
+    return LocalBatchBackend(**kwargs)
+
+
+def run_batch(
+        client: BaseClient,
+        requests: list[dict],
+        backend: str | BatchBackend = "auto",
+        **backend_kwargs
+    ) -> list[BatchResult]:
+    """
+    Run many `invoke` requests as one batch.
+
+    Args:
+        client (BaseClient): The client whose provider runs the requests
+        requests (list[dict]): `invoke` keyword arguments per request: messages, and optionally
+            config and response_format. Streaming is not supported.
+        backend (str | BatchBackend): "auto" (the provider's batch endpoint, else "local"),
+            "openai", "anthropic", "local", or a BatchBackend instance
+        **backend_kwargs: poll_interval and timeout for remote backends, max_workers for "local"
+
+    Returns:
+        list[BatchResult]: One result per request, in request order
+    """
+    if isinstance(backend, str):
+        backend = get_batch_backend(client, backend, **backend_kwargs)
+    for request in requests:
+        if (request.get("config") or {}).get("stream", False):
+            raise ValueError("Streaming requests cannot be batched")
+
+    results = [None] * len(requests)
+    pending = []
+    indexes = {}
+    keys = {}
+    cache = None if backend.uses_invoke else client.response_cache
+    for i, request in enumerate(requests):
+        custom_id = f"request-{i}"
+        if cache is not None:
+            keys[custom_id] = client._response_key(
+                request["messages"], request.get("config"), request.get("response_format")
+            )
+            cached = cache.get(keys[custom_id][0], request.get("response_format"))
+            if cached is not None:
+                results[i] = BatchResult(custom_id, cached[0], dict(CACHED_USAGE))
+                continue
+        indexes[custom_id] = i
+        pending.append((custom_id, request))
+
+    if pending:
+        by_id = backend.run(client, pending)
+        for custom_id, request in pending:
+            result = by_id[custom_id]
+            results[indexes[custom_id]] = result
+            if cache is not None and result.ok:
+                key, model = keys[custom_id]
+                cache.put(key, type(client).__name__, model, result.output, result.usage)
+
+    failed = sum(not result.ok for result in results)
+    logger.info(f"Batch of {len(requests)} requests: {len(requests) - len(pending)} cached, {failed} failed")
+    return results
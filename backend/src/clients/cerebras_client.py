@@ -1,11 +1,12 @@
 import os
-from typing import Dict, Any, Optional, Union, Type, List, Iterator
+from typing import Dict, Any, Optional, Union, Type, List, Iterator, AsyncIterator
 import json
 from pydantic import BaseModel
 import logging
 from dotenv import load_dotenv
 from .base_client import BaseClient
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+import asyncio
 import re
 
 load_dotenv()
@@ -31,21 +32,36 @@ class CerebrasAbstractedClient(BaseClient):
     
     Attributes:
         client: The underlying Cerebras client instance
+        async_client: The underlying AsyncCerebras client instance
         default_model: The default model to use for completions
     """   
     def initialize_client(self, default_model: str|None):
         """Initialize the Cerebras client with API credentials.
         
         Requires CEREBRAS_API_KEY environment variable to be set.
-        Sets up the client and default model configuration.
+        Sets up the sync and async clients and default model configuration.
         """
         self.client = Cerebras(api_key=os.getenv("CEREBRAS_API_KEY"))
+        self.async_client = AsyncCerebras(api_key=os.getenv("CEREBRAS_API_KEY"))
         self.default_model = default_model or DEFAULT_CEREBRAS_MODEL
 
-    def get_text_stream(self, stream) -> Iterator[str]:
+    def get_text_stream(self, stream, usage: dict|None = None) -> Iterator[str]:
         for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
                 yield chunk.choices[0].delta.content
+            self._update_stream_usage(chunk, usage)
+
+    async def aget_text_stream(self, stream, usage: dict|None = None) -> AsyncIterator[str]:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
+            self._update_stream_usage(chunk, usage)
+
+    def _update_stream_usage(self, chunk, usage: dict|None):
+        # Cerebras reports usage on the last chunk of the stream
+        if usage is not None and getattr(chunk, "usage", None):
+            usage["input_tokens"] = chunk.usage.prompt_tokens
+            usage["output_tokens"] = chunk.usage.completion_tokens
 
     def invoke(self, 
               messages: Union[str, List[Dict[str, str]]],
@@ -64,6 +80,32 @@ class CerebrasAbstractedClient(BaseClient):
         Returns:
             Union[str, dict, BaseModel, Iterator[str]]: Model response in requested format
         """
+        messages, config = self._prepare_request(messages, config, response_format)
+
+        if config.get('stream', False):
+            usage = {} if return_usage else None
+            text_stream = self.get_streaming_response(messages, config, usage)
+            return (text_stream, usage) if return_usage else text_stream
+        else:
+            return self.get_non_streaming_response(messages, config, response_format, return_usage)
+
+    async def ainvoke(self, 
+              messages: Union[str, List[Dict[str, str]]],
+              config: Optional[Dict[str, Any]] = None, 
+              response_format: Optional[Union[dict, Type[BaseModel]]] = None,
+              return_usage: bool = False) -> Union[str, dict, BaseModel, AsyncIterator[str]]:
+        """Async version of `invoke` using the AsyncCerebras client."""
+        messages, config = self._prepare_request(messages, config, response_format)
+
+        if config.get('stream', False):
+            usage = {} if return_usage else None
+            text_stream = await self.aget_streaming_response(messages, config, usage)
+            return (text_stream, usage) if return_usage else text_stream
+        else:
+            return await self.aget_non_streaming_response(messages, config, response_format, return_usage)
+
+    def _prepare_request(self, messages, config, response_format):
+        """Normalize the messages and config shared by the sync and async code paths."""
         config = config or {}
         config['model'] = config.get('model', self.default_model)
         logger.debug(f"Generating Cerebras response with model: {config.get('model')}")
@@ -94,26 +136,41 @@ class CerebrasAbstractedClient(BaseClient):
                         msg["content"] = f"{msg['content']}\n\n{format_instruction}"
                         break
 
-        if config.get('stream', False):
-            return self.get_streaming_response(messages, config)
-        else:
-            return self.get_non_streaming_response(messages, config, response_format, return_usage)
+        return messages, config
 
-    def get_streaming_response(self, messages, config):
+    def get_streaming_response(self, messages, config, usage=None):
         """Handle streaming response."""
         stream = self.client.chat.completions.create(
             messages=messages,
             stream=True,
             **{k:v for k,v in config.items() if k != 'stream'}
         )
-        return self.get_text_stream(stream)
+        return self.get_text_stream(stream, usage)
+    
+    async def aget_streaming_response(self, messages, config, usage=None):
+        stream = await self.async_client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            **{k:v for k,v in config.items() if k != 'stream'}
+        )
+        return self.aget_text_stream(stream, usage)
     
     def get_non_streaming_response(self, messages, config, response_format=None, return_usage=False):
         response = self.client.chat.completions.create(
             messages=messages,
             **config
         )
-        
+        return self._parse_response(response, response_format, return_usage)
+
+    async def aget_non_streaming_response(self, messages, config, response_format=None, return_usage=False):
+        response = await self.async_client.chat.completions.create(
+            messages=messages,
+            **config
+        )
+        # Parsing may fall back to a (sync) JSON-correction call, so keep it off the event loop
+        return await asyncio.to_thread(self._parse_response, response, response_format, return_usage)
+
+    def _parse_response(self, response, response_format=None, return_usage=False):
         usage = {
             "input_tokens": response.usage.prompt_tokens,
             "output_tokens": response.usage.completion_tokens,
@@ -1,13 +1,14 @@
 import os
+import copy
 from typing import Dict, Any, Optional, Union, Type
 import json
 from pydantic import BaseModel, Field
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from .base_client import BaseClient
 import logging
 from dotenv import load_dotenv
 from typing import List
-from typing import Generator, Iterator
+from typing import Generator, Iterator, AsyncIterator
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -16,6 +17,37 @@ logger.setLevel(logging.INFO)
 DEFAULT_MAX_TOKENS = 1000
 DEFAULT_OPENAI_MODEL = "gpt-4o-mini"  # Add default model constant
 
+def strict_json_schema(schema):
+    """A pydantic JSON schema in the form structured outputs require: every object closed, every property required."""
+    if isinstance(schema, list):
+        return [strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    schema = {
+        # "properties" and "$defs" map names to schemas; a property named "default" is kept
+        key: ({name: strict_json_schema(value) for name, value in value.items()}
+              if key in ("properties", "$defs") else strict_json_schema(value))
+        for key, value in schema.items()
+        if not (key == "default" and value is None)
+    }
+    if schema.get("type") == "object" and "properties" in schema:
+        schema["additionalProperties"] = False
+        schema["required"] = list(schema["properties"])
+    return schema
+
+
+def json_schema_response_format(response_format: Type[BaseModel]) -> dict:
+    """The `json_schema` response_format of a pydantic model, as `parse` sends it."""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": response_format.__name__,
+            "schema": strict_json_schema(response_format.model_json_schema()),
+            "strict": True,
+        },
+    }
+
+
 class OpenaiAbstractedClient(BaseClient):
     """OpenAI-specific implementation of the LLM provider.
     
@@ -31,22 +63,37 @@ class OpenaiAbstractedClient(BaseClient):
     
     Attributes:
         client: The underlying OpenAI client instance
+        async_client: The underlying AsyncOpenAI client instance
         default_model: The default model to use for completions
     """   
     def initialize_client(self, default_model: str|None):
-        """Initialize the OpenAI client with API credentials.
+        """Initialize the OpenAI clients with API credentials.
         
         Requires OPENAI_API_KEY environment variable to be set.
-        Sets up the client and default model configuration.
+        Sets up the sync and async clients and default model configuration.
         """
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         self.default_model = default_model or DEFAULT_OPENAI_MODEL
 
-    def get_text_stream(self, stream) -> Iterator[str]:
-        """Convert OpenAI stream to standardized text stream."""
+    def get_text_stream(self, stream, usage: dict|None = None) -> Iterator[str]:
+        """Convert OpenAI stream to standardized text stream, filling `usage` from the final chunk."""
         for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
                 yield chunk.choices[0].delta.content
+            self._update_stream_usage(chunk, usage)
+
+    async def aget_text_stream(self, stream, usage: dict|None = None) -> AsyncIterator[str]:
+        """Convert OpenAI async stream to standardized text stream, filling `usage` from the final chunk."""
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
+            self._update_stream_usage(chunk, usage)
+
+    def _update_stream_usage(self, chunk, usage: dict|None):
+        if usage is not None and getattr(chunk, "usage", None):
+            usage["input_tokens"] = chunk.usage.prompt_tokens
+            usage["output_tokens"] = chunk.usage.completion_tokens
 
     def invoke(self, 
               messages: Union[str, List[Dict[str, str]]],
@@ -73,7 +120,35 @@ class OpenaiAbstractedClient(BaseClient):
                 - dict: JSON object when response_format is a dict
                 - BaseModel: Pydantic model instance when response_format is a Pydantic model class
                 - Iterator[str]: Stream of text chunks when config['stream']=True
+                  (with return_usage, a (stream, usage) tuple whose usage dict is
+                  filled in once the stream is exhausted)
         """
+        messages, config = self._prepare_request(messages, config, response_format)
+
+        if config.get('stream', False):
+            usage = {} if return_usage else None
+            text_stream = self.get_streaming_response(messages, config, usage)
+            return (text_stream, usage) if return_usage else text_stream
+        else:
+            return self.get_non_streaming_response(messages, config, response_format, return_usage)
+
+    async def ainvoke(self, 
+              messages: Union[str, List[Dict[str, str]]],
+              config: Optional[Dict[str, Any]] = None, 
+              response_format: Optional[Union[dict, Type[BaseModel]]] = None,
+              return_usage: bool = False) -> Union[str, dict, BaseModel, AsyncIterator[str]]:
+        """Async version of `invoke` using the AsyncOpenAI client."""
+        messages, config = self._prepare_request(messages, config, response_format)
+
+        if config.get('stream', False):
+            usage = {} if return_usage else None
+            text_stream = await self.aget_streaming_response(messages, config, usage)
+            return (text_stream, usage) if return_usage else text_stream
+        else:
+            return await self.aget_non_streaming_response(messages, config, response_format, return_usage)
+
+    def _prepare_request(self, messages, config, response_format):
+        """Normalize the messages and config shared by the sync and async code paths."""
         config = config or {}
         config['model'] = config.get('model', self.default_model)
         logger.debug(f"Generating OpenAI response with model: {config.get('model')}")
@@ -86,30 +161,10 @@ class OpenaiAbstractedClient(BaseClient):
         if config.get('stream', False) and response_format is not None:
             raise ValueError("Streaming is only supported for plain text responses (response_format=None)")
 
-
-        if config.get('stream', False):
-            return self.get_streaming_response(messages, config, response_format, return_usage)
-        else:
-            return self.get_non_streaming_response(messages, config, response_format, return_usage)
-
-
-    def get_streaming_response(self, messages, config):
-        # Handle streaming response
-        stream = self.client.chat.completions.create(
-            messages=messages,
-            stream=True,
-            **{k:v for k,v in config.items() if k != 'stream'}
-        )
-        return self.get_text_stream(stream)
-    
-    def get_non_streaming_response(self, messages, config, response_format=None, return_usage=False):
-        
         if isinstance(response_format, type) and issubclass(response_format, BaseModel):
             # For Pydantic models
             config['response_format'] = response_format
-            response = self.client.beta.chat.completions.parse(messages=messages, **config)
-            output =  response.choices[0].message.parsed
-        
+
         elif isinstance(response_format, dict):
             # For openai JSON format must include "JSON" in prompt
             config['response_format'] = {"type": "json_object"}
@@ -125,15 +180,76 @@ class OpenaiAbstractedClient(BaseClient):
                         msg["content"] = f"{msg['content']}\n\n{format_instruction}"
                         break
 
-            response = self.client.chat.completions.create(messages=messages, **config)
-            output =  json.loads(response.choices[0].message.content)
-        
+        return messages, config
+
+    def batch_body(self, messages, config=None, response_format=None) -> dict:
+        """Chat completions request body of an `invoke` call, for a line of a Batch API input file."""
+        messages, config = self._prepare_request(copy.deepcopy(messages), dict(config or {}), response_format)
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            # `parse` converts the model itself; a batch line needs the JSON schema
+            config['response_format'] = json_schema_response_format(response_format)
+        return {"messages": messages, **{k:v for k,v in config.items() if k != 'stream'}}
+
+    def parse_batch_result(self, body: dict, response_format=None) -> tuple:
+        """(output, usage) of a chat completion body from a Batch API output file."""
+        content = body["choices"][0]["message"]["content"]
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            output = response_format.model_validate_json(content)
+        elif isinstance(response_format, dict):
+            output = json.loads(content)
+        else:
+            output = content
+        usage = {
+            "input_tokens": body["usage"]["prompt_tokens"],
+            "output_tokens": body["usage"]["completion_tokens"],
+        }
+        return output, usage
+
+    def _get_completions(self, client, response_format):
+        """Pick the completions endpoint (structured `parse` or plain `create`) for a client."""
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            return client.beta.chat.completions.parse
+        return client.chat.completions.create
+
+    def _stream_kwargs(self, config, usage):
+        stream_kwargs = {k:v for k,v in config.items() if k != 'stream'}
+        if usage is not None:
+            # Ask for a final chunk carrying the token usage
+            stream_kwargs['stream_options'] = {"include_usage": True}
+        return stream_kwargs
+
+    def get_streaming_response(self, messages, config, usage=None):
+        # Handle streaming response
+        stream = self.client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            **self._stream_kwargs(config, usage)
+        )
+        return self.get_text_stream(stream, usage)
+
+    async def aget_streaming_response(self, messages, config, usage=None):
+        stream = await self.async_client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            **self._stream_kwargs(config, usage)
+        )
+        return self.aget_text_stream(stream, usage)
+    
+    def get_non_streaming_response(self, messages, config, response_format=None, return_usage=False):
+        response = self._get_completions(self.client, response_format)(messages=messages, **config)
+        return self._parse_response(response, response_format, return_usage)
+
+    async def aget_non_streaming_response(self, messages, config, response_format=None, return_usage=False):
+        response = await self._get_completions(self.async_client, response_format)(messages=messages, **config)
+        return self._parse_response(response, response_format, return_usage)
+
+    def _parse_response(self, response, response_format=None, return_usage=False):
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            output = response.choices[0].message.parsed
+        elif isinstance(response_format, dict):
+            output = json.loads(response.choices[0].message.content)
         else:
             # For regular text responses
-            response = self.client.chat.completions.create(
-                messages=messages,
-                **config
-            )
             output = response.choices[0].message.content
 
         if return_usage:
@@ -144,7 +260,6 @@ class OpenaiAbstractedClient(BaseClient):
             return output, usage
         else:
             return output
-            
 
     
 
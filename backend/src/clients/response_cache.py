@@ -0,0 +1,169 @@
+"""Opt-in cache of LLM responses for repeated identical calls (evals, dev reruns).
+
+A non-streaming `invoke`/`ainvoke` call is keyed on a canonical hash of the
+provider, messages, model, the rest of the config (temperature, max_tokens, ...)
+and the JSON schema of the response format. Responses are stored in a local
+SQLite file with the usage of the call that produced them; a hit returns the
+stored response with zero token usage, since no tokens were paid for.
+
+Enable it for every client in a process with LLM_RESPONSE_CACHE=sqlite (file at
+LLM_RESPONSE_CACHE_PATH), or per client by assigning `client.response_cache`.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE = os.getenv("LLM_RESPONSE_CACHE", "none")  # none | sqlite
+DEFAULT_CACHE_PATH = os.getenv("LLM_RESPONSE_CACHE_PATH", "llm_response_cache.sqlite3")
+
+
+def response_schema(response_format) -> Any:
+    """JSON-serializable form of a response format: the schema of a Pydantic model, a dict as is, or None."""
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        return {"model": response_format.__name__, "schema": response_format.model_json_schema()}
+    return response_format
+
+
+def response_key(provider: str, messages, config: dict | None, response_format, default_model: str) -> str:
+    """Canonical hash of a request; the model falls back to the client's default like the clients do."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    config = dict(config or {})
+    request = {
+        "provider": provider,
+        "messages": messages,
+        "model": config.pop("model", None) or default_model,
+        "config": config,
+        "response_schema": response_schema(response_format),
+    }
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def encode_output(output) -> str | None:
+    """Stored form of a response; None for outputs that are not cached (e.g. a refused structured output)."""
+    if isinstance(output, BaseModel):
+        return json.dumps({"type": "model", "value": output.model_dump(mode="json")})
+    if isinstance(output, (str, dict, list)):
+        return json.dumps({"type": "json" if not isinstance(output, str) else "text", "value": output})
+    return None
+
+
+def decode_output(data: str, response_format):
+    stored = json.loads(data)
+    if stored["type"] == "model":
+        return response_format.model_validate(stored["value"])
+    return stored["value"]
+
+
+class ResponseCache:
+    """LLM responses stored in a local SQLite file, with hit counters."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_response_cache (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT,
+                output TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )""")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.input_tokens_saved = 0
+        self.output_tokens_saved = 0
+
+    def get(self, key: str, response_format) -> tuple[Any, dict] | None:
+        """(response, usage of the original call) for a key, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output, usage FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+        try:
+            output = decode_output(row[0], response_format)
+        except Exception as e:
+            # The response format changed shape without changing its schema hash, e.g. a validator
+            logger.warning(f"Discarding cached LLM response that no longer decodes: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+        usage = json.loads(row[1])
+        with self._lock:
+            self.hits += 1
+            self.input_tokens_saved += int(usage.get("input_tokens", 0))
+            self.output_tokens_saved += int(usage.get("output_tokens", 0))
+        return output, usage
+
+    def put(self, key: str, provider: str, model: str | None, output, usage: dict | None) -> None:
+        data = encode_output(output)
+        if data is None:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, provider, model, output, usage, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, data, json.dumps(usage or {}), time.time())
+            )
+            self._conn.commit()
+            self.writes += 1
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_response_cache")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "input_tokens_saved": self.input_tokens_saved,
+                "output_tokens_saved": self.output_tokens_saved
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Process-wide response cache configured from LLM_RESPONSE_CACHE_* environment variables; None when disabled."""
+    global _default_cache
+    if DEFAULT_CACHE == "none":
+        return None
+    if DEFAULT_CACHE != "sqlite":
+        raise ValueError(f"Invalid LLM_RESPONSE_CACHE: {DEFAULT_CACHE}. Must be one of: 'none', 'sqlite'")
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(DEFAULT_CACHE_PATH)
+        return _default_cache
@@ -1,25 +1,44 @@
 from dotenv import load_dotenv
-import os
 import psycopg2
 from pydantic import BaseModel
 from uuid import uuid4
+from .db_pool import get_db_pool, get_db_settings
+from .audit_log import get_audit_log, merge_pending
+from .model_prices import get_model_prices
+from .history_cache import get_history_cache
 
 load_dotenv()
 class DBClient(BaseModel):
     db_settings: dict = None  # Define with a default value
 
     def model_post_init(self, __context) -> None:
-        self.db_settings = {
-            "dbname": os.getenv('POSTGRES_DB'),
-            "user": os.getenv('POSTGRES_USER'),
-            "password": os.getenv('POSTGRES_PASSWORD'),
-            "host": os.getenv('POSTGRES_HOST'),
-            "port": os.getenv('POSTGRES_PORT')
-        }
+        self.db_settings = get_db_settings()
+
+    @property
+    def pool(self):
+        return get_db_pool(self.db_settings)
+
+    @property
+    def audit_log(self):
+        """The background writer for messages and llm_calls, or None when they are written inline."""
+        return get_audit_log(self.db_settings)
+
+    @property
+    def prices(self):
+        """In-process copy of the models price table."""
+        return get_model_prices(self.db_settings)
+
+    @property
+    def history_cache(self):
+        """Recent messages of active conversations, written through by add_message; None when disabled."""
+        return get_history_cache()
+
+    def pool_stats(self) -> dict:
+        return self.pool.stats()
 
     def query_db_sql(self, sql_query, args):
         try:
-            with psycopg2.connect(**self.db_settings) as conn:
+            with self.pool.connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(sql_query, args)
                     conn.commit()
@@ -35,21 +54,36 @@ class DBClient(BaseModel):
             raise
 
     def get_conversation_history(self, conversation_id, message_limit):
+        cache = self.history_cache
+        if cache is not None:
+            history = cache.get(conversation_id, message_limit)
+            if history is not None:
+                return history
+            token = cache.begin_load()
         sql_query = """
         SELECT * FROM get_conversation_history(%s, %s)
         """
         args = (conversation_id, message_limit)
 
         response = self.query_db_sql(sql_query, args)
+        audit_log = self.audit_log
+        if audit_log is not None:
+            pending = audit_log.pending_messages(conversation_id)
+            if pending:
+                response = merge_pending(response, pending, message_limit)
         history = []
         for row in response:
             history.append({
                 "role": row['conversation_role'],
                 "content": row['content']
             })
+        if cache is not None:
+            cache.load(conversation_id, response, message_limit, token)
         return history[::-1]  # Reverse to get chronological order
     
     def get_conversation(self, conversation_id):
+        if self.audit_log is not None:
+            self.audit_log.flush()
         sql_query = """SELECT * FROM get_conversation(%s)"""
         args = (conversation_id,)
         return self.query_db_sql(sql_query, args)
@@ -61,6 +95,11 @@ class DBClient(BaseModel):
             content,
             created_at=None
         ):
+        audit_log = self.audit_log
+        if audit_log is not None:
+            message_id = audit_log.add_message(conversation_id, conversation_role, content, created_at)
+            self._cache_message(conversation_id, message_id, conversation_role, content, created_at)
+            return message_id
         sql_query = """
         INSERT INTO messages 
         (conversation_id, conversation_role, content, created_at) 
@@ -69,7 +108,19 @@ class DBClient(BaseModel):
         """
         args = (conversation_id, conversation_role, content.strip(), created_at)
         response = self.query_db_sql(sql_query, args)
-        return response[0]['id'] if response else None
+        message_id = response[0]['id'] if response else None
+        self._cache_message(conversation_id, message_id, conversation_role, content, created_at)
+        return message_id
+
+    def _cache_message(self, conversation_id, message_id, conversation_role, content, created_at):
+        cache = self.history_cache
+        if cache is None:
+            return
+        if created_at is None and message_id is not None:
+            cache.append(conversation_id, message_id, conversation_role, content.strip())
+        else:
+            # A message with its own timestamp may not be the newest one
+            cache.invalidate(conversation_id)
 
     def add_llm_call(
             self,
@@ -78,7 +129,8 @@ class DBClient(BaseModel):
             prompt,
             response,
             model,
-            usage
+            usage,
+            ttft_ms=None
         ):
         """
         Add an LLM call to the database.
@@ -90,11 +142,17 @@ class DBClient(BaseModel):
             response: The response received from the LLM
             model: The model name used
             usage: Dictionary containing 'input_tokens' and 'output_tokens'
+            ttft_ms: Optional time to first token (ms from the start of the request) for streamed calls
+
+        Returns the new row's id and cost, or None when the call is queued on the audit log.
         """
+        audit_log = self.audit_log
+        if audit_log is not None:
+            return audit_log.add_llm_call(message_id, message_type, prompt, response, model, usage, ttft_ms)
         sql_query = """
         INSERT INTO llm_calls 
-        (message_id, message_type, prompt, response, model, input_tokens, output_tokens) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        (message_id, message_type, prompt, response, model, input_tokens, output_tokens, ttft_ms, cost) 
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id, cost
         """
         # Ensure we're getting integer values for tokens, defaulting to 0 if not found
@@ -108,7 +166,9 @@ class DBClient(BaseModel):
             response.strip(), 
             model, 
             input_tokens,
-            output_tokens
+            output_tokens,
+            ttft_ms,
+            self.calculate_token_cost(model, input_tokens, output_tokens)
         )
         
         response = self.query_db_sql(sql_query, args)
@@ -161,19 +221,22 @@ class DBClient(BaseModel):
         args = (conversation_id, user_id)
         response = self.query_db_sql(sql_query, args)
         print(f"create_conversation response: {response}")
+        if response and self.history_cache is not None:
+            self.history_cache.start(response[0]['id'])
         return response[0]['id'] if response else None
     
     def calculate_token_cost(self, model_name, input_tokens, output_tokens):
-        sql_query = "SELECT calculate_token_cost(%s, %s, %s)"
-        args = (model_name, int(input_tokens), int(output_tokens))
-        response = self.query_db_sql(sql_query, args)
-        return response[0]['calculate_token_cost'] if response else None
+        """Cost of a call from the in-process price table; None for a model without prices."""
+        return self.prices.cost(model_name, input_tokens, output_tokens)
 
     def calculate_conversation_cost(self, conversation_id):
-        conversation = self.get_conversation(conversation_id)
-        total_input_tokens = sum(message['input_tokens'] for message in conversation)
-        total_output_tokens = sum(message['output_tokens'] for message in conversation)
-        return self.calculate_token_cost(conversation[0]['model'], total_input_tokens, total_output_tokens)
+        """Total cost of a conversation's LLM calls, read from the conversation_costs aggregate."""
+        if self.audit_log is not None:
+            self.audit_log.flush()
+        sql_query = "SELECT cost FROM conversation_costs WHERE conversation_id = %s"
+        args = (conversation_id,)
+        response = self.query_db_sql(sql_query, args)
+        return response[0]['cost'] if response else 0
 
     def verify_user_email(self, email: str) -> bool:
         sql_query = """
@@ -0,0 +1,289 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import time
+import asyncio
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Callable
+import psycopg2
+from pgvector.psycopg2 import register_vector
+from psycopg_pool import AsyncConnectionPool
+from pgvector.psycopg import register_vector_async
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10))
+DEFAULT_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", 30))
+# Only ping connections that have been idle for longer than this (seconds)
+DEFAULT_CHECK_INTERVAL = float(os.getenv("POSTGRES_POOL_CHECK_INTERVAL", 5))
+
+
+def get_db_settings() -> dict:
+    """Connection settings read from the environment."""
+    return {
+        "dbname": os.getenv('POSTGRES_DB'),
+        "user": os.getenv('POSTGRES_USER'),
+        "password": os.getenv('POSTGRES_PASSWORD'),
+        "host": os.getenv('POSTGRES_HOST'),
+        "port": os.getenv('POSTGRES_PORT')
+    }
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class DBPool:
+    """A bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to `max_size`. Callers that find the pool
+    exhausted block until a connection is returned or `timeout` expires.
+    The pgvector type is registered once per physical connection when it is
+    opened, and connections that have sat idle are health-checked on checkout.
+
+    Args:
+        db_settings: Keyword arguments passed to psycopg2.connect
+        max_size: Maximum number of open connections
+        timeout: Seconds to wait for a free connection before raising PoolTimeout
+        check_interval: Idle time (seconds) after which a connection is pinged on checkout
+        connect: Optional connection factory (defaults to psycopg2.connect(**db_settings))
+        configure: Optional callback run once on every new connection (defaults to register_vector)
+    """
+
+    def __init__(
+            self,
+            db_settings: dict | None = None,
+            max_size: int = DEFAULT_POOL_MAX_SIZE,
+            timeout: float = DEFAULT_POOL_TIMEOUT,
+            check_interval: float = DEFAULT_CHECK_INTERVAL,
+            connect: Callable | None = None,
+            configure: Callable | None = None
+        ):
+        if max_size < 1:
+            raise ValueError(f"max_size must be at least 1, got {max_size}")
+        self.db_settings = db_settings or get_db_settings()
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._connect = connect or (lambda: psycopg2.connect(**self.db_settings))
+        self._configure = configure or register_vector
+
+        # Reentrant, so _discard can count under it when called from putconn and close
+        self._cond = threading.Condition(threading.RLock())
+        self._idle = []  # stack of (connection, returned_at) so hot connections are reused first
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_count = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._opened = 0
+        self._discarded = 0
+
+    def _open(self):
+        conn = self._connect()
+        try:
+            self._configure(conn)
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        with self._cond:
+            self._opened += 1
+        return conn
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        with self._cond:
+            self._discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Check out a connection, blocking until one is available."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"no database connection available after {self.timeout}s")
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            wait_time = time.monotonic() - start
+            self._checkouts += 1
+            if waited:
+                self._wait_count += 1
+            self._wait_time_total += wait_time
+            self._wait_time_max = max(self._wait_time_max, wait_time)
+
+        try:
+            if conn is not None and time.monotonic() - returned_at > self.check_interval:
+                if not self._is_healthy(conn):
+                    logger.warning("Discarding broken pooled connection")
+                    self._discard(conn)
+                    conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool, closing it if it is broken or discarded."""
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks out a connection and commits or rolls back on exit."""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                discard = True
+            else:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def close(self):
+        """Close all idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Pool size and wait-time statistics."""
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "connections_opened": self._opened,
+                "connections_discarded": self._discarded,
+                "wait_count": self._wait_count,
+                "wait_time_total": self._wait_time_total,
+                "wait_time_avg": self._wait_time_total / self._checkouts if self._checkouts else 0.0,
+                "wait_time_max": self._wait_time_max,
+                "timeouts": self._timeouts
+            }
+
+
+_pools: dict[tuple, DBPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_db_pool(db_settings: dict | None = None) -> DBPool:
+    """Return the process-wide pool for the given connection settings, creating it on first use."""
+    db_settings = db_settings or get_db_settings()
+    key = tuple(sorted((k, str(v)) for k, v in db_settings.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = DBPool(db_settings)
+        return _pools[key]
+
+
+def close_db_pools():
+    """Close every shared pool (e.g. on application shutdown)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+_async_pools: dict[tuple, AsyncConnectionPool] = {}
+_async_pools_lock = asyncio.Lock()
+
+
+async def get_async_db_pool(db_settings: dict | None = None) -> AsyncConnectionPool:
+    """Return the process-wide psycopg 3 async pool for the given settings, opening it on first use.
+
+    The async pool registers pgvector once per connection (`configure`) and
+    validates connections on checkout (`check`), mirroring DBPool. A pool is
+    only shared once it is open; coroutines that ask for it meanwhile wait.
+    """
+    db_settings = db_settings or get_db_settings()
+    key = tuple(sorted((k, str(v)) for k, v in db_settings.items()))
+    pool = _async_pools.get(key)
+    if pool is not None:
+        return pool
+    async with _async_pools_lock:
+        pool = _async_pools.get(key)
+        if pool is None:
+            pool = AsyncConnectionPool(
+                kwargs={k: v for k, v in db_settings.items() if v is not None},
+                min_size=1,
+                max_size=DEFAULT_POOL_MAX_SIZE,
+                timeout=DEFAULT_POOL_TIMEOUT,
+                configure=register_vector_async,
+                check=AsyncConnectionPool.check_connection,
+                open=False
+            )
+            await pool.open()
+            _async_pools[key] = pool
+    return pool
+
+
+async def close_async_db_pools():
+    """Close every shared async pool (e.g. on application shutdown)."""
+    pools = list(_async_pools.values())
+    _async_pools.clear()
+    for pool in pools:
+        await pool.close()
@@ -0,0 +1,143 @@
+"""Compact on-disk format for chunk embeddings.
+
+An artifact is a float32 `<prefix>.npy` matrix with one row per chunk plus a
+`<prefix>.meta.json` sidecar holding the rest of each chunk (text, context,
+token counts) in the same order. The matrix is opened with `np.load(mmap_mode="r")`,
+so loading maps the file instead of parsing 1536 numbers per chunk from text.
+
+The previous format, a JSON list of dicts each with an "embedding" list, is
+still written on request (`save_json`, `export_json`) and read as a fallback
+by `load_items` when no artifact exists.
+
+    python -m src.embedding_artifacts to-json texts/chunked_embedded/glossary_embeddings
+    python -m src.embedding_artifacts from-json texts/chunked_embedded/glossary_embeddings.json
+"""
+import os
+import json
+import argparse
+import numpy as np
+
+FORMAT_VERSION = 1
+OUTPUT_FORMATS = ["npy", "json", "both"]
+
+
+def artifact_paths(prefix: str) -> tuple[str, str]:
+    """(matrix path, sidecar path) of the artifact at `prefix`."""
+    return f"{prefix}.npy", f"{prefix}.meta.json"
+
+
+def artifact_exists(prefix: str) -> bool:
+    return all(os.path.exists(path) for path in artifact_paths(prefix))
+
+
+def save_artifact(prefix: str, items: list[dict], metadata: dict | None = None) -> None:
+    """
+    Write items as a float32 matrix plus a metadata sidecar.
+
+    Args:
+        prefix (str): Path without extension, e.g. "texts/chunked_embedded/glossary_embeddings"
+        items (list[dict]): Chunk dicts, each with an "embedding" list
+        metadata (dict | None): Extra top-level sidecar fields, e.g. the embedding model
+    """
+    matrix_path, meta_path = artifact_paths(prefix)
+    directory = os.path.dirname(matrix_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if items:
+        matrix = np.asarray([item["embedding"] for item in items], dtype=np.float32)
+    else:
+        matrix = np.empty((0, 0), dtype=np.float32)
+    sidecar = {
+        "format_version": FORMAT_VERSION,
+        "dtype": "float32",
+        "shape": list(matrix.shape),
+        **(metadata or {}),
+        "items": [{key: value for key, value in item.items() if key != "embedding"} for item in items],
+    }
+    # Write both files under temporary names first so readers never see half an artifact
+    np.save(f"{matrix_path}.tmp.npy", matrix)
+    with open(f"{meta_path}.tmp", "w") as f:
+        json.dump(sidecar, f, indent=2)
+    os.replace(f"{matrix_path}.tmp.npy", matrix_path)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+def load_artifact(prefix: str, mmap: bool = True) -> tuple[dict, np.ndarray]:
+    """
+    Read an artifact.
+
+    Returns:
+        tuple[dict, np.ndarray]: The sidecar (with its "items" list) and the
+            (chunks, dimensions) float32 matrix, memory-mapped read-only when `mmap`
+    """
+    matrix_path, meta_path = artifact_paths(prefix)
+    with open(meta_path, "r") as f:
+        sidecar = json.load(f)
+    if sidecar.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding artifact version in {meta_path}: {sidecar.get('format_version')}")
+    matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+    if len(matrix) != len(sidecar["items"]):
+        raise ValueError(f"{matrix_path} has {len(matrix)} rows but {meta_path} lists {len(sidecar['items'])} items")
+    return sidecar, matrix
+
+
+def load_items(prefix: str) -> list[dict]:
+    """
+    Chunk dicts with their "embedding", from the artifact at `prefix` or else from `prefix`.json.
+
+    Artifact embeddings are float32 rows of the memory-mapped matrix (views, not copies);
+    JSON embeddings are lists.
+    """
+    if artifact_exists(prefix):
+        sidecar, matrix = load_artifact(prefix)
+        return [{**item, "embedding": row} for item, row in zip(sidecar["items"], matrix)]
+    with open(f"{prefix}.json", "r") as f:
+        return json.load(f)
+
+
+def save_json(items: list[dict], path: str) -> None:
+    """Write items in the original JSON format."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    items = [
+        {**item, "embedding": np.asarray(item["embedding"]).tolist()} if "embedding" in item else item
+        for item in items
+    ]
+    with open(path, "w") as f:
+        json.dump(items, f, indent=2)
+
+
+def save_items(prefix: str, items: list[dict], output_format: str = "npy", metadata: dict | None = None) -> None:
+    """Write items as an artifact ("npy"), as `prefix`.json ("json") or both."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Invalid output format: {output_format}. Must be one of: {', '.join(OUTPUT_FORMATS)}")
+    if output_format in ("npy", "both"):
+        save_artifact(prefix, items, metadata)
+    if output_format in ("json", "both"):
+        save_json(items, f"{prefix}.json")
+
+
+def export_json(prefix: str, path: str | None = None) -> str:
+    """Convert the artifact at `prefix` to the JSON format; returns the path written."""
+    path = path or f"{prefix}.json"
+    save_json(load_items(prefix), path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between embedding artifacts and JSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    to_json = subparsers.add_parser("to-json", help="Export an artifact as <prefix>.json")
+    to_json.add_argument("prefix")
+    from_json = subparsers.add_parser("from-json", help="Convert <prefix>.json into an artifact")
+    from_json.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "to-json":
+        print(f"wrote {export_json(args.prefix)}")
+    else:
+        prefix = args.path[:-len(".json")] if args.path.endswith(".json") else args.path
+        with open(args.path, "r") as f:
+            save_artifact(prefix, json.load(f))
+        print(f"wrote {', '.join(artifact_paths(prefix))}")
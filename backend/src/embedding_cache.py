@@ -0,0 +1,274 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import numpy as np
+from .db_pool import get_db_pool, get_db_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 1024))
+DEFAULT_STORE = os.getenv("EMBEDDING_CACHE_STORE", "none")  # none | sqlite | postgres
+DEFAULT_STORE_SIZE = int(os.getenv("EMBEDDING_CACHE_STORE_SIZE", 100_000))
+# Puts between evictions of the persistent store, which can exceed its size by that many entries in between
+DEFAULT_EVICT_INTERVAL = int(os.getenv("EMBEDDING_CACHE_EVICT_INTERVAL", 1000))
+DEFAULT_SQLITE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def encode_embedding(embedding) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.float32)
+
+
+class EmbeddingStore(ABC):
+    """Persistent tier behind the in-process LRU of an EmbeddingCache.
+
+    Least recently used entries beyond `max_entries` are evicted every
+    `evict_interval` puts rather than on each insert.
+    """
+
+    def __init__(self, max_entries: int, evict_interval: int):
+        self.max_entries = max_entries
+        self.evict_interval = max(1, evict_interval)
+        self._puts = 0
+        self._puts_lock = threading.Lock()
+
+    def _eviction_due(self) -> bool:
+        """Count a put; True on every `evict_interval`-th one."""
+        with self._puts_lock:
+            self._puts += 1
+            if self._puts < self.evict_interval:
+                return False
+            self._puts = 0
+            return True
+
+    @abstractmethod
+    def get(self, key: str) -> np.ndarray | None:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, model: str, embedding: np.ndarray) -> None:
+        pass
+
+    @abstractmethod
+    def size(self) -> int:
+        pass
+
+
+class SQLiteEmbeddingStore(EmbeddingStore):
+    """Embeddings stored as float32 blobs in a local SQLite file, evicted least recently used first."""
+
+    def __init__(
+            self,
+            path: str = DEFAULT_SQLITE_PATH,
+            max_entries: int = DEFAULT_STORE_SIZE,
+            evict_interval: int = DEFAULT_EVICT_INTERVAL
+        ):
+        super().__init__(max_entries, evict_interval)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embedding_cache_last_used ON embedding_cache (last_used)")
+        self._conn.commit()
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            row = self._conn.execute("SELECT embedding FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE embedding_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return decode_embedding(row[0])
+
+    def put(self, key: str, model: str, embedding: np.ndarray) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, model, embedding, last_used) VALUES (?, ?, ?, ?)",
+                (key, model, encode_embedding(embedding), time.time())
+            )
+            if self._eviction_due():
+                self._conn.execute("""
+                    DELETE FROM embedding_cache WHERE key IN (
+                        SELECT key FROM embedding_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )""", (self.max_entries,))
+            self._conn.commit()
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresEmbeddingStore(EmbeddingStore):
+    """Embeddings stored in the `embedding_cache` table, shared by every API worker."""
+
+    def __init__(
+            self,
+            db_settings: dict | None = None,
+            max_entries: int = DEFAULT_STORE_SIZE,
+            evict_interval: int = DEFAULT_EVICT_INTERVAL
+        ):
+        super().__init__(max_entries, evict_interval)
+        self.db_settings = db_settings or get_db_settings()
+
+    def _execute(self, sql_query, args, fetch=False):
+        with get_db_pool(self.db_settings).connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, args)
+                return cursor.fetchall() if fetch else None
+
+    def get(self, key: str) -> np.ndarray | None:
+        rows = self._execute(
+            "UPDATE embedding_cache SET last_used = CURRENT_TIMESTAMP WHERE key = %s RETURNING embedding",
+            (key,), fetch=True
+        )
+        return decode_embedding(bytes(rows[0][0])) if rows else None
+
+    def put(self, key: str, model: str, embedding: np.ndarray) -> None:
+        self._execute("""
+            INSERT INTO embedding_cache (key, model, embedding)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET last_used = CURRENT_TIMESTAMP
+            """, (key, model, encode_embedding(embedding)))
+        # Each API worker counts its own puts, so the shared table is evicted at least every evict_interval puts
+        if self._eviction_due():
+            self._execute("""
+                DELETE FROM embedding_cache WHERE key IN (
+                    SELECT key FROM embedding_cache ORDER BY last_used DESC OFFSET %s
+                )""", (self.max_entries,))
+
+    def size(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM embedding_cache", (), fetch=True)[0][0]
+
+
+class EmbeddingCache:
+    """Query-embedding cache keyed on normalized text and model name.
+
+    Lookups go to an in-process LRU first and then to the optional persistent
+    `store`; store hits are promoted into the LRU. `max_size=0` disables the LRU.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, store: EmbeddingStore | None = None):
+        self.max_size = max_size
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text: str, model: str) -> list[float] | None:
+        key = cache_key(text, model)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding.tolist()
+
+        if self.store is not None:
+            try:
+                embedding = self.store.get(key)
+            except Exception as e:
+                logger.warning(f"Embedding cache store lookup failed: {e}")
+                embedding = None
+            if embedding is not None:
+                with self._lock:
+                    self.store_hits += 1
+                    self._remember(key, embedding)
+                return embedding.tolist()
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text: str, model: str, embedding: list[float]) -> None:
+        key = cache_key(text, model)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+        if self.store is not None:
+            try:
+                self.store.put(key, model, embedding)
+            except Exception as e:
+                logger.warning(f"Embedding cache store write failed: {e}")
+
+    def _remember(self, key: str, embedding: np.ndarray) -> None:
+        """Insert into the LRU, evicting the least recently used entries. Caller holds the lock."""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.store_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.store_hits) / lookups, 4) if lookups else 0.0,
+                "store": type(self.store).__name__ if self.store is not None else None
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache configured from EMBEDDING_CACHE_* environment variables."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            if DEFAULT_STORE == "sqlite":
+                store = SQLiteEmbeddingStore(DEFAULT_SQLITE_PATH, DEFAULT_STORE_SIZE)
+            elif DEFAULT_STORE == "postgres":
+                store = PostgresEmbeddingStore(max_entries=DEFAULT_STORE_SIZE)
+            elif DEFAULT_STORE == "none":
+                store = None
+            else:
+                raise ValueError(f"Invalid EMBEDDING_CACHE_STORE: {DEFAULT_STORE}. Must be one of: 'none', 'sqlite', 'postgres'")
+            _default_cache = EmbeddingCache(max_size=DEFAULT_CACHE_SIZE, store=store)
+        return _default_cache
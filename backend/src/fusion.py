@@ -0,0 +1,129 @@
+"""Client-side fusion of semantic and full-text search results.
+
+Candidates for a batch of queries are fetched once (see `Retriever.get_fusion_candidates`)
+and aligned into (queries, candidates) arrays, so every fusion method is a few
+vectorized NumPy operations and parameter sweeps never go back to the database.
+"""
+import numpy as np
+from .vector_index import top_k_indices
+
+# Rank given to a document missing from one side, as in the hybrid_search SQL function
+MISSING_RANK = 1_000_000
+
+
+class FusionCandidates:
+    """Semantic and full-text candidates of a batch of queries.
+
+    Each query's candidates are the union of its semantic and full-text rows
+    (id, content, context, source, score), best first. Arrays are padded to the
+    largest union; `valid` marks real entries, and ranks are 1-based with `inf`
+    where a document is missing from that side.
+    """
+
+    def __init__(self, semantic_rows_per_query: list[list[tuple]], fts_rows_per_query: list[list[tuple]]):
+        if len(semantic_rows_per_query) != len(fts_rows_per_query):
+            raise ValueError("semantic and full-text rows must cover the same queries")
+        self.docs = {}
+        per_query = []
+        for semantic_rows, fts_rows in zip(semantic_rows_per_query, fts_rows_per_query):
+            positions = {}
+            for rows in (semantic_rows, fts_rows):
+                for row in rows:
+                    self.docs.setdefault(row[0], tuple(row[:4]))
+                    positions.setdefault(row[0], len(positions))
+            per_query.append((positions, semantic_rows, fts_rows))
+
+        n_queries = len(per_query)
+        width = max((len(positions) for positions, _, _ in per_query), default=0)
+        self.ids = np.full((n_queries, width), -1, dtype=np.int64)
+        self.valid = np.zeros((n_queries, width), dtype=bool)
+        self.semantic_score = np.full((n_queries, width), np.nan)
+        self.semantic_rank = np.full((n_queries, width), np.inf)
+        self.fts_score = np.full((n_queries, width), np.nan)
+        self.fts_rank = np.full((n_queries, width), np.inf)
+
+        for q, (positions, semantic_rows, fts_rows) in enumerate(per_query):
+            for doc_id, column in positions.items():
+                self.ids[q, column] = doc_id
+                self.valid[q, column] = True
+            for rank, row in enumerate(semantic_rows, start=1):
+                self.semantic_score[q, positions[row[0]]] = row[4]
+                self.semantic_rank[q, positions[row[0]]] = rank
+            for rank, row in enumerate(fts_rows, start=1):
+                self.fts_score[q, positions[row[0]]] = row[4]
+                self.fts_rank[q, positions[row[0]]] = rank
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _minmax(scores: np.ndarray) -> np.ndarray:
+    """Min-max normalize each query's present scores to [0, 1]; missing scores become 0."""
+    present = ~np.isnan(scores)
+    low = np.min(np.where(present, scores, np.inf), axis=1, keepdims=True)
+    high = np.max(np.where(present, scores, -np.inf), axis=1, keepdims=True)
+    span = high - low
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normalized = np.where(span > 0, (scores - low) / span, 1.0)
+    return np.where(present, normalized, 0.0)
+
+
+def rrf(candidates: FusionCandidates, k: int = 60, semantic_weight: float = 0.5, fts_weight: float = 0.5) -> np.ndarray:
+    """Weighted reciprocal rank fusion, identical to the hybrid_search SQL functions."""
+    semantic_rank = np.where(np.isinf(candidates.semantic_rank), MISSING_RANK, candidates.semantic_rank)
+    fts_rank = np.where(np.isinf(candidates.fts_rank), MISSING_RANK, candidates.fts_rank)
+    return semantic_weight / (k + semantic_rank) + fts_weight / (k + fts_rank)
+
+
+def weighted_sum(candidates: FusionCandidates, k: int = 60, semantic_weight: float = 0.5, fts_weight: float = 0.5) -> np.ndarray:
+    """Weighted sum of min-max normalized scores (`k` is unused)."""
+    return semantic_weight * _minmax(candidates.semantic_score) + fts_weight * _minmax(candidates.fts_score)
+
+
+def combmnz(candidates: FusionCandidates, k: int = 60, semantic_weight: float = 0.5, fts_weight: float = 0.5) -> np.ndarray:
+    """CombMNZ: the weighted normalized score sum times the number of lists the document appears in (`k` is unused)."""
+    n_lists = (~np.isnan(candidates.semantic_score)).astype(np.float64) + (~np.isnan(candidates.fts_score))
+    return weighted_sum(candidates, k, semantic_weight, fts_weight) * n_lists
+
+
+FUSION_METHODS = {
+    "rrf": rrf,
+    "weighted_sum": weighted_sum,
+    "combmnz": combmnz,
+}
+
+
+def fuse(
+        candidates: FusionCandidates,
+        method: str = "rrf",
+        limit: int = 3,
+        k: int = 60,
+        semantic_weight: float = 0.5,
+        fts_weight: float = 0.5
+    ) -> list[list[tuple]]:
+    """
+    Fuse the candidates of every query and keep the best `limit`.
+
+    Args:
+        candidates (FusionCandidates): Candidates from the semantic and full-text paths
+        method (str): One of "rrf", "weighted_sum" or "combmnz". Defaults to "rrf".
+        limit (int): Documents to return per query. Defaults to 3.
+        k (int): RRF rank constant. Defaults to 60.
+        semantic_weight (float): Weight of the semantic side. Defaults to 0.5.
+        fts_weight (float): Weight of the full-text side. Defaults to 0.5.
+
+    Returns:
+        list[list[tuple]]: (id, content, context, source, score) rows per query, best first
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Invalid fusion method: {method}. Must be one of: {', '.join(FUSION_METHODS)}")
+    if candidates.ids.shape[1] == 0:
+        return [[] for _ in range(len(candidates))]
+
+    scores = FUSION_METHODS[method](candidates, k, semantic_weight, fts_weight)
+    scores = np.where(candidates.valid, scores, -np.inf)
+    top = top_k_indices(scores, limit)
+    return [
+        [(*candidates.docs[candidates.ids[q, i]], float(scores[q, i])) for i in top[q] if candidates.valid[q, i]]
+        for q in range(len(top))
+    ]
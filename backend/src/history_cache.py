@@ -0,0 +1,174 @@
+"""In-process cache of recent conversation history.
+
+Every turn reads the conversation's last messages right after this process
+wrote the newest of them. The cache keeps the most recent messages of each
+active conversation and is written through by `add_message`, so in the steady
+state a multi-turn chat reads its history without a database round trip. A
+conversation created by this process starts with an empty, complete entry;
+any other conversation is loaded from the database on its first read.
+
+An entry is either complete (it holds the whole conversation) or holds exactly
+the conversation's last `len(messages)` messages; a read for more than that is
+a miss. Entries are dropped least recently used beyond `max_size`, and after
+`ttl` seconds without a load or write, which bounds how stale a conversation
+written by another process can get.
+
+A load only stores its rows if the conversation was not written to while the
+database read was in flight, since the rows might be missing that message, and
+a write-through of a message the entry already holds (read back by a load that
+raced the write) is ignored.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", 1000))  # conversations; 0 disables the cache
+DEFAULT_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", 1800))
+# Messages kept per conversation; reads for a longer history go to the database
+DEFAULT_CACHE_MESSAGES = int(os.getenv("HISTORY_CACHE_MESSAGES", 50))
+
+
+class HistoryEntry:
+    def __init__(self, messages: list[tuple[str, str, str]], complete: bool):
+        self.messages = messages
+        self.complete = complete
+        self.touched_at = time.monotonic()
+
+
+class HistoryCache:
+    """Recent (id, role, content) messages per conversation, LRU- and TTL-bounded."""
+
+    def __init__(
+            self,
+            max_size: int = DEFAULT_CACHE_SIZE,
+            ttl: float = DEFAULT_CACHE_TTL,
+            max_messages: int = DEFAULT_CACHE_MESSAGES
+        ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self._entries: OrderedDict[str, HistoryEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        # Sequence number of the last write per conversation, to spot writes during a load
+        self._seq = 0
+        self._last_write: OrderedDict[str, int] = OrderedDict()
+        self._forgotten_seq = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.skipped_loads = 0
+
+    def _entry(self, conversation_id: str) -> HistoryEntry | None:
+        entry = self._entries.get(conversation_id)
+        if entry is not None and time.monotonic() - entry.touched_at > self.ttl:
+            del self._entries[conversation_id]
+            self.expirations += 1
+            return None
+        return entry
+
+    def _store(self, conversation_id: str, entry: HistoryEntry):
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _trim(self, entry: HistoryEntry):
+        if len(entry.messages) > self.max_messages:
+            del entry.messages[:-self.max_messages]
+            entry.complete = False
+
+    def _record_write(self, conversation_id: str):
+        self._seq += 1
+        self._last_write[conversation_id] = self._seq
+        self._last_write.move_to_end(conversation_id)
+        while len(self._last_write) > 4 * self.max_size:
+            _, seq = self._last_write.popitem(last=False)
+            self._forgotten_seq = seq
+
+    def get(self, conversation_id, message_limit: int) -> list[dict] | None:
+        """The last `message_limit` messages in chronological order, or None on a miss."""
+        conversation_id = str(conversation_id)
+        with self._lock:
+            entry = self._entry(conversation_id)
+            if entry is None or not (entry.complete or len(entry.messages) >= message_limit):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            messages = entry.messages[-message_limit:] if message_limit > 0 else []
+        return [{"role": role, "content": content} for _, role, content in messages]
+
+    def begin_load(self) -> int:
+        """Token to pass to `load` for a database read starting now."""
+        with self._lock:
+            return self._seq
+
+    def load(self, conversation_id, rows: list[dict], message_limit: int, token: int):
+        """Store the rows of a `get_conversation_history(conversation_id, message_limit)` read (newest first)."""
+        conversation_id = str(conversation_id)
+        with self._lock:
+            if self._last_write.get(conversation_id, self._forgotten_seq) > token:
+                self.skipped_loads += 1
+                return
+            entry = HistoryEntry(
+                [(str(row["id"]), row["conversation_role"], row["content"]) for row in reversed(rows)],
+                complete=len(rows) < message_limit
+            )
+            self._trim(entry)
+            self._store(conversation_id, entry)
+
+    def start(self, conversation_id):
+        """Register a conversation this process just created: complete and empty."""
+        with self._lock:
+            self._store(str(conversation_id), HistoryEntry([], complete=True))
+
+    def append(self, conversation_id, message_id, role: str, content: str):
+        """Write through a message added after every message of the conversation."""
+        conversation_id, message_id = str(conversation_id), str(message_id)
+        with self._lock:
+            self._record_write(conversation_id)
+            entry = self._entry(conversation_id)
+            if entry is None or any(message[0] == message_id for message in entry.messages):
+                return
+            entry.messages.append((message_id, role, content))
+            entry.touched_at = time.monotonic()
+            self._trim(entry)
+
+    def invalidate(self, conversation_id):
+        """Drop a conversation, e.g. after a message was added out of order."""
+        conversation_id = str(conversation_id)
+        with self._lock:
+            self._record_write(conversation_id)
+            self._entries.pop(conversation_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "skipped_loads": self.skipped_loads
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_history_cache() -> HistoryCache | None:
+    """Process-wide history cache configured from HISTORY_CACHE_* environment variables; None when disabled."""
+    global _default_cache
+    if DEFAULT_CACHE_SIZE <= 0:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HistoryCache()
+        return _default_cache
@@ -0,0 +1,180 @@
+"""Token-budgeted conversation history for the prompts of each stage.
+
+`memory_size` caps how many messages are read, but assistant answers carry the
+full text of their relevant rules, so a few turns can add thousands of input
+tokens to every LLM call of a request. The history manager fits the history
+into a token budget per stage (next_step, reword, select_rules, answer,
+verify):
+
+- the newest message is always kept in full;
+- older messages are kept newest first while they fit, with the rule text of
+  an answer reduced to its rule numbers when the full message does not fit;
+- everything older than the first message that does not fit is folded into a
+  rolling summary (one line per message, newest lines kept within
+  `summary_budget`), sent as a leading "summary" message.
+
+The windowed history is rendered in the prompts by
+`prompt_rendering.render_history`: one "role: content" block per message
+instead of indented JSON, which escapes every newline and quote in the rule
+text.
+
+When token counting is on (`prompt_rendering.token_counting_enabled`), every
+window records the tokens the history would have taken as indented JSON of the
+full history and the tokens it takes as sent, per stage (`stats`).
+"""
+import os
+import re
+import json
+import logging
+import threading
+from functools import lru_cache
+from .token_count import count_tokens
+from .prompt_rendering import render_history, token_counting_enabled
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODE = os.getenv("HISTORY_WINDOW", "on")  # on | off
+STAGES = ["next_step", "reword", "select_rules", "answer", "verify"]
+DEFAULT_BUDGETS = {
+    "next_step": int(os.getenv("HISTORY_BUDGET_NEXT_STEP", 1200)),
+    "reword": int(os.getenv("HISTORY_BUDGET_REWORD", 400)),
+    "select_rules": int(os.getenv("HISTORY_BUDGET_SELECT_RULES", 600)),
+    "answer": int(os.getenv("HISTORY_BUDGET_ANSWER", 1500)),
+    "verify": int(os.getenv("HISTORY_BUDGET_VERIFY", 800)),
+}
+DEFAULT_SUMMARY_BUDGET = int(os.getenv("HISTORY_SUMMARY_BUDGET", 150))
+SUMMARY_LINE_CHARS = 200
+SUMMARY_ROLE = "summary"
+
+# The relevant-rules section RagChat appends to answers: "- **10.A**: rule text" lines after a heading
+RULES_SECTION_PATTERN = re.compile(r"\n+\*\*Relevant rules:\*\*\n.*", re.DOTALL | re.IGNORECASE)
+RULE_ITEM_PATTERN = re.compile(r"^- \*\*([^*]+)\*\*:", re.MULTILINE)
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s")
+
+
+def compact_message(content: str) -> str:
+    """An answer with its rule texts replaced by the rule numbers."""
+    match = RULES_SECTION_PATTERN.search(content)
+    if match is None:
+        return content
+    rule_numbers = RULE_ITEM_PATTERN.findall(match.group(0))
+    compact = content[:match.start()]
+    return f"{compact}\n(relevant rules: {', '.join(rule_numbers)})" if rule_numbers else compact
+
+
+def summary_line(message: dict) -> str:
+    """One line for the rolling summary: the first sentence of the message, without its rule texts."""
+    text = " ".join(RULES_SECTION_PATTERN.sub("", message["content"]).split())
+    text = SENTENCE_END_PATTERN.split(text, maxsplit=1)[0]
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS - 3] + "..."
+    return f"- {message['role']}: {text}"
+
+
+# The same history messages are counted for every stage of a request
+@lru_cache(maxsize=1024)
+def message_tokens(role: str, content: str) -> int:
+    return count_tokens(f"{role}: {content}")
+
+
+class HistoryManager:
+    """Fits conversation history into per-stage token budgets and reports the tokens saved.
+
+    Args:
+        budgets: Tokens of history allowed per stage; stages not listed are not trimmed
+        summary_budget: Tokens allowed for the summary of the messages that do not fit
+    """
+
+    def __init__(self, budgets: dict[str, int] | None = None, summary_budget: int = DEFAULT_SUMMARY_BUDGET):
+        self.budgets = dict(DEFAULT_BUDGETS if budgets is None else budgets)
+        self.summary_budget = summary_budget
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def fit(self, history: list[dict], budget: int) -> list[dict]:
+        """The messages of `history` to send within `budget` tokens, with a leading summary if any were dropped."""
+        system = [message for message in history if message["role"] == "system"]
+        messages = [message for message in history if message["role"] != "system"]
+        if not messages:
+            return list(history)
+
+        kept = [messages[-1]]
+        used = message_tokens(messages[-1]["role"], messages[-1]["content"])
+        dropped = []
+        for i in range(len(messages) - 2, -1, -1):
+            message = messages[i]
+            for content in (message["content"], compact_message(message["content"])):
+                tokens = message_tokens(message["role"], content)
+                if used + tokens <= budget:
+                    kept.append({**message, "content": content})
+                    used += tokens
+                    break
+            else:
+                dropped = messages[:i + 1]
+                break
+        kept.reverse()
+
+        summary = self.summarize(dropped)
+        if summary:
+            kept.insert(0, {"role": SUMMARY_ROLE, "content": summary})
+        return system + kept
+
+    def summarize(self, messages: list[dict]) -> str:
+        """Rolling summary of messages that left the window: the newest lines within summary_budget."""
+        lines = []
+        used = 0
+        for message in reversed(messages):
+            line = summary_line(message)
+            tokens = count_tokens(line)
+            if used + tokens > self.summary_budget:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(reversed(lines))
+
+    def window(self, history: list[dict], stage: str) -> list[dict]:
+        """The history to send in the prompt of a stage; records the tokens it saved when counting is on."""
+        budget = self.budgets.get(stage)
+        windowed = list(history) if budget is None else self.fit(history, budget)
+        if token_counting_enabled(logger):
+            self._record(stage, history, windowed)
+        return windowed
+
+    def _record(self, stage: str, history: list[dict], windowed: list[dict]):
+        before = count_tokens(json.dumps(history, indent=2))
+        after = count_tokens(render_history(windowed))
+        with self._lock:
+            stats = self._stats.setdefault(stage, {"calls": 0, "tokens_before": 0, "tokens_after": 0})
+            stats["calls"] += 1
+            stats["tokens_before"] += before
+            stats["tokens_after"] += after
+        logger.debug(f"{stage} history: {before} -> {after} tokens ({len(history)} -> {len(windowed)} messages)")
+
+    def stats(self) -> dict:
+        """Per stage: windows built, history tokens as indented JSON of the full history, as sent, and saved."""
+        with self._lock:
+            return {
+                stage: {
+                    **stats,
+                    "tokens_saved": stats["tokens_before"] - stats["tokens_after"],
+                    "saved_per_call": round((stats["tokens_before"] - stats["tokens_after"]) / stats["calls"], 1)
+                }
+                for stage, stats in self._stats.items()
+            }
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_history_manager() -> HistoryManager | None:
+    """Process-wide history manager configured from HISTORY_* environment variables; None when disabled."""
+    global _default_manager
+    if DEFAULT_MODE == "off":
+        return None
+    if DEFAULT_MODE != "on":
+        raise ValueError(f"Invalid HISTORY_WINDOW: {DEFAULT_MODE}. Must be one of: 'on', 'off'")
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = HistoryManager()
+        return _default_manager
@@ -0,0 +1,113 @@
+"""In-process copy of the `models` price table for computing llm_calls costs.
+
+The cost of an LLM call used to be set by a per-row trigger that looks the
+model up in `models` for every inserted llm_calls row, and
+`calculate_token_cost` was a database round trip. The table holds a handful of
+rows, so it is loaded whole and cost is computed in Python before the insert;
+the trigger now only runs for rows inserted without a cost.
+
+The table is reloaded every `refresh_interval` seconds, which picks up price
+changes; loading it costs no more than checking a version would. A model that
+is not in the table triggers an early reload (at most every
+`min_reload_interval` seconds), so newly added models are priced right away.
+Calls to models that are still unknown get no cost here and are left to the
+trigger, which rejects them as before. Records that are not LLM calls, such as
+the answer cache lookups, cost 0 and need no `models` row.
+"""
+import os
+import time
+import logging
+import threading
+from .db_pool import get_db_pool, get_db_settings
+from .answer_cache import ANSWER_CACHE_MODEL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = float(os.getenv("MODEL_PRICES_REFRESH_INTERVAL", 300))
+DEFAULT_MIN_RELOAD_INTERVAL = float(os.getenv("MODEL_PRICES_MIN_RELOAD_INTERVAL", 5))
+# llm_calls "models" that make no LLM call; databases created before they were added have no row for them
+FREE_MODELS = {ANSWER_CACHE_MODEL}
+
+
+class ModelPrices:
+    """Model name -> (input token cost, output token cost), loaded from `models`."""
+
+    def __init__(
+            self,
+            db_settings: dict | None = None,
+            refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+            min_reload_interval: float = DEFAULT_MIN_RELOAD_INTERVAL
+        ):
+        self.db_settings = db_settings or get_db_settings()
+        self.refresh_interval = refresh_interval
+        self.min_reload_interval = min_reload_interval
+        self.prices = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _query(self, sql_query, args=()):
+        with get_db_pool(self.db_settings).connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, args)
+                return cursor.fetchall()
+
+    def load(self) -> dict[str, tuple[float, float]]:
+        rows = self._query("SELECT name, input_token_cost, output_token_cost FROM models")
+        # Models without both prices are rejected by calculate_token_cost, so they are left out
+        self.prices = {
+            name: (input_cost, output_cost) for name, input_cost, output_cost in rows
+            if input_cost is not None and output_cost is not None
+        }
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+        logger.info(f"Loaded prices for {len(self.prices)} models")
+        return self.prices
+
+    def needs_check(self) -> bool:
+        return self.prices is None or time.monotonic() - self._loaded_at >= self.refresh_interval
+
+    def refresh(self, force: bool = False) -> dict[str, tuple[float, float]]:
+        """Reload the prices if they are due (or `force` and not reloaded in the last min_reload_interval s)."""
+        with self._lock:
+            age = time.monotonic() - self._loaded_at
+            if not (self.needs_check() or (force and age >= self.min_reload_interval)):
+                return self.prices
+            try:
+                return self.load()
+            except Exception as e:
+                # Keep the prices we have; uncosted rows fall back to the trigger
+                logger.warning(f"Could not load model prices: {e}")
+                self.prices = self.prices or {}
+                self._loaded_at = time.monotonic()
+                return self.prices
+
+    def get(self, model: str) -> tuple[float, float] | None:
+        prices = self.refresh() if self.needs_check() else self.prices
+        if model not in prices:
+            prices = self.refresh(force=True)
+        return prices.get(model)
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> float | None:
+        """Cost of a call as calculate_token_cost computes it; None for a model without prices."""
+        if model in FREE_MODELS:
+            return 0.0
+        prices = self.get(model)
+        if prices is None:
+            return None
+        input_cost, output_cost = prices
+        return input_cost * int(input_tokens) + output_cost * int(output_tokens)
+
+
+_model_prices = {}
+_model_prices_lock = threading.Lock()
+
+
+def get_model_prices(db_settings: dict | None = None) -> ModelPrices:
+    """Return the process-wide price table for these connection settings."""
+    db_settings = db_settings or get_db_settings()
+    key = tuple(sorted((k, str(v)) for k, v in db_settings.items()))
+    with _model_prices_lock:
+        if key not in _model_prices:
+            _model_prices[key] = ModelPrices(db_settings)
+        return _model_prices[key]
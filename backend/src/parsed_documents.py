@@ -0,0 +1,265 @@
+"""Rule and glossary parsing of the documents, done once per document.
+
+Rules chunks are split into {rule number: rule body} and glossary entries into
+(term, definition) when the index loads, instead of re-running the regex split
+over the joined context on every question. The index reloads when
+`corpus_version` changes, like VectorIndex. Context preparation then only merges
+the parsed documents (`merge_parsed`), and queries naming a rule number are
+answered from the rule-number index (`find_rule_references`, `lookup_rules`).
+"""
+import os
+import re
+import math
+import time
+import logging
+import threading
+from functools import lru_cache
+from .db_pool import get_db_pool, get_db_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = float(os.getenv("PARSED_DOCUMENTS_REFRESH_INTERVAL", 30))
+
+# Section headers such as "Appendix B: Misconduct System"; rules after one are not parsed
+SECTION_HEADER_PATTERN = re.compile(r"\n\n[A-Z][a-z]+(?:\s+[A-Z])?[^:]*:")
+RULE_NUMBER_PATTERN = re.compile(r"\n\b([A-Z]?\d+(?:\.[A-Z]+)?(?:\.\d+)?(?:\.[a-z])?(?:\.\d+)?(?:\.\d+)?\.)")
+# Rule references in a query: "10.H", "15.C.2.a", or appendix rules after "rule" ("rule B3.1")
+RULE_REFERENCE_PATTERN = re.compile(
+    r"(?<![\w.])(\d{1,2}\.[A-Za-z](?:\.\d+)*(?:\.[a-z](?:\.\d+)*)?)(?!\w)"
+    r"|\brules?\s+([A-F]\d+(?:\.[A-Z])?(?:\.\d+)*)(?!\w)",
+    re.IGNORECASE
+)
+
+
+def split_rules(rules_text: str) -> tuple[str, dict[str, str]]:
+    """
+    Split rules text into the text before its first rule number and a {rule number: rule body} dict.
+
+    Rules are in text order; text after the first section header is ignored.
+    """
+    rules_text = SECTION_HEADER_PATTERN.split(rules_text)[0]
+    chunks = RULE_NUMBER_PATTERN.split(rules_text)
+    rules = {}
+    for i in range(1, len(chunks) - 1, 2):
+        rule_num = chunks[i].rstrip(".")  # Remove trailing dot
+        rules[rule_num] = chunks[i + 1].strip()
+    return chunks[0].strip(), rules
+
+
+@lru_cache(maxsize=4096)
+def rule_sort_key(rule_num: str) -> tuple:
+    """Natural sort key of a rule number; appendix rules (e.g. "B3.1") sort after numbered rules."""
+    parts = [p for p in re.split(r"([A-Z]+|\d+)", rule_num) if p and p != "."]
+    if parts[0].isalpha():
+        return (parts[0], *(int(p) if p.isdigit() else p for p in parts[1:]))
+    return ("", *(int(p) if p.isdigit() else p for p in parts))
+
+
+def sort_rules(rules: dict[str, str]) -> dict[str, str]:
+    return dict(sorted(rules.items(), key=lambda item: rule_sort_key(item[0])))
+
+
+def find_rule_references(query: str) -> list[str]:
+    """Rule numbers named in a query, normalized to the rulebook's form ("10.h" -> "10.H", "15.c.2.A" -> "15.C.2.a").
+
+    The pattern matches in any case; the rulebook has an upper-case letter for the
+    second level of a rule number and lower-case letters below it.
+    """
+    references = []
+    for match in RULE_REFERENCE_PATTERN.finditer(query):
+        parts = (match.group(1) or match.group(2)).split(".")
+        parts[0] = parts[0].upper()
+        if len(parts) > 1 and parts[1].isalpha():
+            parts[1] = parts[1].upper()
+        parts[2:] = [part.lower() for part in parts[2:]]
+        reference = ".".join(parts)
+        if reference not in references:
+            references.append(reference)
+    return references
+
+
+def rule_prefixes(rule_num: str) -> list[str]:
+    """The rule and the rules it is a subrule of, down to two levels ("10.H.1.a" -> "10.H.1.a", "10.H.1", "10.H")."""
+    parts = rule_num.split(".")
+    return [".".join(parts[:n]) for n in range(len(parts), min(len(parts), 2) - 1, -1)]
+
+
+def document_order(doc_id: int, source: str, chunk_index: int | None) -> tuple:
+    """Sort key for rulebook order: source, then chunk_index; ids only break ties.
+
+    Ids do not follow the rulebook after incremental loads, and `merge_parsed` joins
+    a chunk's lead text to the last rule of the chunk before it.
+    """
+    return (source, math.inf if chunk_index is None else chunk_index, doc_id)
+
+
+class ParsedDocument:
+    """The rules (source "rules") or the glossary term (source "glossary") of one document."""
+
+    def __init__(self, source: str, content: str, chunk_index: int | None = None):
+        self.source = source
+        self.content = content
+        self.chunk_index = chunk_index
+        self.lead = ""
+        self.rules = {}
+        self.term = None
+        self.definition = None
+        if source == "rules":
+            # A rule number at the very start of the chunk needs the newline it gets once chunks are joined
+            self.lead, self.rules = split_rules("\n" + content)
+        elif source == "glossary":
+            lines = content.split("\n")
+            self.term, self.definition = lines[0], "\n".join(lines[1:])
+
+
+def merge_parsed(parsed_documents: list[ParsedDocument]) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Combine parsed documents, in document order, into sorted rules and glossary definitions.
+
+    Gives the same rules as parsing the joined text: text before a chunk's first
+    rule number continues the last rule of the chunk before it.
+    """
+    rules = {}
+    definitions = {}
+    last_rule = None
+    for parsed in parsed_documents:
+        if parsed.source == "rules":
+            if parsed.lead and last_rule is not None:
+                rules[last_rule] = f"{rules[last_rule]}\n{parsed.lead}"
+            rules.update(parsed.rules)
+            if parsed.rules:
+                last_rule = next(reversed(parsed.rules))
+        elif parsed.source == "glossary":
+            definitions[parsed.term] = parsed.definition
+    return sort_rules(rules), definitions
+
+
+class ParsedDocumentIndex:
+    """Parsed form of every document in `documents`, by id.
+
+    Loaded once and reloaded when `corpus_version` changes (checked at most every
+    `refresh_interval` seconds). Documents the index does not have, or has with
+    different content, are parsed on the fly, so results never depend on the
+    index being current.
+    """
+
+    def __init__(self, db_settings: dict | None = None, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.db_settings = db_settings or get_db_settings()
+        self.refresh_interval = refresh_interval
+        self.documents = None
+        self.rule_documents = {}
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _query(self, sql_query, args=()):
+        with get_db_pool(self.db_settings).connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, args)
+                return cursor.fetchall()
+
+    def get_corpus_version(self) -> int:
+        return self._query("SELECT version FROM corpus_version")[0][0]
+
+    def load(self) -> dict[int, ParsedDocument]:
+        start = time.perf_counter()
+        version = self.get_corpus_version()
+        rows = self._query("SELECT id, source, chunk_index, content FROM documents")
+        documents = {
+            doc_id: ParsedDocument(source, content, chunk_index) for doc_id, source, chunk_index, content in rows
+        }
+        self.rule_documents = self._index_rules(documents)
+        self.documents = documents
+        self.version = version
+        self._checked_at = time.monotonic()
+        logger.info(
+            f"Parsed {len(self.documents)} documents, version {version}, "
+            f"in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        return self.documents
+
+    @staticmethod
+    def _index_rules(documents: dict[int, ParsedDocument]) -> dict[str, list[int]]:
+        """Rule number -> ids of the documents holding the rule or one of its subrules, in rulebook order."""
+        rule_documents = {}
+        for doc_id in sorted(documents, key=lambda doc_id: ParsedDocumentIndex._order(doc_id, documents)):
+            for rule_num in documents[doc_id].rules:
+                for prefix in rule_prefixes(rule_num):
+                    ids = rule_documents.setdefault(prefix, [])
+                    if not ids or ids[-1] != doc_id:
+                        ids.append(doc_id)
+        return rule_documents
+
+    @staticmethod
+    def _order(doc_id: int, documents: dict[int, ParsedDocument], doc: dict | None = None) -> tuple:
+        """`document_order` of a document of the index, or of a retrieved doc the index does not have."""
+        parsed = documents.get(doc_id)
+        if parsed is not None:
+            return document_order(doc_id, parsed.source, parsed.chunk_index)
+        return document_order(doc_id, doc["source"], doc.get("chunk_index"))
+
+    def needs_check(self) -> bool:
+        return self.documents is None or time.monotonic() - self._checked_at >= self.refresh_interval
+
+    def refresh(self) -> dict[int, ParsedDocument]:
+        """Reload if the documents table changed since the last load. Blocks on the database."""
+        with self._lock:
+            if not self.needs_check():
+                return self.documents
+            try:
+                if self.documents is None or self.get_corpus_version() != self.version:
+                    return self.load()
+            except Exception as e:
+                # Parse on the fly until the database is reachable again
+                logger.warning(f"Could not load parsed documents: {e}")
+                self.documents = self.documents or {}
+            self._checked_at = time.monotonic()
+            return self.documents
+
+    def parse(self, documents: list[dict]) -> list[ParsedDocument]:
+        """
+        Parsed documents for retrieved docs, in rulebook order (`document_order`).
+
+        A doc merged by context expansion yields its member documents (`ids`) in rulebook order.
+        """
+        parsed_by_id = self.refresh() if self.needs_check() else self.documents
+        parsed = []
+        for doc in sorted(documents, key=lambda doc: self._order(doc["id"], parsed_by_id, doc)):
+            members = [parsed_by_id.get(doc_id) for doc_id in doc.get("ids", [doc["id"]])]
+            if all(members) and "\n\n".join(member.content for member in members) == doc["content"]:
+                parsed.extend(members)
+            else:
+                parsed.append(ParsedDocument(doc["source"], doc["content"], doc.get("chunk_index")))
+        return parsed
+
+
+    def lookup_rules(self, rule_numbers: list[str]) -> list[tuple[int, ParsedDocument]] | None:
+        """
+        The documents holding the given rules (with their subrules), in rulebook order.
+
+        Returns None if any rule number is unknown, so the caller can fall back to a search.
+        """
+        if self.needs_check():
+            self.refresh()
+        rule_documents, documents = self.rule_documents, self.documents
+        doc_ids = set()
+        for rule_num in rule_numbers:
+            if rule_num not in rule_documents:
+                return None
+            doc_ids.update(rule_documents[rule_num])
+        doc_ids = sorted((doc_id for doc_id in doc_ids if doc_id in documents), key=lambda doc_id: self._order(doc_id, documents))
+        return [(doc_id, documents[doc_id]) for doc_id in doc_ids]
+
+
+_parsed_document_indexes = {}
+_parsed_document_indexes_lock = threading.Lock()
+
+
+def get_parsed_document_index(db_settings: dict | None = None) -> ParsedDocumentIndex:
+    """Return the process-wide parsed-document index for these connection settings."""
+    db_settings = db_settings or get_db_settings()
+    key = tuple(sorted((k, str(v)) for k, v in db_settings.items()))
+    with _parsed_document_indexes_lock:
+        if key not in _parsed_document_indexes:
+            _parsed_document_indexes[key] = ParsedDocumentIndex(db_settings)
+        return _parsed_document_indexes[key]
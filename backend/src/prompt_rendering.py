@@ -0,0 +1,141 @@
+"""Rendering of the values embedded in prompts, and a per-prompt token counter.
+
+The prompts used to embed the context, history and query with
+`json.dumps(..., indent=2)`. Rule text is mostly prose with newlines and
+quotes, and as JSON every newline becomes a literal "\\n", every quote is
+escaped and every key is quoted and indented, which is a large share of the
+input tokens. The compact format renders them as XML-tagged plain text, with
+the text left as is:
+
+    <rules>
+    10.A: The playing field is a rectangular area...
+    </rules>
+    <definitions>
+    Callahan: A goal scored by the defense...
+    </definitions>
+
+PROMPT_FORMAT=json (or `use_prompt_format("json")`) switches back to the
+indented JSON, so the two can be compared on the same inputs.
+
+Every prompt built in prompts.py is passed through `record_prompt`. With
+COUNT_PROMPT_TOKENS=true, or debug logging on for this module, it counts the
+prompt's tokens by prompt name (`get_prompt_token_counter().stats()`). Counting
+tokenizes every prompt a second time, so it is off on the default request path.
+"""
+import os
+import json
+import logging
+import threading
+from .token_count import count_tokens
+
+logger = logging.getLogger(__name__)
+
+PROMPT_FORMATS = ["compact", "json"]
+DEFAULT_FORMAT = os.getenv("PROMPT_FORMAT", "compact")
+COUNT_PROMPT_TOKENS = os.getenv("COUNT_PROMPT_TOKENS", "false").lower() == "true"
+
+_format = DEFAULT_FORMAT
+
+
+def use_prompt_format(prompt_format: str):
+    """Switch the format every prompt is rendered in from now on."""
+    global _format
+    if prompt_format not in PROMPT_FORMATS:
+        raise ValueError(f"Invalid prompt format: {prompt_format}. Must be one of: {', '.join(PROMPT_FORMATS)}")
+    _format = prompt_format
+
+
+def get_prompt_format() -> str:
+    return _format
+
+
+def render_text(text: str) -> str:
+    """A free-text value such as the user's question."""
+    if _format == "json":
+        return json.dumps(text, indent=2)
+    return text
+
+
+def render_entries(entries: dict) -> str:
+    """"key: value" lines, for rule number -> rule text and term -> definition."""
+    return "\n".join(f"{key}: {value}" for key, value in entries.items())
+
+
+def render_context(context) -> str:
+    """Retrieved context: the {"rules": ..., "definitions": ...} dict RagChat prepares, or any text/JSON value."""
+    if _format == "json":
+        return json.dumps(context, indent=2)
+    if isinstance(context, str):
+        return context
+    if not context:
+        return "(none)"
+    if not isinstance(context, dict):
+        return json.dumps(context, ensure_ascii=False)
+    sections = []
+    for name, value in context.items():
+        if isinstance(value, dict):
+            body = render_entries(value)
+        elif isinstance(value, str):
+            body = value
+        else:
+            body = json.dumps(value, ensure_ascii=False)
+        sections.append(f"<{name}>\n{body}\n</{name}>")
+    return "\n".join(sections)
+
+
+def render_history(history: list[dict]) -> str:
+    """Conversation history: "role: content" blocks separated by blank lines."""
+    if _format == "json":
+        return json.dumps(history, indent=2)
+    if not history:
+        return "(no previous messages)"
+    return "\n\n".join(f"{message['role']}: {message['content']}" for message in history)
+
+
+class PromptTokenCounter:
+    """Tokens of the prompts built, by prompt name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name: str, prompt: str) -> int:
+        tokens = count_tokens(prompt)
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "tokens": 0, "max_tokens": 0})
+            stats["calls"] += 1
+            stats["tokens"] += tokens
+            stats["max_tokens"] = max(stats["max_tokens"], tokens)
+        return tokens
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def stats(self) -> dict:
+        """Per prompt name: prompts built, total and mean tokens, and the largest prompt."""
+        with self._lock:
+            return {
+                name: {**stats, "mean_tokens": round(stats["tokens"] / stats["calls"], 1), "format": _format}
+                for name, stats in self._stats.items()
+            }
+
+
+_counter = PromptTokenCounter()
+
+
+def get_prompt_token_counter() -> PromptTokenCounter:
+    return _counter
+
+
+def token_counting_enabled(log: logging.Logger = logger) -> bool:
+    """Whether to count tokens only for reporting: COUNT_PROMPT_TOKENS=true, or debug logging on for `log`."""
+    return COUNT_PROMPT_TOKENS or log.isEnabledFor(logging.DEBUG)
+
+
+def record_prompt(name: str, prompt: str) -> str:
+    """Count the tokens of a prompt under its name when counting is on; returns the prompt."""
+    if token_counting_enabled():
+        tokens = _counter.record(name, prompt)
+        logger.debug(f"{name} prompt: {tokens} tokens ({_format})")
+    return prompt
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-import json
+from .prompt_rendering import render_context, render_history, render_text, record_prompt
 
 RAG_SYSTEM_PROMPT = """
 You are a Markus, a helpful assistant for question-answering tasks about the sport of ultimate (ultimate frisbee).
@@ -55,15 +55,15 @@ def get_rag_prompt(
         conversation_history: list[dict], 
         response_format: BaseModel|dict|None = None):
     prompt = RAG_PROMPT.format(
-        query=json.dumps(query, indent = 2), 
-        context=json.dumps(context, indent = 2), 
-        conversation_history=json.dumps(conversation_history, indent = 2)
+        query=render_text(query), 
+        context=render_context(context), 
+        conversation_history=render_history(conversation_history)
     )
     
     if not response_format:
         prompt += FORMAT_PROMPT.format(response_format=response_format)
     
-    return prompt
+    return record_prompt("answer", prompt)
 
 
 # NEXT_STEP_PROMPT = """You are an assistant for question-answering tasks about the sport of ultimate (ultimate frisbee). 
@@ -103,10 +103,10 @@ def get_next_step_prompt(
         conversation_history: list[dict], 
         query: str):
     prompt = NEXT_STEP_PROMPT.format(
-        history=json.dumps(conversation_history, indent = 2), 
+        history=render_history(conversation_history), 
         # user_input=query
     )
-    return prompt
+    return record_prompt("next_step", prompt)
 
 
 
@@ -132,10 +132,11 @@ User Input:
 """
 
 def get_reword_query_prompt(conversation_history: list[dict], query: str):
-    return REWORD_QUERY_PROMPT.format(
-        conversation_history=json.dumps(conversation_history[:-1], indent = 2), 
+    prompt = REWORD_QUERY_PROMPT.format(
+        conversation_history=render_history(conversation_history[:-1]), 
         user_input=query
     )
+    return record_prompt("reword", prompt)
 
 SELECT_RULES_DEFINITIONS_PROMPT = """You are an assistant for question-answering tasks about the sport of ultimate (ultimate frisbee). 
 I have retrieved several rules and definitions from the ultimate rule book that may or may not be relevant to the question being asked.
@@ -161,11 +162,12 @@ Retrieved Context:
 """
 
 def get_relevant_rules_definitions_prompt(query: str, conversation_history: list[dict], context: str):
-    return SELECT_RULES_DEFINITIONS_PROMPT.format(
-        conversation_history=json.dumps(conversation_history, indent = 2), 
-        context=json.dumps(context, indent = 2), 
-        query=json.dumps(query, indent = 2)
+    prompt = SELECT_RULES_DEFINITIONS_PROMPT.format(
+        conversation_history=render_history(conversation_history), 
+        context=render_context(context), 
+        query=render_text(query)
     )
+    return record_prompt("select_rules", prompt)
 
 VERIFY_ANSWER_PROMPT = """
 Please verify that this answer is fully supported by its provided rules and the conversation history.
@@ -179,7 +181,8 @@ Question: {query}
 Answer with rules: {answer}"""
 
 def get_verify_answer_prompt(query: str, answer: str, conversation_history: list[dict]):
-    return VERIFY_ANSWER_PROMPT.format(
-        query=query, answer=answer, conversation_history=json.dumps(conversation_history, indent=2)
+    prompt = VERIFY_ANSWER_PROMPT.format(
+        query=query, answer=answer, conversation_history=render_history(conversation_history)
     )
+    return record_prompt("verify", prompt)
 
@@ -1,22 +1,144 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from .retriever import Retriever
 import json
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Optional, Union, Iterator
 from .clients.base_client import BaseClient
 from .clients.get_abstract_client import get_abstract_client
 from .clients.llm_models import CLIENT_MODEL_MAP
 from .prompts import *
 from .db_client import DBClient
+from .stage_timer import StageTimer
+from .parsed_documents import split_rules, sort_rules, merge_parsed
+from .answer_cache import AnswerCache, get_answer_cache, retrieval_key, ANSWER_CACHE_MODEL
+from .history_manager import HistoryManager, get_history_manager
 import logging
 
 logging.basicConfig(level=logging.INFO,)
 logger = logging.getLogger(__name__)
 logging.getLogger("httpx").setLevel(logging.WARNING)
- 
+
+RELEVANT_RULES_HEADER = "\n\n**Relevant rules:**\n\n"
+# Threads shared by the requests of a RagChat for speculative reword + retrieval
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", 8))
+
+
+# Heading the plain-text answer format (FORMAT_PROMPT) uses before listing rule numbers
+STREAMED_RULES_MARKER = "**relevant rules**"
+RULE_NUMBER_LINE_PATTERN = re.compile(r"^\s*[-*]\s*\**\s*([A-Z]?\d+(?:\.[A-Za-z0-9]+)*)", re.MULTILINE)
+
+
+class AnswerStreamSplitter:
+    """Splits a streamed plain-text answer into the visible answer and the trailing rules list.
+
+    Text is released as soon as it cannot be the start of the relevant-rules heading,
+    so callers can forward tokens while the rule numbers are held back for formatting.
+    """
+    def __init__(self, marker: str = STREAMED_RULES_MARKER):
+        self.marker = marker
+        self.answer = ""
+        self.tail = None
+        self._buffer = ""
+
+    def feed(self, text: str) -> str:
+        """Add a chunk of streamed text and return the part that is safe to show."""
+        if self.tail is not None:
+            self.tail += text
+            return ""
+        self._buffer += text
+        lowered = self._buffer.lower()
+        index = lowered.find(self.marker)
+        if index >= 0:
+            visible = self._buffer[:index]
+            self.tail = self._buffer[index + len(self.marker):]
+            self._buffer = ""
+        else:
+            # hold back any suffix that could be the beginning of the marker
+            keep = 0
+            for size in range(min(len(self.marker) - 1, len(lowered)), 0, -1):
+                if self.marker.startswith(lowered[-size:]):
+                    keep = size
+                    break
+            visible = self._buffer[:len(self._buffer) - keep]
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+        self.answer += visible
+        return visible
+
+    def finish(self) -> str:
+        """Release any held-back text once the stream has ended."""
+        visible, self._buffer = self._buffer, ""
+        self.answer += visible
+        return visible
+
+    def rule_numbers(self) -> list[str]:
+        """Rule numbers listed under the relevant-rules heading."""
+        return RULE_NUMBER_LINE_PATTERN.findall(self.tail or "")
+
+
+class RulesDefinitions(BaseModel):
+    rules: list[str] = Field(description="The relevant rules (rule numbers only) that are needed to answer the current question.")
+    definitions: list[str] = Field(description="The relevant definitions (term names only) that are needed to answer the current question.")
+
+
+class Answer(BaseModel):
+    answer: str = Field(description="The answer to the question. It should be concise, preferably in one sentence. Exceptions are allowed if the answer includes a long list")
+    relevant_rules: list[str] = Field(description="All the rules used to answer the question (rule numbers only), sorted in alphanumeric order. If one rule ends in a colon indicating a lots of subrules follows, then include all the subrules in the list.")
+
+
+class Verification(BaseModel):
+    is_correct: bool = Field(description="Whether the answer is fully supported by the rules and conversation history (do not include the rules in your answer)")
+    revised_answer: Optional[str] = Field(description="If is_correct is False, provide the corrected answer, omitting the rules. Otherwise, leave as None.")
+    explanation: Optional[str] = Field(description="If is_correct is False, provide an explanation for why the answer is incorrect. Otherwise, leave as None.")
+
+
+class LLMRequest:
+    """One LLM call of the pipeline: what is sent and how the call is logged in llm_calls.
+
+    RagChat builds the requests, so RagChat and AsyncRagChat differ only in how
+    they invoke the client and write the log.
+    """
+    def __init__(
+            self,
+            message_type: str,
+            model: str,
+            prompt: str,
+            config: dict,
+            messages: Optional[list[dict]] = None,
+            response_format: Optional[type[BaseModel]] = None
+        ):
+        self.message_type = message_type
+        self.model = model
+        self.prompt = prompt
+        self.config = config
+        self.messages = messages
+        self.response_format = response_format
+
+    def invoke_kwargs(self) -> dict:
+        """Keyword arguments for `invoke`/`ainvoke`."""
+        return {
+            "messages": self.prompt if self.messages is None else self.messages,
+            "config": {**self.config, "model": self.model},
+            "response_format": self.response_format,
+            "return_usage": True
+        }
+
+    def llm_call(self, message_id: str, response, usage: dict, **kwargs) -> dict:
+        """Keyword arguments for `add_llm_call`."""
+        return {
+            "message_id": message_id,
+            "message_type": self.message_type,
+            "prompt": self.prompt,
+            "response": response,
+            "model": self.model,
+            "usage": usage,
+            **kwargs
+        }
+
 
 class RagChat(BaseModel):
     llm_client: BaseClient
@@ -25,20 +147,30 @@ class RagChat(BaseModel):
     memory_size: int
     default_model: str
     light_model: str
+    speculative: bool = False
+    answer_cache: Optional[AnswerCache] = None
+    history_manager: Optional[HistoryManager] = None
+    _executor: ThreadPoolExecutor = PrivateAttr(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculative")
+    )
 
     class Config:
         arbitrary_types_allowed = True
 
     def __init__(self, 
                  llm_client_type: str,
-                 memory_size: int = 3):
+                 memory_size: int = 3,
+                 speculative: bool = False):
         super().__init__(
             llm_client=get_abstract_client(llm_client_type),
             retriever=Retriever(),
             db_client=DBClient(),
             memory_size=memory_size,
             default_model=CLIENT_MODEL_MAP[llm_client_type]["default"],
-            light_model=CLIENT_MODEL_MAP[llm_client_type]["light"]
+            light_model=CLIENT_MODEL_MAP[llm_client_type]["light"],
+            speculative=speculative,
+            answer_cache=get_answer_cache(),
+            history_manager=get_history_manager()
         )
 
     def answer_question(
@@ -48,43 +180,52 @@ class RagChat(BaseModel):
             retriever_kwargs: dict = {}
         ) -> Union[str, Iterator[str]]:
         """Answers the user's question by deciding whether to retrieve more information or use existing history."""
+        timer = StageTimer()
         # Log the user's question at the start
-        message_id = self.db_client.add_message(
-            conversation_id,
-            "user",
-            query
-        )
+        with timer.stage("add_message"):
+            message_id = self.db_client.add_message(
+                conversation_id,
+                "user",
+                query
+            )
         print(f"message created with message_id: {message_id}")
 
-        conversation_history = self._get_conversation_history(
-            conversation_id, 
-            message_limit=self.memory_size, 
-            system_prompt=False
+        with timer.stage("history"):
+            conversation_history = self._get_conversation_history(
+                conversation_id, 
+                message_limit=self.memory_size, 
+                system_prompt=False
+            )
+        next_step, reworded_query, retrieved_docs = self._get_next_step_and_docs(
+            query,
+            message_id,
+            conversation_history,
+            retriever_kwargs,
+            timer
         )
-        next_step = self._get_next_step(message_id, conversation_history, query)
-        logger.info(f"next_step: '{next_step}' ")
+        cache_key = None
         if next_step.lower() == "retrieve":
-            reworded_query = self._reword_query(
-                query,
-                message_id,
-                conversation_history,
-                light_model=True
-            )
-            logger.info(f"reworded_query: '{reworded_query[0:75]}...'")
-            retrieved_docs = self._get_docs(
-                reworded_query, **retriever_kwargs
-            )
             context = self._prepare_context(retrieved_docs)
             logger.info(f"{len(context['rules'])} raw rules,    {len(context['definitions'])} raw definitions")
+
+            if self._uses_answer_cache(conversation_history):
+                with timer.stage("answer_cache"):
+                    cached_answer, cache_key = self._lookup_cached_answer(reworded_query, retrieved_docs, message_id)
+                if cached_answer is not None:
+                    with timer.stage("add_answer"):
+                        self.db_client.add_message(conversation_id, "assistant", cached_answer)
+                    timer.log()
+                    return cached_answer
             
-            relevant_rules_definitions = self._select_relevant_rules_definitions(
-                reworded_query, 
-                context, 
-                conversation_id,
-                message_id,
-                conversation_history, 
-                light_model=True
-            )
+            with timer.stage("select_rules"):
+                relevant_rules_definitions = self._select_relevant_rules_definitions(
+                    reworded_query, 
+                    context, 
+                    conversation_id,
+                    message_id,
+                    conversation_history, 
+                    light_model=True
+                )
             context = self._filter_context(context, relevant_rules_definitions)
             logger.info(f"{len(context['rules'])} filtered rules, {len(context['definitions'])} filtered definitions")
             
@@ -94,24 +235,153 @@ class RagChat(BaseModel):
             logger.warning(f"Invalid next step: {next_step}")
             context = {}
         
-        answer = self._get_llm_answer(
-            query, 
-            context, 
-            message_id,
-            conversation_history, 
-            light_model=False,
-            verify=True
-        )
+        with timer.stage("answer"):
+            answer = self._get_llm_answer(
+                query, 
+                context, 
+                message_id,
+                conversation_history, 
+                light_model=False,
+                verify=False
+            )
+        with timer.stage("verify"):
+            answer = self._verify_answer(
+                answer,
+                query,
+                message_id,
+                conversation_history,
+                light_model=True
+            )
+        if cache_key is not None:
+            self._cache_answer(cache_key, answer)
 
         # Log the final answer
-        self.db_client.add_message(
-            conversation_id,
-            "assistant",
-            answer
-        )
+        with timer.stage("add_answer"):
+            self.db_client.add_message(
+                conversation_id,
+                "assistant",
+                answer
+            )
+        timer.log()
         
         return answer
 
+    def _window_history(self, conversation_history: list[dict], stage: str) -> list[dict]:
+        """The part of the history that fits the token budget of a stage's prompt."""
+        if self.history_manager is None:
+            return conversation_history
+        return self.history_manager.window(conversation_history, stage)
+
+    def _uses_answer_cache(self, conversation_history: list[dict]) -> bool:
+        """Only questions with no earlier messages are cached, as their answers do not depend on the conversation."""
+        return self.answer_cache is not None and len(conversation_history) <= 1
+
+    def _answer_cache_key(self, reworded_query: str, retrieved_docs: list[dict], query_embedding: list) -> dict:
+        """What a first question is looked up by and its answer stored under.
+
+        The reworded query's embedding (already in the embedding cache from the search),
+        the retrieved document ids and the corpus version they were parsed at.
+        """
+        return {
+            "query": reworded_query,
+            "embedding": query_embedding,
+            "doc_ids": retrieval_key(retrieved_docs),
+            "version": self.retriever.parsed_documents.version
+        }
+
+    def _answer_cache_call(self, message_id: str, cache_key: dict, answer: Optional[str]) -> dict:
+        """llm_calls record of a lookup (message_type "answer_cache", response "hit" or "miss")."""
+        return {
+            "message_id": message_id,
+            "message_type": "answer_cache",
+            "prompt": cache_key["query"],
+            "response": "miss" if answer is None else "hit",
+            "model": ANSWER_CACHE_MODEL,
+            "usage": {}
+        }
+
+    def _lookup_cached_answer(
+            self,
+            reworded_query: str,
+            retrieved_docs: list[dict],
+            message_id: str
+        ) -> tuple[Optional[str], dict]:
+        """Look up a verified answer stored for a similar reworded query and the same retrieved documents.
+
+        Returns:
+            tuple: (cached answer or None, the key to store the new answer under on a miss)
+        """
+        cache_key = self._answer_cache_key(reworded_query, retrieved_docs, self.retriever.create_embedding(reworded_query))
+        answer = self.answer_cache.get(cache_key["embedding"], cache_key["doc_ids"], cache_key["version"])
+        self.db_client.add_llm_call(**self._answer_cache_call(message_id, cache_key, answer))
+        return answer, cache_key
+
+    def _cache_answer(self, cache_key: dict, answer: str) -> None:
+        self.answer_cache.put(cache_key["query"], cache_key["embedding"], cache_key["doc_ids"], answer, cache_key["version"])
+
+    def _get_next_step_and_docs(
+            self,
+            query: str,
+            message_id: str,
+            conversation_history: list[dict],
+            retriever_kwargs: dict,
+            timer: StageTimer
+        ) -> tuple[str, Optional[str], Optional[list]]:
+        """Decide the next step and, if it is RETRIEVE, reword the query and retrieve documents.
+
+        With `speculative=True` the rewording and retrieval run in a worker thread (from
+        a pool shared by the instance's requests) while the next-step classifier runs,
+        taking them off the critical path. If the classifier then says ANSWER the
+        retrieved documents are dropped.
+
+        Returns:
+            tuple: (next_step, reworded_query, retrieved_docs); the last two are None unless next_step is RETRIEVE
+        """
+        if self.speculative:
+            retrieval = self._executor.submit(
+                self._reword_and_retrieve, query, message_id, conversation_history, retriever_kwargs, timer
+            )
+            with timer.stage("next_step"):
+                next_step = self._get_next_step(message_id, conversation_history, query)
+            reworded_query, retrieved_docs = retrieval.result()
+        else:
+            with timer.stage("next_step"):
+                next_step = self._get_next_step(message_id, conversation_history, query)
+            reworded_query, retrieved_docs = None, None
+            if next_step.lower() == "retrieve":
+                reworded_query, retrieved_docs = self._reword_and_retrieve(
+                    query, message_id, conversation_history, retriever_kwargs, timer
+                )
+        logger.info(f"next_step: '{next_step}' ")
+
+        if next_step.lower() != "retrieve":
+            if retrieved_docs is not None:
+                logger.info("Discarding speculative retrieval")
+            return next_step, None, None
+        return next_step, reworded_query, retrieved_docs
+
+    def _reword_and_retrieve(
+            self,
+            query: str,
+            message_id: str,
+            conversation_history: list[dict],
+            retriever_kwargs: dict,
+            timer: StageTimer
+        ) -> tuple[str, list]:
+        with timer.stage("reword"):
+            reworded_query = self._reword_query(
+                query,
+                message_id,
+                conversation_history,
+                light_model=True
+            )
+        logger.info(f"reworded_query: '{reworded_query[0:75]}...'")
+        with timer.stage("retrieve"):
+            retrieved_docs = self._get_docs(
+                reworded_query, **retriever_kwargs
+            )
+        return reworded_query, retrieved_docs
+
     def _get_conversation_history(
             self, 
             conversation_id: str, 
@@ -129,29 +399,13 @@ class RagChat(BaseModel):
         return self.retriever.search(query, **kwargs)
 
     def _prepare_context(self, documents: list[dict]) -> list[dict]:
-        """Prepare context by organizing rules and definitions separately and in order."""
-        # Sort rules by rule number 
-        documents.sort(key=lambda x: x['id'])
-        rules_docs = []
-        definitions_docs = []
-        
-        # Separate rules and definitions
-        for doc in documents:
-            if doc['source'] == 'rules':
-                rules_docs.append(doc)
-            elif doc['source'] == 'glossary':
-                definitions_docs.append(doc)
-        
-        # create dict with keys=rule numbers and values=rule text
-        rules_str = '\n'.join(doc['content'] for doc in rules_docs)
-        rules_dict = self._extract_rules_dict(rules_str)
-        
-        # create dict with keys=term and values=definition
-        definition_dict = {}
-        for doc in definitions_docs:
-            term = doc['content'].split("\n")[0]
-            definition = "\n".join(doc['content'].split("\n")[1:])
-            definition_dict[term] = definition
+        """Prepare context by organizing rules and definitions separately and in order.
+
+        Documents are parsed once by the retriever's parsed-document index, so this
+        only merges their rules and glossary definitions.
+        """
+        parsed_documents = self.retriever.parsed_documents.parse(documents)
+        rules_dict, definition_dict = merge_parsed(parsed_documents)
         context = {
             "rules": rules_dict,
             "definitions": definition_dict
@@ -159,6 +413,76 @@ class RagChat(BaseModel):
         return context
     
 
+    def _model(self, light_model: bool) -> str:
+        return self.light_model if light_model else self.default_model
+
+    def _next_step_request(self, conversation_history: list[dict], query: str) -> LLMRequest:
+        prompt = get_next_step_prompt(self._window_history(conversation_history, "next_step"), query)
+        return LLMRequest("next_step", self.light_model, prompt, {"temperature": 0.1, "max_tokens": 10})
+
+    def _reword_request(self, conversation_history: list[dict], query: str, light_model: bool = True) -> LLMRequest:
+        prompt = get_reword_query_prompt(self._window_history(conversation_history, "reword"), query)
+        return LLMRequest("reword", self._model(light_model), prompt, {"temperature": 0.1, "max_tokens": 100})
+
+    @staticmethod
+    def _parse_reword(query: str, response: str) -> str:
+        """The reworded query, or the query itself when the model says no rewording is needed."""
+        if response.lower() == "none":
+            return query
+        logger.debug(f"reworded_query: {response}")
+        return response
+
+    def _select_rules_request(
+            self,
+            query: str,
+            conversation_history: list[dict],
+            context: dict,
+            light_model: bool = True
+        ) -> LLMRequest:
+        prompt = get_relevant_rules_definitions_prompt(query, self._window_history(conversation_history, "select_rules"), context)
+        return LLMRequest(
+            "select_rules", self._model(light_model), prompt, {"temperature": 0.1, "max_tokens": 1000},
+            response_format=RulesDefinitions
+        )
+
+    def _answer_request(
+            self,
+            query: str,
+            context: dict,
+            conversation_history: list[dict],
+            light_model: bool = False,
+            stream: bool = False
+        ) -> LLMRequest:
+        """The answer request; a streamed answer is asked for as plain text (FORMAT_PROMPT) instead of an Answer."""
+        response_format = None if stream else Answer
+        prompt = get_rag_prompt(query, context, self._window_history(conversation_history, "answer"), response_format=response_format)
+        messages = [
+            {"role": "system", "content": RAG_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        config = {"temperature": 0.2, "max_tokens": 1000}
+        if stream:
+            config["stream"] = True
+        return LLMRequest("answer", self._model(light_model), prompt, config, messages=messages, response_format=response_format)
+
+    def _verify_request(
+            self,
+            query: str,
+            answer_with_rules: str,
+            conversation_history: list[dict],
+            light_model: bool = True
+        ) -> LLMRequest:
+        # Remove the last message from conversation history
+        if len(conversation_history) > 1:
+            conversation_history = conversation_history[:-1]
+        else:
+            conversation_history = []
+        prompt = get_verify_answer_prompt(query, answer_with_rules, self._window_history(conversation_history, "verify"))
+        return LLMRequest(
+            "verify", self._model(light_model), prompt, {"temperature": 0.1, "max_tokens": 1000},
+            response_format=Verification
+        )
+
     def _get_next_step(
             self,
             message_id: str,
@@ -166,22 +490,9 @@ class RagChat(BaseModel):
             query: str
         ) -> str:
         """Get the next step for the conversation."""
-        prompt = get_next_step_prompt(conversation_history, query)
-        response, usage = self.llm_client.invoke(
-            prompt, 
-            config={"model": self.light_model, "temperature": 0.1, "max_tokens": 10},
-            return_usage=True
-        )
-
-        # Log LLM call
-        self.db_client.add_llm_call(
-            message_id=message_id,
-            message_type="next_step",
-            prompt=prompt,
-            response=response,
-            model=self.light_model,
-            usage=usage
-        )
+        request = self._next_step_request(conversation_history, query)
+        response, usage = self.llm_client.invoke(**request.invoke_kwargs())
+        self.db_client.add_llm_call(**request.llm_call(message_id, response, usage))
         return response.lower()
 
     def _reword_query(
@@ -192,28 +503,10 @@ class RagChat(BaseModel):
             light_model: bool = True
         ) -> str:
         """Reword the query if needed."""
-        model = self.light_model if light_model else self.default_model
-        prompt = get_reword_query_prompt(conversation_history, query)
-        response, usage = self.llm_client.invoke(
-            prompt, 
-            config={"model": model, "temperature": 0.1, "max_tokens": 100},
-            return_usage=True
-        )
-
-        if response.lower() == "none":
-            reworded_query = query
-        else:
-            logger.debug(f"reworded_query: {response}")
-            reworded_query = response
-
-        self.db_client.add_llm_call(
-            message_id=message_id,
-            message_type="reword",
-            prompt=prompt,
-            response=reworded_query,
-            model=model,
-            usage=usage
-        )
+        request = self._reword_request(conversation_history, query, light_model)
+        response, usage = self.llm_client.invoke(**request.invoke_kwargs())
+        reworded_query = self._parse_reword(query, response)
+        self.db_client.add_llm_call(**request.llm_call(message_id, reworded_query, usage))
         return reworded_query
     
     def _select_relevant_rules_definitions(
@@ -226,66 +519,16 @@ class RagChat(BaseModel):
             light_model: bool = True
         ) -> list[str]:
         """Select relevant rules based on the query."""
-        model = self.light_model if light_model else self.default_model
-        prompt = get_relevant_rules_definitions_prompt(query, conversation_history, context)
-
-        class RulesDefinitions(BaseModel):
-            rules: list[str] = Field(description="The relevant rules (rule numbers only) that are needed to answer the current question.")
-            definitions: list[str] = Field(description="The relevant definitions (term names only) that are needed to answer the current question.")
-
-        relevant_rules_definitions, usage = self.llm_client.invoke(
-            prompt, 
-            config={"temperature": 0.1, "max_tokens": 1000, "model": model},
-            return_usage=True, 
-            response_format=RulesDefinitions
-        )
-
-        self.db_client.add_llm_call(
-            message_id=message_id,
-            message_type="select_rules",
-            prompt=prompt,
-            response=repr(relevant_rules_definitions),
-            model=model,
-            usage=usage
-        )
-        
+        request = self._select_rules_request(query, conversation_history, context, light_model)
+        relevant_rules_definitions, usage = self.llm_client.invoke(**request.invoke_kwargs())
+        self.db_client.add_llm_call(**request.llm_call(message_id, repr(relevant_rules_definitions), usage))
         return relevant_rules_definitions.model_dump()
     
     def _extract_rules_dict(self, rules_text: str) -> dict[str, str]:
         """
         Convert rules text into a dictionary with rule numbers as keys and rule text as values.
         """
-        # Split on section headers (e.g., "Appendix B: Misconduct System")
-        sections = re.split(r'\n\n[A-Z][a-z]+(?:\s+[A-Z])?[^:]*:', rules_text)
-        
-        # Use only the first section (before any appendix/section headers)
-        rules_text = sections[0]
-        
-        # Rest of the existing code...
-        pattern = r"\n\b([A-Z]?\d+(?:\.[A-Z]+)?(?:\.\d+)?(?:\.[a-z])?(?:\.\d+)?(?:\.\d+)?\.)"
-        chunks = re.split(pattern, rules_text)
-        
-        # Create dictionary of rules
-        rules_dict = {}
-        for i in range(1, len(chunks)-1, 2):
-            rule_num = chunks[i].rstrip('.')  # Remove trailing dot
-            rule_body = chunks[i+1].strip()
-            rules_dict[rule_num] = rule_body
-        
-        # Sort dictionary by rule number, handling all rule types
-        def sort_key(rule_num):
-            # Split into components
-            parts = re.split(r'([A-Z]+|\d+)', rule_num)
-            # Convert to comparable values (empty string for missing appendix letter)
-            parts = [p for p in parts if p and p != '.']
-            # Ensure appendix letter sorts after regular rules
-            if parts[0].isalpha():
-                return [parts[0]] + [int(p) if p.isdigit() else p for p in parts[1:]]
-            return [''] + [int(p) if p.isdigit() else p for p in parts]
-        
-        sorted_rules = dict(sorted(rules_dict.items(), key=lambda x: sort_key(x[0])))
-        
-        return sorted_rules
+        return sort_rules(split_rules(rules_text)[1])
     
 
     def _get_llm_answer(
@@ -298,48 +541,13 @@ class RagChat(BaseModel):
             verify: bool = True
         ) -> str:
         """Get answer to question from llm."""
-
-        model = self.light_model if light_model else self.default_model
         logger.debug(f"Getting answer with LLM for query: {query}")     
-
-        class Answer(BaseModel):
-            answer: str = Field(description="The answer to the question. It should be concise, preferably in one sentence. Exceptions are allowed if the answer includes a long list")
-            relevant_rules: list[str] = Field(description="All the rules used to answer the question (rule numbers only), sorted in alphanumeric order. If one rule ends in a colon indicating a lots of subrules follows, then include all the subrules in the list.")
-        prompt = get_rag_prompt(query, context, conversation_history, response_format=Answer)
-        messages = [
-            {"role": "system", "content": RAG_SYSTEM_PROMPT},
-            {"role": "user", "content": prompt}
-        ]
-        response, usage = self.llm_client.invoke(
-            messages=messages,
-            config={"temperature": 0.2, "max_tokens": 1000, "model": model},
-            response_format=Answer,
-            return_usage=True
-        )
-        # logger.info(f"raw answer: '{response.answer}'")
-        # Format answer with rules loaded from context
-        try:
-            answer = response.answer
-            if len(response.relevant_rules) > 0 and "rules" in context:
-                rules_list_str = self._extract_rules_list(response.relevant_rules, context["rules"])
-                if len(rules_list_str) > 0:
-                    answer += f"\n\n**Relevant rules:**\n\n{rules_list_str}" 
-        except Exception as e:
-            logger.error(f"Error formatting answer: {e}")
-            logger.error(f"Using plain response: {response}")
-            import traceback
-            traceback.print_exc()
-            answer = response
+        request = self._answer_request(query, context, conversation_history, light_model)
+        response, usage = self.llm_client.invoke(**request.invoke_kwargs())
+        answer = self._format_answer(response, context)
 
         logger.debug(f"Saving initial LLM response to DB")
-        self.db_client.add_llm_call(
-            message_id=message_id,
-            message_type="answer",
-            prompt=prompt,
-            response=repr(response),
-            model=model,
-            usage=usage
-        )
+        self.db_client.add_llm_call(**request.llm_call(message_id, repr(response), usage))
 
         if verify:
             answer = self._verify_answer(
@@ -351,6 +559,21 @@ class RagChat(BaseModel):
             )
         return answer
 
+    def _format_answer(self, response: Answer, context: dict) -> str:
+        """Append the full text of the relevant rules (loaded from context) to the answer."""
+        try:
+            answer = response.answer
+            if len(response.relevant_rules) > 0 and "rules" in context:
+                rules_list_str = self._extract_rules_list(response.relevant_rules, context["rules"])
+                if len(rules_list_str) > 0:
+                    answer += f"{RELEVANT_RULES_HEADER}{rules_list_str}" 
+        except Exception as e:
+            logger.error(f"Error formatting answer: {e}")
+            logger.error(f"Using plain response: {response}")
+            import traceback
+            traceback.print_exc()
+            answer = response
+        return answer
     
     def _verify_answer(
             self,
@@ -361,54 +584,28 @@ class RagChat(BaseModel):
             light_model: bool = True
         ) -> str:
         """Verify that the answer is supported by the rules and conversation history."""
-        model = self.light_model if light_model else self.default_model
+        request = self._verify_request(query, answer_with_rules, conversation_history, light_model)
+        response, usage = self.llm_client.invoke(**request.invoke_kwargs())
+        logger.info(f"raw verification response:\n{repr(response)}")
+        verified_answer_with_rules = self._apply_verification(response, answer_with_rules)
+        self.db_client.add_llm_call(**request.llm_call(message_id, repr(response), usage))
+        return verified_answer_with_rules
 
-        if "\n\n**Relevant rules:**\n\n" in answer_with_rules:
-            rules = answer_with_rules.split("\n\n**Relevant rules:**\n\n")[1]
+    def _apply_verification(self, response: Verification, answer_with_rules: str) -> str:
+        """If the answer is not supported, replace it with the revised answer and re-insert the rules."""
+        if RELEVANT_RULES_HEADER in answer_with_rules:
+            rules = answer_with_rules.split(RELEVANT_RULES_HEADER)[1]
         else:
             rules = None
 
-        class Verification(BaseModel):
-            is_correct: bool = Field(description="Whether the answer is fully supported by the rules and conversation history (do not include the rules in your answer)")
-            revised_answer: Optional[str] = Field(description="If is_correct is False, provide the corrected answer, omitting the rules. Otherwise, leave as None.")
-            explanation: Optional[str] = Field(description="If is_correct is False, provide an explanation for why the answer is incorrect. Otherwise, leave as None.")
-
-        # Remove the last message from conversation history
-        if len(conversation_history) > 1:
-            conversation_history = conversation_history[:-1]
-        else:
-            conversation_history = []
-
-        prompt = get_verify_answer_prompt(query, answer_with_rules, conversation_history)
-
-        response, usage = self.llm_client.invoke(
-            prompt,
-            config={"temperature": 0.1, "max_tokens": 1000, "model": model},
-            response_format=Verification,
-            return_usage=True,
-        )
-        logger.info(f"raw verification response:\n{repr(response)}")
-
-        # If the answer is not supported, revise it and insert the rules
         if not response.is_correct:
             logger.info(f"Revised answer: {response.revised_answer}")
             verified_answer_with_rules = response.revised_answer
             if rules:
-                verified_answer_with_rules += f"\n\n**Relevant rules:**\n\n{rules}"
+                verified_answer_with_rules += f"{RELEVANT_RULES_HEADER}{rules}"
         else:
             logger.info(f"Original answer verified")
             verified_answer_with_rules = answer_with_rules
-
-        # Then log the LLM call with the message_id
-        self.db_client.add_llm_call(
-            message_id=message_id,
-            message_type="verify",
-            prompt=prompt,
-            response=repr(response),
-            model=model,
-            usage=usage
-        )
-
         return verified_answer_with_rules
 
     def _extract_rules_list(self, rule_numbers: list[str], rules_dict: dict[str, str]) -> dict[str, str]:
@@ -478,17 +675,8 @@ class RagChat(BaseModel):
         return conversation_id
 
     def calculate_conversation_cost(self, conversation_id):
-        """Calculate the total cost of a conversation by summing all LLM call costs."""
-        sql_query = """
-        SELECT COALESCE(SUM(cost), 0) as total_cost
-        FROM llm_calls
-        WHERE message_id IN (
-            SELECT id FROM messages WHERE conversation_id = %s
-        )
-        """
-        args = (conversation_id,)
-        response = self.db_client.query_db_sql(sql_query, args)
-        return response[0]['total_cost'] if response else 0
+        """Calculate the total cost of a conversation from its per-conversation cost aggregate."""
+        return self.db_client.calculate_conversation_cost(conversation_id)
 
 
 if __name__ == "__main__":
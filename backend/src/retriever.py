@@ -3,38 +3,104 @@ load_dotenv()
 
 import os
 import psycopg2
-from pgvector.psycopg2 import register_vector
 import logging
 from openai import OpenAI
 import json
 import re
+import numpy as np
+from .db_pool import get_db_pool, get_db_settings
+from .embedding_cache import EmbeddingCache, get_embedding_cache
+from .vector_index import VectorIndex, get_vector_index
+from .parsed_documents import get_parsed_document_index, find_rule_references
+from .fusion import FusionCandidates, fuse
 
 logger = logging.getLogger(__name__)
 
 # FTS_JOIN_OPERATOR = " & "
 FTS_JOIN_OPERATOR = " | "
+EMBEDDING_MODEL = "text-embedding-3-small"
+# "postgres" ranks embeddings in the database, "memory" in an in-process VectorIndex
+DEFAULT_RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "postgres")
+# Candidates per side for hybrid_search_indexed; 0 uses the exhaustive hybrid_search function
+DEFAULT_HYBRID_CANDIDATES = int(os.getenv("HYBRID_SEARCH_CANDIDATES", 100))
+# Neighbors of each retrieved rules document by position in the rulebook (chunk_index),
+# as (hit id, id, content, chunk_index). Ids are not in rulebook order after incremental loads.
+EXPANSION_SQL = """
+    SELECT d.id, n.id, n.content, n.chunk_index
+    FROM documents d
+    JOIN documents n ON n.source = d.source
+        AND n.chunk_index BETWEEN d.chunk_index - %(size)s AND d.chunk_index + %(size)s
+    WHERE d.id = ANY(%(ids)s) AND d.source = 'rules'
+    ORDER BY n.chunk_index
+"""
+# A search function call ({search}) and the neighbors of its rules hits in one statement:
+# hits come first in rank order (hit_rank), then EXPANSION_SQL-shaped neighbor rows by chunk_index
+EXPANDED_SEARCH_SQL = """
+    WITH hits AS (
+        SELECT * FROM {search} WITH ORDINALITY AS s(id, content, context, source, score, hit_rank)
+    )
+    SELECT hit_rank, id, content, context, source, score, NULL::INTEGER AS hit_id, NULL::INTEGER AS chunk_index
+    FROM hits
+    UNION ALL
+    SELECT NULL, n.id, n.content, n.context, n.source, NULL, d.id, n.chunk_index
+    FROM hits h
+    JOIN documents d ON d.id = h.id AND d.source = 'rules'
+    CROSS JOIN generate_series(d.chunk_index - %s, d.chunk_index + %s) AS position
+    JOIN documents n ON n.source = d.source AND n.chunk_index = position
+    ORDER BY hit_rank NULLS LAST, chunk_index
+"""
 
 class Retriever:
-    def __init__(self):
+    def __init__(
+            self,
+            embedding_cache: EmbeddingCache|None = None,
+            backend: str = DEFAULT_RETRIEVAL_BACKEND,
+            hybrid_candidates: int = DEFAULT_HYBRID_CANDIDATES,
+            vector_index: VectorIndex|None = None
+        ):
         self.client = OpenAI()
-        self.db_settings = {
-            "dbname": os.getenv('POSTGRES_DB'),
-            "user": os.getenv('POSTGRES_USER'),
-            "password": os.getenv('POSTGRES_PASSWORD'),
-            "host": os.getenv('POSTGRES_HOST'),
-            "port": os.getenv('POSTGRES_PORT')
-        }
+        self.db_settings = get_db_settings()
+        self.hybrid_candidates = hybrid_candidates
+        self.embedding_cache = embedding_cache if embedding_cache is not None else get_embedding_cache()
+        self.parsed_documents = get_parsed_document_index(self.db_settings)
+        backend = backend.lower()
+        if vector_index is not None:
+            # e.g. VectorIndex.from_artifacts for offline evals
+            self.vector_index: VectorIndex|None = vector_index
+        elif backend == "memory":
+            self.vector_index: VectorIndex|None = get_vector_index(self.db_settings)
+        elif backend == "postgres":
+            self.vector_index = None
+        else:
+            raise ValueError(f"Invalid retrieval backend: {backend}. Must be one of: 'postgres', 'memory'")
 
     def create_embedding(self, text):
-        logger.debug("creating embedding...", end="\r")
-        response = self.client.embeddings.create(input=text, model="text-embedding-3-small")
-        return response.data[0].embedding
+        embedding = self.embedding_cache.get(text, EMBEDDING_MODEL)
+        if embedding is not None:
+            return embedding
+        logger.debug("creating embedding...")
+        response = self.client.embeddings.create(input=text, model=EMBEDDING_MODEL)
+        embedding = response.data[0].embedding
+        self.embedding_cache.put(text, EMBEDDING_MODEL, embedding)
+        return embedding
+
+    def create_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """Embed several texts with a single embeddings request; cached texts are not sent."""
+        embeddings = [self.embedding_cache.get(text, EMBEDDING_MODEL) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            logger.debug(f"creating {len(missing)} embeddings...")
+            response = self.client.embeddings.create(input=[texts[i] for i in missing], model=EMBEDDING_MODEL)
+            for i, item in zip(missing, response.data):
+                embeddings[i] = item.embedding
+                self.embedding_cache.put(texts[i], EMBEDDING_MODEL, item.embedding)
+        return embeddings
 
 
     def query_db_sql(self, sql_query, args):
         try:
-            with psycopg2.connect(**self.db_settings) as conn:
-                register_vector(conn)  # Register the VECTOR type
+            # pgvector is registered once per pooled connection
+            with get_db_pool(self.db_settings).connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute(sql_query, args)
                     return cursor.fetchall()
@@ -52,11 +118,16 @@ class Retriever:
         k: int = 60,
         semantic_weight: float = 0.5,
         fts_weight: float = 0.5,
-        query_embedding: list|None = None
+        query_embedding: list|None = None,
+        fusion: str|None = None,
+        rule_lookup: bool = True
     ) -> list[dict]:
         """
         General search method that dispatches to specific search types.
 
+        Queries naming rule numbers (e.g. "what is rule 10.H?") are answered from the
+        rule-number index without an embedding or a search, when every named rule exists.
+
         Args:
             query (str): The search query
             search_type (str): Type of search to perform. One of:
@@ -71,6 +142,9 @@ class Retriever:
             fts_weight (float, optional): Weight for full-text results in hybrid search. Defaults to 0.5.
             query_embedding (list|None, optional): Pre-computed query embedding. If None, 
                 embedding will be computed. Defaults to None.
+            fusion (str|None, optional): Fuse hybrid results in Python with this method ("rrf",
+                "weighted_sum" or "combmnz", see fusion.py) instead of the SQL function. Defaults to None.
+            rule_lookup (bool, optional): Use the rule-number fast path. Defaults to True.
 
         Returns:
             list[dict]: List of documents matching the search criteria
@@ -80,26 +154,254 @@ class Retriever:
         """
         search_type = search_type.lower()
 
+        if rule_lookup:
+            retrieved_docs = self._rule_lookup(query)
+            if retrieved_docs is not None:
+                expansion_size = self._get_expansion_size(expand_context)
+                if expansion_size > 0:
+                    retrieved_docs = self.get_expanded_context(retrieved_docs, expansion_size)
+                return retrieved_docs
+
+        if search_type == "hybrid" and fusion is not None:
+            return self.search_many(
+                [query], search_type=search_type, limit=limit, expand_context=expand_context,
+                fts_operator=fts_operator, k=k, semantic_weight=semantic_weight, fts_weight=fts_weight,
+                query_embeddings=[query_embedding], fusion=fusion
+            )[0]
+
+        if search_type not in ["semantic", "fts", "hybrid"]:
+            raise ValueError(f"Invalid search_type: {search_type}. Must be one of: 'semantic', 'fts', or 'hybrid'")
+
+        expansion_size = self._get_expansion_size(expand_context)
+        if expansion_size > 0 and self.vector_index is None:
+            # Search and expansion in one round trip
+            if search_type != "fts" and query_embedding is None:
+                query_embedding = self.create_embedding(query)
+            sql_query, args = self._expanded_search_sql(
+                search_type, query, limit, expansion_size, fts_operator, k, semantic_weight, fts_weight,
+                query_embedding, "%s::VECTOR"
+            )
+            return self._merge_expanded_rows(self.query_db_sql(sql_query, args))
+
         if search_type == "semantic":
             retrieved_docs = self.similarity_search(query=query, limit=limit, query_embedding=query_embedding)
         elif search_type == "fts":
             retrieved_docs = self.fts_search(query=query, limit=limit, fts_operator=fts_operator)
-        elif search_type == "hybrid":
+        else:
             retrieved_docs = self.hybrid_search(
                 query=query, limit=limit, fts_operator=fts_operator, 
                 k=k, semantic_weight=semantic_weight, fts_weight=fts_weight,
                 query_embedding=query_embedding
             )
-        else:
-            raise ValueError(f"Invalid search_type: {search_type}. Must be one of: 'semantic', 'fts', or 'hybrid'")
 
-        retrieved_docs = [{"id":doc[0], "content":doc[1], "source":doc[3]} for doc in retrieved_docs]
+        retrieved_docs = self._format_docs(retrieved_docs)
 
-        if expand_context is True or (isinstance(expand_context, int) and expand_context > 0):
-            expansion_size = 1 if expand_context is True else expand_context
+        if expansion_size > 0:
             retrieved_docs = self.get_expanded_context(retrieved_docs, expansion_size)
         
         return retrieved_docs
+
+    def search_many(self,
+        queries: list[str],
+        search_type: str = "hybrid",
+        limit: int = 3,
+        expand_context: bool|int = False,
+        fts_operator: str = "OR",
+        k: int = 60,
+        semantic_weight: float = 0.5,
+        fts_weight: float = 0.5,
+        query_embeddings: list|None = None,
+        fusion: str|None = None
+    ) -> list[list[dict]]:
+        """
+        Run `search` for several queries at once.
+
+        Missing query embeddings are created with one embeddings request, all queries
+        are scored with one SQL statement (or one matrix-matrix product with the
+        in-memory backend) and context expansion fetches the adjacent documents of
+        every query together.
+
+        Args:
+            queries (list[str]): The search queries
+            query_embeddings (list|None, optional): Pre-computed embeddings, one per query
+                (entries may be None). Defaults to None.
+            The other arguments are the same as for `search`.
+
+        Returns:
+            list[list[dict]]: The documents retrieved for each query, in query order
+        """
+        search_type = search_type.lower()
+        if search_type not in ["semantic", "fts", "hybrid"]:
+            raise ValueError(f"Invalid search_type: {search_type}. Must be one of: 'semantic', 'fts', or 'hybrid'")
+        if not queries:
+            return []
+
+        rows_per_query = self._search_many_rows(
+            queries, search_type, limit, fts_operator, k, semantic_weight, fts_weight, query_embeddings, fusion
+        )
+        results = [self._format_docs(rows) for rows in rows_per_query]
+
+        expansion_size = self._get_expansion_size(expand_context)
+        if expansion_size > 0:
+            results = self.get_expanded_context_many(results, expansion_size)
+        return results
+
+    def _search_many_rows(
+            self,
+            queries: list[str],
+            search_type: str,
+            limit: int,
+            fts_operator: str,
+            k: int,
+            semantic_weight: float,
+            fts_weight: float,
+            query_embeddings: list|None,
+            fusion: str|None = None
+        ) -> list[list[tuple]]:
+        """Raw (id, content, context, source, score) rows of every query, before formatting and expansion."""
+        if search_type != "fts":
+            query_embeddings = self._fill_query_embeddings(queries, query_embeddings)
+
+        if search_type == "hybrid" and fusion is not None:
+            candidates = self.get_fusion_candidates(
+                queries, max(self.hybrid_candidates or 100, limit), fts_operator, query_embeddings
+            )
+            return fuse(candidates, fusion, limit, k, semantic_weight, fts_weight)
+
+        if self.vector_index is not None and search_type == "semantic":
+            return self.vector_index.similarity_search_many(query_embeddings, limit)
+        if self.vector_index is not None and search_type == "hybrid":
+            sql_query, args = self._search_many_sql("fts", queries, None, len(self.vector_index), fts_operator)
+            fts_rows_per_query = self._group_rows_by_query(self.query_db_sql(sql_query, args), len(queries))
+            return self.vector_index.hybrid_search_many(
+                query_embeddings, fts_rows_per_query, limit, k, semantic_weight, fts_weight
+            )
+
+        sql_query, args = self._search_many_sql(
+            search_type, queries, query_embeddings, limit, fts_operator, k, semantic_weight, fts_weight
+        )
+        return self._group_rows_by_query(self.query_db_sql(sql_query, args), len(queries))
+
+    def get_fusion_candidates(
+            self,
+            queries: list[str],
+            candidate_num: int = 100,
+            fts_operator: str = "OR",
+            query_embeddings: list|None = None
+        ) -> FusionCandidates:
+        """
+        Fetch the top `candidate_num` semantic and full-text results of every query once.
+
+        The returned candidates can be fused repeatedly with `fusion.fuse` (any method,
+        k or weights) without going back to the database.
+        """
+        query_embeddings = self._fill_query_embeddings(queries, query_embeddings)
+        if self.vector_index is not None:
+            semantic_rows = self.vector_index.similarity_search_many(query_embeddings, candidate_num)
+        else:
+            sql_query, args = self._search_many_sql("semantic", queries, query_embeddings, candidate_num)
+            semantic_rows = self._group_rows_by_query(self.query_db_sql(sql_query, args), len(queries))
+        sql_query, args = self._search_many_sql("fts", queries, None, candidate_num, fts_operator)
+        fts_rows = self._group_rows_by_query(self.query_db_sql(sql_query, args), len(queries))
+        return FusionCandidates(semantic_rows, fts_rows)
+
+    def _fill_query_embeddings(self, queries: list[str], query_embeddings: list|None) -> list:
+        """Return one float32 embedding per query, embedding the ones not provided in a single request."""
+        query_embeddings = list(query_embeddings) if query_embeddings is not None else [None] * len(queries)
+        missing = [i for i, embedding in enumerate(query_embeddings) if embedding is None]
+        if missing:
+            for i, embedding in zip(missing, self.create_embeddings([queries[i] for i in missing])):
+                query_embeddings[i] = embedding
+        return [np.asarray(embedding, dtype=np.float32) for embedding in query_embeddings]
+
+    def _search_many_sql(
+            self,
+            search_type: str,
+            queries: list[str],
+            query_embeddings: list|None,
+            limit: int,
+            fts_operator: str = "OR",
+            k: int = 60,
+            semantic_weight: float = 0.5,
+            fts_weight: float = 0.5
+        ) -> tuple[str, tuple]:
+        """One statement that runs the search function for every query via unnest ... WITH ORDINALITY and LATERAL.
+
+        Rows come back as (query_idx, id, content, context, source, score), query_idx starting at 1.
+        """
+        if search_type == "semantic":
+            sql_query = """
+            SELECT q.query_idx, s.*
+            FROM unnest(%s::VECTOR[]) WITH ORDINALITY AS q(query_embedding, query_idx)
+            CROSS JOIN LATERAL similarity_search(q.query_embedding, %s) AS s
+            ORDER BY q.query_idx, s.similarity DESC;"""
+            args = (list(query_embeddings), limit)
+        elif search_type == "fts":
+            sql_query = """
+            SELECT q.query_idx, s.*
+            FROM unnest(%s::TEXT[]) WITH ORDINALITY AS q(query_text, query_idx)
+            CROSS JOIN LATERAL fts_search(q.query_text, %s) AS s
+            ORDER BY q.query_idx, s.rank DESC;"""
+            args = ([self._process_fts_query(query, fts_operator) for query in queries], limit)
+        else:
+            sql_query = """
+            SELECT q.query_idx, s.*
+            FROM unnest(%s::TEXT[], %s::VECTOR[]) WITH ORDINALITY AS q(query_text, query_embedding, query_idx)
+            CROSS JOIN LATERAL {hybrid_search} AS s
+            ORDER BY q.query_idx, s.rrf_score DESC;""".format(
+                hybrid_search=self._hybrid_search_call("q.query_text", "q.query_embedding")
+            )
+            args = (
+                [self._process_fts_query(query, fts_operator) for query in queries],
+                list(query_embeddings),
+                *self._hybrid_search_args(limit, k, semantic_weight, fts_weight)
+            )
+        return sql_query, args
+
+    def _group_rows_by_query(self, rows: list[tuple], n_queries: int) -> list[list[tuple]]:
+        """Split (query_idx, ...) rows into one list of rows per query."""
+        grouped = [[] for _ in range(n_queries)]
+        for row in rows:
+            grouped[row[0] - 1].append(tuple(row[1:]))
+        return grouped
+
+    def _rule_lookup(self, query: str) -> list[dict]|None:
+        """
+        The documents holding the rules a query names, in rulebook order (see `parsed_documents.document_order`).
+
+        Returns None if the query names no rule or a rule that is not in the index,
+        in which case the query goes through the regular search.
+        """
+        rule_numbers = find_rule_references(query)
+        if not rule_numbers:
+            return None
+        documents = self.parsed_documents.lookup_rules(rule_numbers)
+        if not documents:
+            return None
+        logger.info(f"Rule lookup for {', '.join(rule_numbers)}: {len(documents)} documents")
+        return [{"id": doc_id, "content": parsed.content, "source": parsed.source} for doc_id, parsed in documents]
+
+    def _format_docs(self, rows: list[tuple]) -> list[dict]:
+        """Convert (id, content, context, source, score) rows into document dicts."""
+        return [{"id":doc[0], "content":doc[1], "source":doc[3]} for doc in rows]
+
+    def _get_expansion_size(self, expand_context: bool|int) -> int:
+        """Number of adjacent documents to add on each side of a hit (0 disables expansion)."""
+        if expand_context is True:
+            return 1
+        if isinstance(expand_context, int) and expand_context > 0:
+            return expand_context
+        return 0
+
+    def _process_fts_query(self, query: str, fts_operator: str) -> str:
+        """Convert a free-text query into a tsquery string joined by the given operator."""
+        if fts_operator.upper() not in ["OR", "AND"]:
+            raise ValueError(f"Invalid fts_operator: {fts_operator}. Must be one of: 'OR', 'AND'")
+        internal_operator = "&" if fts_operator.upper() == "AND" else "|"
+        
+        # Clean and process the query for full-text search
+        cleaned_query = re.sub(r'[^\w\s]', ' ', query)
+        return f" {internal_operator} ".join(word for word in cleaned_query.split() if word.isalnum())
     
 
     def similarity_search(
@@ -125,8 +427,10 @@ class Retriever:
         """
         if query_embedding is None:
             query_embedding = self.create_embedding(query)
-        sql_query = "SELECT * FROM similarity_search(%s::VECTOR, %s);"
-        retrieved_docs = self.query_db_sql(sql_query, (query_embedding, limit))
+        if self.vector_index is not None:
+            return self.vector_index.similarity_search(query_embedding, limit)
+        search_call, args = self._search_call("semantic", query, limit, query_embedding=query_embedding)
+        retrieved_docs = self.query_db_sql(f"SELECT * FROM {search_call};", args)
         
         return retrieved_docs
     
@@ -147,16 +451,8 @@ class Retriever:
         Returns:
             list[dict]: List of documents matching the search criteria
         """
-        if fts_operator.upper() not in ["OR", "AND"]:
-            raise ValueError(f"Invalid fts_operator: {fts_operator}. Must be one of: 'OR', 'AND'")
-        internal_operator = "&" if fts_operator.upper() == "AND" else "|"
-        
-        # Clean and process the query for full-text search
-        cleaned_query = re.sub(r'[^\w\s]', ' ', query)
-        processed_query = f" {internal_operator} ".join(word for word in cleaned_query.split() if word.isalnum())
-
-        sql_query = "SELECT * FROM fts_search(%s, %s);"
-        retrieved_docs = self.query_db_sql(sql_query, (processed_query, limit))
+        search_call, args = self._search_call("fts", query, limit, fts_operator)
+        retrieved_docs = self.query_db_sql(f"SELECT * FROM {search_call};", args)
         
         return retrieved_docs
 
@@ -187,32 +483,91 @@ class Retriever:
         Returns:
             list[dict]: List of documents matching the hybrid search criteria
         """
-        # Convert operator to internal representation
-        if fts_operator.upper() not in ["OR", "AND"]:
-            raise ValueError(f"Invalid fts_operator: {fts_operator}. Must be one of: 'OR', 'AND'")
-        internal_operator = "&" if fts_operator.upper() == "AND" else "|"
-        
-        # Convert the query to a format suitable for full-text search
-        cleaned_query = re.sub(r'[^\w\s]', ' ', query)
-        processed_query = f" {internal_operator} ".join(word for word in cleaned_query.split() if word.isalnum())
-    
         if query_embedding is None:
             query_embedding = self.create_embedding(query)
+
+        if self.vector_index is not None:
+            # Rank every document by text match, then fuse with the in-memory vector ranking
+            fts_rows = self.fts_search(query=query, limit=len(self.vector_index), fts_operator=fts_operator)
+            return self.vector_index.hybrid_search(
+                query_embedding, fts_rows, limit, k, semantic_weight, fts_weight
+            )
     
-        sql_query = "SELECT * FROM hybrid_search(%s, %s::VECTOR, %s, %s, %s, %s);"
-        args = (processed_query, query_embedding, limit, k, semantic_weight, fts_weight)
-        retrieved_docs = self.query_db_sql(sql_query, args)
+        search_call, args = self._search_call(
+            "hybrid", query, limit, fts_operator, k, semantic_weight, fts_weight, query_embedding
+        )
+        retrieved_docs = self.query_db_sql(f"SELECT * FROM {search_call};", args)
         
         return retrieved_docs
     
 
+    def _search_call(
+            self,
+            search_type: str,
+            query: str,
+            limit: int,
+            fts_operator: str = "OR",
+            k: int = 60,
+            semantic_weight: float = 0.5,
+            fts_weight: float = 0.5,
+            query_embedding=None,
+            embedding_arg: str = "%s::VECTOR"
+        ) -> tuple[str, tuple]:
+        """SQL call of the search function for `search_type` and its arguments."""
+        if search_type == "semantic":
+            return f"similarity_search({embedding_arg}, %s)", (query_embedding, limit)
+        processed_query = self._process_fts_query(query, fts_operator)
+        if search_type == "fts":
+            return "fts_search(%s, %s)", (processed_query, limit)
+        return (
+            self._hybrid_search_call("%s", embedding_arg),
+            (processed_query, query_embedding, *self._hybrid_search_args(limit, k, semantic_weight, fts_weight))
+        )
+
+    def _expanded_search_sql(
+            self,
+            search_type: str,
+            query: str,
+            limit: int,
+            expansion_size: int,
+            fts_operator: str,
+            k: int,
+            semantic_weight: float,
+            fts_weight: float,
+            query_embedding,
+            embedding_arg: str
+        ) -> tuple[str, tuple]:
+        """EXPANDED_SEARCH_SQL around the search function call, with its arguments."""
+        search_call, args = self._search_call(
+            search_type, query, limit, fts_operator, k, semantic_weight, fts_weight, query_embedding, embedding_arg
+        )
+        return EXPANDED_SEARCH_SQL.format(search=search_call), (*args, expansion_size, expansion_size)
+
+    def _merge_expanded_rows(self, rows: list[tuple]) -> list[dict]:
+        """Split EXPANDED_SEARCH_SQL rows into the hits and their neighbors, and merge them."""
+        hits = [row[1:6] for row in rows if row[0] is not None]
+        adjacent_docs = [(row[6], row[1], row[2], row[7]) for row in rows if row[0] is None]
+        return self._merge_expanded_context(self._format_docs(hits), adjacent_docs)
+
+    def _hybrid_search_call(self, text_arg: str, embedding_arg: str) -> str:
+        """SQL call of the hybrid search function; its remaining arguments come from `_hybrid_search_args`."""
+        if self.hybrid_candidates > 0:
+            return f"hybrid_search_indexed({text_arg}, {embedding_arg}, %s, %s, %s, %s, %s)"
+        return f"hybrid_search({text_arg}, {embedding_arg}, %s, %s, %s, %s)"
+
+    def _hybrid_search_args(self, limit: int, k: int, semantic_weight: float, fts_weight: float) -> tuple:
+        args = (limit, k, semantic_weight, fts_weight)
+        if self.hybrid_candidates > 0:
+            args += (max(self.hybrid_candidates, limit),)
+        return args
+
     def get_expanded_context(self, retrieved_docs: list[dict], expansion_size: int) -> list[dict]:
         """
         Expand the context of retrieved documents by including adjacent documents.
 
         For documents from the 'rules' source, this method will fetch additional documents
-        before and after each retrieved document. Documents with consecutive IDs are
-        merged into a single context block.
+        before and after each retrieved document. Documents at consecutive positions in
+        the rulebook are merged into a single context block.
 
         Args:
             retrieved_docs (list[dict]): Original list of retrieved documents
@@ -225,66 +580,74 @@ class Retriever:
                 - content (str): Concatenated content of all documents in the group
                 - source (str): Document source
                 - context_range (str): Range of document IDs included
+                - ids (list[int]): IDs of the merged documents, in rulebook order
                 - first_appearance (int): Position of first occurrence in original results
         """
-        # only expand rules docs
-        rules_docs = [doc for doc in retrieved_docs if "rules" in doc.get("source")]
-        if len(rules_docs) == 0:
+        hit_ids = self._get_expansion_ids(retrieved_docs)
+        if not hit_ids:
             return retrieved_docs
         
-        non_rules_docs = [doc for doc in retrieved_docs if "rules" not in doc.get("source")]
-
-        doc_ids = [doc["id"] for doc in rules_docs]
-        doc_ids_to_fetch = set()
-        for doc_id in doc_ids:
-            # Use the expansion_size parameter to determine range
-            for offset in range(-expansion_size, expansion_size + 1):
-                doc_ids_to_fetch.add(doc_id + offset)
-        
         # Fetch adjacent documents
-        sql_query = "SELECT id, content FROM documents WHERE id IN %s AND source='rules' ORDER BY id"
-        adjacent_docs = self.query_db_sql(sql_query, (tuple(doc_ids_to_fetch),))
-        
-        # Convert to dictionary for easier lookup
-        doc_map = {doc[0]: doc[1] for doc in adjacent_docs}
-        
-        # Group consecutive IDs
+        adjacent_docs = self.query_db_sql(EXPANSION_SQL, {"ids": list(hit_ids), "size": expansion_size})
+        return self._merge_expanded_context(retrieved_docs, adjacent_docs)
+
+    def get_expanded_context_many(self, results: list[list[dict]], expansion_size: int) -> list[list[dict]]:
+        """`get_expanded_context` for several result lists, fetching all adjacent documents in one query."""
+        ids_per_query = [self._get_expansion_ids(docs) for docs in results]
+        all_ids = set().union(*ids_per_query)
+        if not all_ids:
+            return results
+
+        adjacent_docs = self.query_db_sql(EXPANSION_SQL, {"ids": list(all_ids), "size": expansion_size})
+        return [
+            self._merge_expanded_context(docs, [row for row in adjacent_docs if row[0] in ids]) if ids else docs
+            for docs, ids in zip(results, ids_per_query)
+        ]
+
+    def _get_expansion_ids(self, retrieved_docs: list[dict]) -> set[int]:
+        """Ids of the retrieved rules documents, whose neighbors EXPANSION_SQL fetches."""
+        return {doc["id"] for doc in retrieved_docs if "rules" in doc.get("source")}
+
+    def _merge_expanded_context(self, retrieved_docs: list[dict], adjacent_docs: list[tuple]) -> list[dict]:
+        """
+        Merge fetched EXPANSION_SQL rows into consecutive context blocks around the retrieved docs.
+
+        One pass over the rows, which arrive in chunk_index order, then one over the retrieved
+        docs: blocks come out in order of their first retrieved doc, non-rules docs last.
+        """
         groups = []
-        current_group = []
-        
-        sorted_ids = sorted(doc_map.keys())
-        for id in sorted_ids:
-            if not current_group or id == current_group[-1] + 1:
-                current_group.append(id)
-            else:
-                if current_group:
-                    groups.append(current_group)
-                current_group = [id]
-        if current_group:
-            groups.append(current_group)
-
-        # Create merged context documents with tracking of original positions
+        group_of = {}
+        last_position = None
+        for _, doc_id, content, position in adjacent_docs:
+            # Overlapping windows repeat rows
+            if doc_id in group_of:
+                continue
+            if not groups or position != last_position + 1:
+                groups.append([])
+            groups[-1].append((doc_id, content))
+            group_of[doc_id] = len(groups) - 1
+            last_position = position
+
         result = []
-        for group in groups:
-            # Only include groups that contain at least one of our original retrieved doc_ids
-            original_positions = [
-                i for i, doc in enumerate(retrieved_docs) 
-                if "rules" in doc.get("source") and doc.get("id") in group
-            ]
-
-            if original_positions:
-                merged_content = "\n\n".join(doc_map[id] for id in group)
-                representative_id = group[len(group)//2] # Use the middle ID from the group as the representative ID
-                result.append({
-                    "id": representative_id,
-                    "content": merged_content,
-                    "source": "rules",
-                    "context_range": f"docs {group[0]}-{group[-1]}",
-                    "first_appearance": min(original_positions)
-                })
-
-        # Sort by the original appearance order
-        result.sort(key=lambda x: x["first_appearance"])
+        non_rules_docs = []
+        emitted = set()
+        for i, doc in enumerate(retrieved_docs):
+            if "rules" not in doc.get("source"):
+                non_rules_docs.append(doc)
+                continue
+            group_index = group_of.get(doc["id"])
+            if group_index is None or group_index in emitted:
+                continue
+            emitted.add(group_index)
+            group = [doc_id for doc_id, _ in groups[group_index]]
+            result.append({
+                "id": group[len(group)//2], # Use the middle ID from the group as the representative ID
+                "content": "\n\n".join(content for _, content in groups[group_index]),
+                "source": "rules",
+                "context_range": f"docs {group[0]}-{group[-1]}",
+                "ids": group,
+                "first_appearance": i
+            })
 
         result.extend(non_rules_docs)
         return result
@@ -0,0 +1,49 @@
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimer:
+    """Records wall-clock timings of the named stages of one request.
+
+    Stages may overlap (e.g. when run concurrently), so the sum of the stage
+    durations minus the wall-clock total is the time saved off the critical path.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "start_ms": round((stage_start - self.start) * 1000, 1),
+                "duration_ms": round((time.perf_counter() - stage_start) * 1000, 1)
+            }
+
+    def summary(self) -> dict:
+        total_ms = (time.perf_counter() - self.start) * 1000
+        sum_of_stages_ms = sum(stage["duration_ms"] for stage in self.stages.values())
+        return {
+            "total_ms": round(total_ms, 1),
+            "sum_of_stages_ms": round(sum_of_stages_ms, 1),
+            "critical_path_saving_ms": round(max(sum_of_stages_ms - total_ms, 0.0), 1),
+            "stages": dict(self.stages)
+        }
+
+    def log(self, label: str = "stage timings"):
+        summary = self.summary()
+        stages = ", ".join(
+            f"{name}={stage['duration_ms']:.0f}ms@{stage['start_ms']:.0f}"
+            for name, stage in summary["stages"].items()
+        )
+        logger.info(
+            f"{label}: total={summary['total_ms']:.0f}ms "
+            f"saved={summary['critical_path_saving_ms']:.0f}ms [{stages}]"
+        )
+        return summary
@@ -0,0 +1,47 @@
+import numpy as np
+from .answer_cache import AnswerCache, retrieval_key
+
+QUERY = np.array([1.0, 0.0, 0.0])
+PARAPHRASE = np.array([0.99, 0.1, 0.0])
+OTHER = np.array([0.0, 1.0, 0.0])
+
+
+def test_hit_needs_similar_query_and_same_documents():
+    cache = AnswerCache(threshold=0.95, ttl=60, max_size=10)
+    cache.put("what is a callahan?", QUERY, (1, 2), "A goal by the defense.", version=1)
+
+    assert cache.get(PARAPHRASE, (1, 2), version=1) == "A goal by the defense."
+    assert cache.get(PARAPHRASE, (1, 3), version=1) is None
+    assert cache.get(OTHER, (1, 2), version=1) is None
+    assert cache.stats()["hit_rate"] == round(1 / 3, 4)
+
+
+def test_documents_change_invalidates():
+    cache = AnswerCache(threshold=0.95, ttl=60, max_size=10)
+    cache.put("what is a callahan?", QUERY, (1, 2), "answer", version=1)
+    assert cache.get(QUERY, (1, 2), version=2) is None
+    assert cache.stats()["invalidations"] == 1
+    # a request that started before the change cannot store under the old version
+    cache.put("what is a callahan?", QUERY, (1, 2), "stale answer", version=1)
+    assert cache.stats()["size"] == 0
+    # an unknown version never hits
+    assert cache.get(QUERY, (1, 2), version=None) is None
+
+
+def test_ttl_and_lru_eviction():
+    cache = AnswerCache(threshold=0.95, ttl=-1, max_size=10)
+    cache.put("a", QUERY, (1,), "answer", version=1)
+    assert cache.get(QUERY, (1,), version=1) is None
+    assert cache.stats()["size"] == 0
+
+    cache = AnswerCache(threshold=0.95, ttl=60, max_size=1)
+    cache.put("a", QUERY, (1,), "first", version=1)
+    cache.put("b", OTHER, (2,), "second", version=1)
+    assert cache.get(QUERY, (1,), version=1) is None
+    assert cache.get(OTHER, (2,), version=1) == "second"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_retrieval_key_counts_expanded_members():
+    docs = [{"id": 5, "ids": [4, 5, 6]}, {"id": 1}]
+    assert retrieval_key(docs) == (1, 4, 5, 6)
@@ -0,0 +1,114 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, UTC
+import psycopg2
+from . import audit_log as audit_log_module
+from .audit_log import AuditLog, merge_pending
+
+
+class FakePool:
+    """Records the rows of every multi-row insert; `failures` are raised by the next inserts."""
+
+    def __init__(self, failures=()):
+        self.inserts = []
+        self.failures = list(failures)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute_values(self, cursor, sql, rows, page_size=None):
+        with self.lock:
+            if self.failures:
+                raise self.failures.pop(0)
+            table = "messages" if "INTO messages" in sql else "llm_calls"
+            self.inserts.append((table, list(rows)))
+
+
+class FakePrices:
+    def cost(self, model, input_tokens, output_tokens):
+        return input_tokens + 2 * output_tokens if model == "gpt-4o-mini" else None
+
+
+def make_audit_log(monkeypatch, pool, **kwargs):
+    monkeypatch.setattr(audit_log_module, "execute_values", pool.execute_values)
+    kwargs = {"flush_interval": 0.05, "retry_backoff": 0, **kwargs}
+    return AuditLog(db_settings={}, pool=pool, prices=FakePrices(), **kwargs)
+
+
+def test_records_are_written_in_batches_messages_first(monkeypatch):
+    pool = FakePool()
+    audit_log = make_audit_log(monkeypatch, pool, batch_size=100, flush_interval=1)
+    message_id = audit_log.add_message("conv-1", "user", " what is a pick? ")
+    audit_log.add_llm_call(message_id, "answer", "prompt", "response", "gpt-4o-mini", {"input_tokens": 3, "output_tokens": 4})
+    audit_log.add_llm_call(message_id, "verify", "prompt", "response", "unknown", {"input_tokens": 1, "output_tokens": 1})
+    audit_log.add_message("conv-1", "assistant", "An infraction.")
+
+    # queued messages are visible before they are written
+    assert [m["content"] for m in audit_log.pending_messages("conv-1")] == ["what is a pick?", "An infraction."]
+    audit_log.flush()
+
+    assert [table for table, _ in pool.inserts] == ["messages", "llm_calls"]
+    assert pool.inserts[0][1][0][0] == message_id
+    answer, verify = pool.inserts[1][1]
+    assert answer[:7] == (message_id, "answer", "prompt", "response", "gpt-4o-mini", 3, 4)
+    # costs are computed before the insert; unknown models are left to the database
+    assert answer[-1] == 11 and verify[-1] is None
+    assert audit_log.pending_messages("conv-1") == []
+    stats = audit_log.stats()
+    assert stats["written"] == 4 and stats["batches"] == 1
+
+
+def test_transient_errors_are_retried_a_bounded_number_of_times(monkeypatch):
+    lost = psycopg2.OperationalError("connection lost")
+    pool = FakePool(failures=[lost])
+    audit_log = make_audit_log(monkeypatch, pool, max_retries=1)
+    audit_log.add_message("conv-1", "user", "first")
+    audit_log.flush()
+    assert len(pool.inserts) == 1
+
+    pool.failures = [lost, lost]
+    audit_log.add_message("conv-1", "user", "second")
+    audit_log.flush()
+    stats = audit_log.stats()
+    assert stats["retries"] == 2 and stats["dropped"] == 1 and stats["written"] == 1
+    assert audit_log.pending_messages("conv-1") == []
+
+
+def test_rejected_batch_is_written_record_by_record(monkeypatch):
+    pool = FakePool(failures=[psycopg2.IntegrityError("bad row"), psycopg2.IntegrityError("bad row")])
+    audit_log = make_audit_log(monkeypatch, pool, flush_interval=1)
+    audit_log.add_message("conv-1", "user", "first")
+    audit_log.add_message("conv-1", "user", "second")
+    audit_log.flush()
+    # the batch and the first record fail; the second record still lands
+    assert [rows[0][3] for _, rows in pool.inserts] == ["second"]
+    assert audit_log.stats()["dropped"] == 1
+
+
+def test_close_drains_the_queue_and_later_records_are_written_inline(monkeypatch):
+    pool = FakePool()
+    audit_log = make_audit_log(monkeypatch, pool, flush_interval=10)
+    for i in range(5):
+        audit_log.add_message("conv-1", "user", f"message {i}")
+    audit_log.close()
+    assert sum(len(rows) for _, rows in pool.inserts) == 5
+
+    audit_log.add_message("conv-1", "assistant", "late")
+    assert pool.inserts[-1][1][0][3] == "late"
+
+
+def test_merge_pending_orders_and_limits_like_the_query():
+    now = datetime.now(UTC)
+    rows = [{"id": "a", "conversation_role": "user", "content": "a", "created_at": now}]
+    pending = [
+        {"id": "a", "conversation_role": "user", "content": "a", "created_at": now},
+        {"id": "b", "conversation_role": "assistant", "content": "b", "created_at": now + timedelta(seconds=1)},
+        {"id": "c", "conversation_role": "user", "content": "c", "created_at": now + timedelta(seconds=2)},
+    ]
+    assert [row["id"] for row in merge_pending(rows, pending, 2)] == ["c", "b"]
@@ -0,0 +1,120 @@
+import json
+import httpx
+from openai import OpenAI
+from pydantic import BaseModel
+from .clients.base_client import BaseClient
+from .clients.batch import run_batch, LocalBatchBackend, OpenaiBatchBackend
+from .clients.openai_client import OpenaiAbstractedClient, json_schema_response_format
+from .clients.response_cache import ResponseCache
+
+
+class Grade(BaseModel):
+    correct: int
+
+
+class EchoClient(BaseClient):
+    def initialize_client(self, default_model):
+        self.default_model = default_model
+
+    def invoke(self, messages, config=None, response_format=None, return_usage=False):
+        if messages == "fail":
+            raise RuntimeError("provider error")
+        return (f"echo {messages}", {"input_tokens": 1, "output_tokens": 1}) if return_usage else f"echo {messages}"
+
+
+def test_local_backend_keeps_order_and_reports_errors():
+    requests = [{"messages": "a"}, {"messages": "fail"}, {"messages": "c"}]
+    results = run_batch(EchoClient(default_model="m"), requests, backend="local", max_workers=3)
+    assert [result.output for result in results] == ["echo a", None, "echo c"]
+    assert not results[1].ok and "provider error" in results[1].error
+
+
+class FakeBatchApi:
+    """Just enough of the OpenAI files and batches endpoints to run a batch."""
+
+    def __init__(self):
+        self.files = {}
+        self.polls = 0
+        self.batches = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/files") and request.method == "POST":
+            # the JSONL lines of the multipart upload
+            lines = [line for line in request.content.decode().splitlines() if line.startswith('{"custom_id"')]
+            body = "\n".join(lines)
+            self.files["file-in"] = body
+            return httpx.Response(200, json={"id": "file-in", "object": "file", "bytes": len(body), "created_at": 0,
+                                             "filename": "batch_input.jsonl", "purpose": "batch", "status": "processed"})
+        if path.endswith("/batches"):
+            self.batches += 1
+            return httpx.Response(200, json=self.batch("validating"))
+        if path.endswith("/batches/batch-1"):
+            self.polls += 1
+            return httpx.Response(200, json=self.batch("completed" if self.polls > 1 else "in_progress"))
+        if path.endswith("/files/file-out/content"):
+            return httpx.Response(200, content=self.output().encode())
+        raise AssertionError(f"unexpected request {request.method} {path}")
+
+    def batch(self, status):
+        return {"id": "batch-1", "object": "batch", "endpoint": "/v1/chat/completions", "completion_window": "24h",
+                "input_file_id": "file-in", "status": status, "created_at": 0,
+                "output_file_id": "file-out" if status == "completed" else None}
+
+    def output(self):
+        lines = []
+        for line in self.files["file-in"].splitlines():
+            request = json.loads(line)
+            schema = request["body"].get("response_format")
+            content = json.dumps({"correct": 2}) if schema else "RETRIEVE"
+            lines.append(json.dumps({"custom_id": request["custom_id"], "error": None, "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": content}}],
+                         "usage": {"prompt_tokens": 5, "completion_tokens": 1}}
+            }}))
+        return "\n".join(lines)
+
+
+def test_openai_backend_maps_results_back_and_fills_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    api = FakeBatchApi()
+    client = OpenaiAbstractedClient(default_model="gpt-4o-mini")
+    client.client = OpenAI(api_key="test", http_client=httpx.Client(transport=httpx.MockTransport(api.handler)))
+    client.response_cache = ResponseCache(str(tmp_path / "llm.sqlite3"))
+
+    requests = [
+        {"messages": "next step?", "config": {"temperature": 0.1}},
+        {"messages": "grade this", "config": {"temperature": 0.1}, "response_format": Grade},
+    ]
+    results = run_batch(client, requests, backend=OpenaiBatchBackend(poll_interval=0))
+
+    assert [result.output for result in results] == ["RETRIEVE", Grade(correct=2)]
+    assert results[1].usage == {"input_tokens": 5, "output_tokens": 1}
+    submitted = [json.loads(line) for line in api.files["file-in"].splitlines()]
+    assert submitted[1]["body"]["response_format"] == json_schema_response_format(Grade)
+    assert submitted[1]["body"]["model"] == "gpt-4o-mini"
+
+    # a rerun is served from the response cache without a new batch
+    assert client.invoke("grade this", config={"temperature": 0.1}, response_format=Grade) == Grade(correct=2)
+    assert run_batch(client, requests, backend=LocalBatchBackend())[0].output == "RETRIEVE"
+    assert api.batches == 1
+
+
+def test_json_schema_response_format_is_strict():
+    class Rule(BaseModel):
+        number: str
+        default: str | None = None
+
+    class Rules(BaseModel):
+        rules: list[Rule]
+        note: str = "none"
+
+    response_format = json_schema_response_format(Rules)
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["name"] == "Rules" and response_format["json_schema"]["strict"]
+    schema = response_format["json_schema"]["schema"]
+    assert schema["required"] == ["rules", "note"] and schema["additionalProperties"] is False
+    assert schema["properties"]["note"]["default"] == "none"
+    rule = schema["$defs"]["Rule"]
+    assert rule["required"] == ["number", "default"] and rule["additionalProperties"] is False
+    assert "default" not in rule["properties"]["default"]
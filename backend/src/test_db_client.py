@@ -1,10 +1,13 @@
 import pytest
 from uuid import uuid4
 from datetime import datetime, UTC
+from . import audit_log
 from .db_client import DBClient
 
 @pytest.fixture
-def db_client():
+def db_client(monkeypatch):
+    # These tests read back what they insert, so write inline rather than through the audit log
+    monkeypatch.setattr(audit_log, "DEFAULT_MODE", "sync")
     return DBClient()
 
 @pytest.fixture
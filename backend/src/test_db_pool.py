@@ -0,0 +1,146 @@
+import pytest
+import asyncio
+import threading
+import psycopg2
+from . import db_pool
+from .db_pool import DBPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, args=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+        self.conn.executed.append(sql)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def configured():
+    return []
+
+@pytest.fixture
+def pool(configured):
+    return DBPool(
+        db_settings={},
+        max_size=2,
+        timeout=0.2,
+        check_interval=0,
+        connect=FakeConnection,
+        configure=configured.append
+    )
+
+def test_connections_are_reused(pool, configured):
+    with pool.connection() as conn1:
+        pass
+    with pool.connection() as conn2:
+        pass
+    assert conn1 is conn2
+    # pgvector registration happens once per physical connection
+    assert configured == [conn1]
+    assert pool.stats()["connections_opened"] == 1
+
+def test_pool_is_bounded(pool):
+    conn1 = pool.getconn()
+    conn2 = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats["in_use"] == 2
+    assert stats["timeouts"] == 1
+    pool.putconn(conn1)
+    pool.putconn(conn2)
+    assert pool.stats()["idle"] == 2
+
+def test_waiter_gets_returned_connection(pool):
+    conn1 = pool.getconn()
+    conn2 = pool.getconn()
+    timer = threading.Timer(0.05, pool.putconn, args=(conn1,))
+    timer.start()
+    conn3 = pool.getconn()
+    assert conn3 is conn1
+    stats = pool.stats()
+    assert stats["wait_count"] == 1
+    assert stats["wait_time_max"] > 0
+    pool.putconn(conn2)
+    pool.putconn(conn3)
+
+def test_broken_connection_replaced_on_checkout(pool):
+    with pool.connection() as conn1:
+        pass
+    conn1.broken = True
+    with pool.connection() as conn2:
+        pass
+    assert conn2 is not conn1
+    assert conn1.closed
+    assert pool.stats()["connections_discarded"] == 1
+
+def test_error_rolls_back_and_returns_connection(pool):
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("boom")
+    assert conn.rollbacks >= 1
+    assert pool.stats()["idle"] == 1
+
+def test_operational_error_discards_connection(pool):
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("connection lost")
+    assert conn.closed
+    assert pool.stats()["size"] == 0
+
+def test_async_pool_is_shared_only_once_open(monkeypatch):
+    created = []
+
+    class FakeAsyncPool:
+        check_connection = None
+
+        def __init__(self, **kwargs):
+            self.is_open = False
+            created.append(self)
+
+        async def open(self):
+            await asyncio.sleep(0.01)
+            self.is_open = True
+
+    async def get_pool():
+        pool = await db_pool.get_async_db_pool({"dbname": "test"})
+        return pool, pool.is_open
+
+    async def get_pools():
+        return await asyncio.gather(*(get_pool() for _ in range(3)))
+
+    monkeypatch.setattr(db_pool, "AsyncConnectionPool", FakeAsyncPool)
+    monkeypatch.setattr(db_pool, "_async_pools", {})
+    monkeypatch.setattr(db_pool, "_async_pools_lock", asyncio.Lock())
+    pools = asyncio.run(get_pools())
+    assert len(created) == 1
+    assert all(pool is created[0] and is_open for pool, is_open in pools)
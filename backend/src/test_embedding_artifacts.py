@@ -0,0 +1,67 @@
+import json
+import pytest
+import numpy as np
+from .embedding_artifacts import save_artifact, load_artifact, load_items, save_items, export_json, artifact_exists
+from .vector_index import VectorIndex
+
+
+def make_items(n=4, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {"chunk": f"chunk {i}", "context": f"context {i}", "tokens": {"prompt": 10, "completion": 2},
+         "embedding": rng.normal(size=dim).tolist()}
+        for i in range(n)
+    ]
+
+
+def test_round_trip_is_memory_mapped(tmp_path):
+    items = make_items()
+    prefix = str(tmp_path / "rules")
+    save_artifact(prefix, items, {"embedding_model": "m"})
+
+    sidecar, matrix = load_artifact(prefix)
+    assert isinstance(matrix, np.memmap)
+    assert matrix.dtype == np.float32 and matrix.shape == (4, 8)
+    assert sidecar["embedding_model"] == "m"
+    assert sidecar["items"][2] == {"chunk": "chunk 2", "context": "context 2", "tokens": {"prompt": 10, "completion": 2}}
+
+    loaded = load_items(prefix)
+    assert [item["chunk"] for item in loaded] == [item["chunk"] for item in items]
+    assert loaded[1]["embedding"] == pytest.approx(items[1]["embedding"], rel=1e-6)
+
+
+def test_json_export_and_fallback(tmp_path):
+    items = make_items(n=2)
+    prefix = str(tmp_path / "glossary")
+    save_items(prefix, items, "json")
+    assert not artifact_exists(prefix)
+    # without an artifact, load_items reads the JSON file
+    assert load_items(prefix) == items
+
+    save_artifact(prefix, items)
+    path = export_json(prefix, str(tmp_path / "export.json"))
+    with open(path) as f:
+        exported = json.load(f)
+    assert exported[0]["chunk"] == "chunk 0"
+    assert exported[0]["embedding"] == pytest.approx(items[0]["embedding"], rel=1e-6)
+
+
+def test_mismatched_sidecar_is_rejected(tmp_path):
+    prefix = str(tmp_path / "rules")
+    save_artifact(prefix, make_items(n=3))
+    np.save(f"{prefix}.npy", np.zeros((2, 8), dtype=np.float32))
+    with pytest.raises(ValueError):
+        load_artifact(prefix)
+
+
+def test_vector_index_from_artifacts(tmp_path):
+    glossary, rules = make_items(n=2, seed=1), make_items(n=3, seed=2)
+    save_artifact(str(tmp_path / "glossary"), glossary)
+    save_artifact(str(tmp_path / "rules"), rules)
+
+    index = VectorIndex.from_artifacts({"glossary": str(tmp_path / "glossary"), "rules": str(tmp_path / "rules")})
+
+    assert len(index) == 5
+    # ids follow load order, as after a fresh bulk load
+    top = index.similarity_search(rules[1]["embedding"], limit=1)[0]
+    assert top[:4] == (4, "chunk 1", "context 1", "rules")
@@ -0,0 +1,69 @@
+import pytest
+import numpy as np
+from .embedding_cache import EmbeddingCache, SQLiteEmbeddingStore, cache_key, normalize_text
+
+MODEL = "text-embedding-3-small"
+
+
+def test_normalized_text_shares_key():
+    assert normalize_text("  What is a\tCallahan? ") == "what is a callahan?"
+    assert cache_key("What is a Callahan?", MODEL) == cache_key("what  is a callahan?", MODEL)
+    assert cache_key("what is a callahan?", MODEL) != cache_key("what is a callahan?", "other-model")
+
+
+def test_hit_and_miss_counters():
+    cache = EmbeddingCache(max_size=10)
+    assert cache.get("what is a callahan?", MODEL) is None
+    cache.put("what is a callahan?", MODEL, [0.5, 0.25])
+    assert cache.get("What is a callahan?", MODEL) == [0.5, 0.25]
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_eviction():
+    cache = EmbeddingCache(max_size=2)
+    cache.put("a", MODEL, [1.0])
+    cache.put("b", MODEL, [2.0])
+    cache.get("a", MODEL)  # "b" is now least recently used
+    cache.put("c", MODEL, [3.0])
+
+    assert cache.get("b", MODEL) is None
+    assert cache.get("a", MODEL) == [1.0]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_sqlite_store_survives_restart_and_evicts(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(max_size=10, store=SQLiteEmbeddingStore(path, max_entries=2, evict_interval=1))
+    for i, text in enumerate(["a", "b", "c"]):
+        cache.put(text, MODEL, [float(i), 0.5])
+
+    restarted = EmbeddingCache(max_size=10, store=SQLiteEmbeddingStore(path, max_entries=2, evict_interval=1))
+    assert restarted.store.size() == 2
+    assert restarted.get("a", MODEL) is None
+    assert restarted.get("c", MODEL) == pytest.approx([2.0, 0.5])
+    assert restarted.stats()["store_hits"] == 1
+
+    # promoted into the LRU, so the next lookup does not touch the store
+    assert restarted.get("c", MODEL) == pytest.approx([2.0, 0.5])
+    assert restarted.stats()["hits"] == 1
+
+
+def test_sqlite_store_evicts_every_interval_puts(tmp_path):
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.sqlite3"), max_entries=2, evict_interval=3)
+    sizes = []
+    for i, text in enumerate("abcdef"):
+        store.put(cache_key(text, MODEL), MODEL, np.full(2, i, dtype=np.float32))
+        sizes.append(store.size())
+    assert sizes == [1, 2, 2, 3, 4, 2]
+    assert store.get(cache_key("b", MODEL)) is None
+    assert store.get(cache_key("f", MODEL)) == pytest.approx([5.0, 5.0])
+
+
+def test_zero_size_disables_memory_tier():
+    cache = EmbeddingCache(max_size=0)
+    cache.put("a", MODEL, np.ones(3))
+    assert cache.get("a", MODEL) is None
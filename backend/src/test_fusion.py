@@ -0,0 +1,65 @@
+import pytest
+import numpy as np
+from .fusion import FusionCandidates, fuse, rrf, weighted_sum, combmnz
+
+
+def row(doc_id, score):
+    return (doc_id, f"doc {doc_id}", None, "rules", score)
+
+
+@pytest.fixture
+def candidates():
+    semantic = [
+        [row(1, 0.9), row(2, 0.8), row(3, 0.5)],
+        [row(7, 0.4)],
+    ]
+    fts = [
+        [row(3, 0.3), row(4, 0.1)],
+        [],
+    ]
+    return FusionCandidates(semantic, fts)
+
+
+def test_candidates_are_aligned(candidates):
+    assert candidates.ids.tolist() == [[1, 2, 3, 4], [7, -1, -1, -1]]
+    assert candidates.valid.tolist() == [[True] * 4, [True, False, False, False]]
+    assert candidates.semantic_rank[0].tolist() == [1, 2, 3, np.inf]
+    assert candidates.fts_rank[0].tolist() == [np.inf, np.inf, 1, 2]
+
+
+def test_rrf_matches_sql_formula(candidates):
+    scores = rrf(candidates, k=60, semantic_weight=0.7, fts_weight=0.3)
+    assert scores[0, 2] == pytest.approx(0.7 / 63 + 0.3 / 61)
+    assert scores[0, 3] == pytest.approx(0.7 / (60 + 1_000_000) + 0.3 / 62)
+
+
+def test_weighted_sum_normalizes_each_side(candidates):
+    scores = weighted_sum(candidates, semantic_weight=0.5, fts_weight=0.5)
+    # semantic 0.9 -> 1.0, 0.5 -> 0.0; fts 0.3 -> 1.0, 0.1 -> 0.0
+    assert scores[0].tolist() == pytest.approx([0.5, 0.5 * 0.75, 0.5, 0.0])
+    # a single candidate normalizes to 1
+    assert scores[1, 0] == pytest.approx(0.5)
+
+
+def test_combmnz_rewards_documents_in_both_lists(candidates):
+    scores = combmnz(candidates)
+    assert scores[0, 2] == pytest.approx(2 * 0.5)
+    assert scores[0, 0] == pytest.approx(0.5)
+
+
+def test_fuse_returns_sql_shaped_rows(candidates):
+    results = fuse(candidates, "rrf", limit=2)
+    # doc 3 is in both lists, so it outranks the top semantic hit
+    assert [r[0] for r in results[0]] == [3, 1]
+    assert results[0][1][:4] == (1, "doc 1", None, "rules")
+    # padding never appears in the results
+    assert [r[0] for r in fuse(candidates, "combmnz", limit=3)[1]] == [7]
+
+
+def test_fuse_rejects_unknown_method(candidates):
+    with pytest.raises(ValueError):
+        fuse(candidates, "borda")
+
+
+def test_empty_candidates():
+    assert fuse(FusionCandidates([[], []], [[], []]), "rrf") == [[], []]
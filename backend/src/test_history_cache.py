@@ -0,0 +1,80 @@
+from uuid import uuid4
+from . import audit_log, history_cache
+from .db_client import DBClient
+from .history_cache import HistoryCache
+
+
+def rows(*messages):
+    """get_conversation_history rows (newest first) for (id, role, content) messages given oldest first."""
+    return [{"id": i, "conversation_role": role, "content": content} for i, role, content in reversed(messages)]
+
+
+def test_write_through_serves_new_conversations():
+    cache = HistoryCache(max_size=10, ttl=60, max_messages=3)
+    cache.start("c")
+    assert cache.get("c", 5) == []
+    for i, role in enumerate(["user", "assistant", "user"]):
+        cache.append("c", f"m{i}", role, f"message {i}")
+    assert cache.get("c", 2) == [{"role": "assistant", "content": "message 1"}, {"role": "user", "content": "message 2"}]
+
+    # past max_messages the entry only answers reads it holds enough messages for
+    cache.append("c", "m3", "assistant", "message 3")
+    assert len(cache.get("c", 3)) == 3
+    assert cache.get("c", 4) is None
+
+
+def test_loads_from_the_database_and_skips_racing_writes():
+    cache = HistoryCache(max_size=10, ttl=60, max_messages=10)
+    token = cache.begin_load()
+    cache.load("c", rows(("a", "user", "hi"), ("b", "assistant", "hello")), 5, token)
+    # fewer rows than asked for: the entry holds the whole conversation
+    assert [m["content"] for m in cache.get("c", 10)] == ["hi", "hello"]
+
+    # a load that read the message being written through keeps a single copy
+    cache.append("c", "b", "assistant", "hello")
+    assert len(cache.get("c", 10)) == 2
+
+    token = cache.begin_load()
+    cache.append("d", "x", "user", "written while the read was in flight")
+    cache.load("d", rows(("w", "user", "older")), 5, token)
+    assert cache.get("d", 5) is None
+    assert cache.stats()["skipped_loads"] == 1
+
+
+def test_lru_and_ttl():
+    cache = HistoryCache(max_size=1, ttl=60, max_messages=10)
+    cache.start("a")
+    cache.start("b")
+    assert cache.get("a", 1) is None and cache.get("b", 1) == []
+    assert cache.stats()["evictions"] == 1
+
+    cache = HistoryCache(max_size=10, ttl=-1, max_messages=10)
+    cache.start("a")
+    assert cache.get("a", 1) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_steady_state_history_reads_make_no_queries(monkeypatch):
+    queries = []
+
+    def query_db_sql(self, sql_query, args):
+        queries.append(sql_query)
+        if "INSERT INTO conversations" in sql_query:
+            return [{"id": args[0]}]
+        if "INSERT INTO messages" in sql_query:
+            return [{"id": str(uuid4())}]
+        raise AssertionError(f"unexpected query {sql_query}")
+
+    monkeypatch.setattr(audit_log, "DEFAULT_MODE", "sync")
+    monkeypatch.setattr(history_cache, "_default_cache", HistoryCache(max_size=10, ttl=60, max_messages=10))
+    monkeypatch.setattr(DBClient, "query_db_sql", query_db_sql)
+    db_client = DBClient()
+
+    conversation_id = db_client.create_conversation(user_id="u")
+    for turn in range(3):
+        db_client.add_message(conversation_id, "user", f"question {turn}")
+        history = db_client.get_conversation_history(conversation_id, 5)
+        assert history[-1] == {"role": "user", "content": f"question {turn}"}
+        db_client.add_message(conversation_id, "assistant", f"answer {turn}")
+    assert len(queries) == 7
+    assert db_client.history_cache.stats()["hits"] == 3
@@ -0,0 +1,70 @@
+from . import token_count, prompt_rendering
+from .history_manager import HistoryManager, compact_message, render_history, summary_line, message_tokens
+
+RULES = "\n\n**Relevant rules:**\n\n- **17.I.4**: A player may not stand within 3 meters of the thrower. " * 5
+ANSWER = "A pick is called when a defender is obstructed. It stops play." + RULES
+
+
+def conversation(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i}?"})
+        history.append({"role": "assistant", "content": f"answer {i}. {ANSWER}"})
+    history.append({"role": "user", "content": "and what happens next?"})
+    return history
+
+
+def test_compact_message_keeps_rule_numbers():
+    assert compact_message(ANSWER).endswith("It stops play.\n(relevant rules: 17.I.4, 17.I.4, 17.I.4, 17.I.4, 17.I.4)")
+    assert compact_message("no rules here") == "no rules here"
+    assert summary_line({"role": "assistant", "content": ANSWER}) == "- assistant: A pick is called when a defender is obstructed."
+
+
+def test_history_within_budget_is_kept():
+    history = conversation(1)
+    manager = HistoryManager(budgets={"answer": 10_000})
+    assert manager.window(history, "answer") == history
+
+
+def test_history_is_trimmed_to_the_budget_with_a_summary(monkeypatch):
+    monkeypatch.setattr(prompt_rendering, "COUNT_PROMPT_TOKENS", True)
+    history = conversation(4)
+    compact = compact_message(history[-2]["content"])
+    budget = message_tokens("user", history[-1]["content"]) + message_tokens("assistant", compact) + 2
+    manager = HistoryManager(budgets={"reword": budget}, summary_budget=1000)
+    windowed = manager.window(history, "reword")
+
+    # the newest message is always kept, the last answer is compacted to fit
+    assert windowed[-1] == history[-1]
+    assert windowed[-2] == {"role": "assistant", "content": compact}
+    # everything older is summarized, one line per message
+    assert windowed[0]["role"] == "summary"
+    assert windowed[0]["content"].splitlines()[0] == "- user: question 0?"
+    assert len(windowed[0]["content"].splitlines()) == 7
+    assert len(windowed) == 3
+
+    stats = manager.stats()["reword"]
+    assert stats["calls"] == 1 and stats["tokens_saved"] > 0
+    assert stats["tokens_after"] < stats["tokens_before"] / 2
+
+
+def test_saved_tokens_are_not_counted_by_default(monkeypatch):
+    monkeypatch.setattr(prompt_rendering, "COUNT_PROMPT_TOKENS", False)
+    manager = HistoryManager(budgets={"reword": 1})
+    manager.window(conversation(2), "reword")
+    assert manager.stats() == {}
+
+
+def test_summary_keeps_the_newest_lines_within_its_budget():
+    manager = HistoryManager(budgets={"verify": 1}, summary_budget=8)
+    windowed = manager.window(conversation(3), "verify")
+    assert windowed[0]["content"].splitlines() == ["- assistant: answer 2."]
+    assert render_history([]) == "(no previous messages)"
+
+
+def test_token_counts_fall_back_to_an_estimate_without_the_encoding(monkeypatch):
+    monkeypatch.setattr(token_count, "DEFAULT_ENCODING", "no_such_encoding")
+    monkeypatch.setattr(token_count, "_encoding", None)
+    monkeypatch.setattr(token_count, "_encoding_loaded", False)
+    assert token_count.get_encoding() is None
+    assert token_count.count_tokens("a" * 9) == 3
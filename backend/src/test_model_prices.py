@@ -0,0 +1,55 @@
+from .model_prices import ModelPrices
+from .answer_cache import ANSWER_CACHE_MODEL
+
+
+class FakeModelPrices(ModelPrices):
+    """Prices served from `rows` instead of the models table, counting the queries."""
+
+    def __init__(self, rows, **kwargs):
+        super().__init__(db_settings={}, **kwargs)
+        self.rows = rows
+        self.queries = 0
+
+    def _query(self, sql_query, args=()):
+        self.queries += 1
+        if isinstance(self.rows, Exception):
+            raise self.rows
+        return list(self.rows)
+
+
+def test_cost_matches_calculate_token_cost_and_loads_once():
+    prices = FakeModelPrices([("gpt-4o-mini", 0.15 / 1e6, 0.6 / 1e6), ("no-price", None, 1.0)])
+    assert prices.cost("gpt-4o-mini", 1000, 100) == 0.15 / 1e6 * 1000 + 0.6 / 1e6 * 100
+    assert prices.cost("gpt-4o-mini", 10, 10) > 0
+    assert prices.queries == 1
+    # models without both prices are not priced, like calculate_token_cost
+    assert prices.cost("no-price", 1, 1) is None
+
+
+def test_answer_cache_lookups_are_free_without_a_models_row():
+    # databases created before the answer cache have no models row for it, so the trigger would reject the record
+    prices = FakeModelPrices([("gpt-4o-mini", 1.0, 2.0)])
+    assert prices.cost(ANSWER_CACHE_MODEL, 0, 0) == 0.0
+    assert prices.queries == 0
+
+
+def test_unknown_model_reloads_at_most_every_min_reload_interval():
+    prices = FakeModelPrices([("gpt-4o-mini", 1.0, 2.0)], min_reload_interval=0)
+    assert prices.cost("new-model", 1, 1) is None
+    assert prices.queries == 2
+    prices.rows.append(("new-model", 3.0, 4.0))
+    assert prices.cost("new-model", 1, 1) == 7.0
+
+    prices = FakeModelPrices([("gpt-4o-mini", 1.0, 2.0)], min_reload_interval=60)
+    prices.cost("new-model", 1, 1)
+    prices.cost("new-model", 1, 1)
+    assert prices.queries == 1
+
+
+def test_prices_refresh_on_interval_and_survive_load_failures():
+    prices = FakeModelPrices([("gpt-4o-mini", 1.0, 2.0)], refresh_interval=0)
+    assert prices.cost("gpt-4o-mini", 1, 1) == 3.0
+    prices.rows = [("gpt-4o-mini", 2.0, 2.0)]
+    assert prices.cost("gpt-4o-mini", 1, 1) == 4.0
+    prices.rows = ConnectionError("database unavailable")
+    assert prices.cost("gpt-4o-mini", 1, 1) == 4.0
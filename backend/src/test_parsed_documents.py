@@ -0,0 +1,89 @@
+from .parsed_documents import (
+    ParsedDocument, ParsedDocumentIndex, merge_parsed, split_rules, sort_rules, find_rule_references
+)
+
+CHUNKS = [
+    "10.A. The playing field is a rectangle.\n10.B. The lines are out-of-bounds.\n10.C. A player is",
+    "in-bounds when:\n10.C.1. they are not out-of-bounds.\n10.H. The goal lines are in the end zone.",
+    "9.B. Each point starts with a pull.\n9.B.1. The pull may be thrown.",
+]
+
+
+def make_index(rows):
+    index = ParsedDocumentIndex(db_settings={}, refresh_interval=float("inf"))
+    index.documents = {doc_id: ParsedDocument(*row) for doc_id, *row in rows}
+    index.rule_documents = index._index_rules(index.documents)
+    return index
+
+
+def test_merge_matches_parsing_the_joined_text():
+    rules, definitions = merge_parsed([ParsedDocument("rules", chunk) for chunk in CHUNKS])
+    # the joined text needs a leading newline for the first rule, as a per-chunk parse provides
+    expected = sort_rules(split_rules("\n" + "\n".join(CHUNKS))[1])
+    assert rules == expected
+    assert list(rules) == ["9.B", "9.B.1", "10.A", "10.B", "10.C", "10.C.1", "10.H"]
+    assert rules["10.C"] == "A player is\nin-bounds when:"
+    assert definitions == {}
+
+
+def test_appendix_rules_sort_last_and_headers_end_the_rules():
+    lead, rules = split_rules("\nB3. Misconduct.\n2.A. Spirit.\n\nAppendix C: Hand Signals\n3.A. ignored.")
+    assert lead == ""
+    assert list(sort_rules(rules)) == ["2.A", "B3"]
+
+
+def test_glossary_terms():
+    parsed = ParsedDocument("glossary", "Callahan\nA goal scored by the defense.\nRare.")
+    _, definitions = merge_parsed([parsed])
+    assert definitions == {"Callahan": "A goal scored by the defense.\nRare."}
+
+
+def test_index_uses_parsed_documents_and_expanded_members():
+    index = make_index([(1, "rules", CHUNKS[0]), (2, "rules", CHUNKS[1]), (3, "glossary", "Pull\nThe throw.")])
+    parsed = index.parse([
+        {"id": 3, "source": "glossary", "content": "Pull\nThe throw."},
+        {"id": 2, "source": "rules", "content": "\n\n".join(CHUNKS[:2]), "ids": [1, 2]},
+    ])
+    # by source, then position: the glossary entry sorts before the rules
+    assert parsed == [index.documents[3], index.documents[1], index.documents[2]]
+
+
+def test_index_parses_unknown_or_changed_documents():
+    index = make_index([(1, "rules", CHUNKS[0])])
+    parsed = index.parse([
+        {"id": 1, "source": "rules", "content": CHUNKS[2]},
+        {"id": 7, "source": "rules", "content": CHUNKS[1]},
+    ])
+    assert list(parsed[0].rules) == ["9.B", "9.B.1"]
+    assert list(parsed[1].rules) == ["10.C.1", "10.H"]
+
+
+def test_find_rule_references():
+    assert find_rule_references("what is rule 10.H?") == ["10.H"]
+    assert find_rule_references("Compare 15.c.2.a with 10.H.1. and 10.H") == ["15.C.2.a", "10.H.1", "10.H"]
+    assert find_rule_references("rule B3.1 of the misconduct system") == ["B3.1"]
+    assert find_rule_references("what does 15.C.2.A say, and 15.c.2.a.1?") == ["15.C.2.a", "15.C.2.a.1"]
+    assert find_rule_references("the marker has 3.5 seconds, see e.g. v2.A") == []
+
+
+def test_lookup_rules_includes_subrules():
+    index = make_index([(1, "rules", CHUNKS[0]), (2, "rules", CHUNKS[1]), (3, "rules", CHUNKS[2])])
+    assert [doc_id for doc_id, _ in index.lookup_rules(["10.H"])] == [2]
+    # 10.C is in the first chunk and its subrule 10.C.1 in the second
+    assert [doc_id for doc_id, _ in index.lookup_rules(["10.C", "9.B.1"])] == [1, 2, 3]
+    assert index.lookup_rules(["10.H", "12.Z"]) is None
+
+
+def test_documents_are_merged_in_chunk_order_not_id_order():
+    # after an incremental load the second chunk of the rulebook can have the smaller id
+    index = make_index([(7, "rules", CHUNKS[0], 0), (3, "rules", CHUNKS[1], 1), (5, "rules", CHUNKS[2], 2)])
+    parsed = index.parse([
+        {"id": 3, "source": "rules", "content": CHUNKS[1]},
+        {"id": 7, "source": "rules", "content": CHUNKS[0]},
+    ])
+    assert parsed == [index.documents[7], index.documents[3]]
+    rules, _ = merge_parsed(parsed)
+    assert rules["10.C"] == "A player is\nin-bounds when:"
+
+    assert index.rule_documents["10.C"] == [7, 3]
+    assert [doc_id for doc_id, _ in index.lookup_rules(["9.B", "10.C"])] == [7, 3, 5]
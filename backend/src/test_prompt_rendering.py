@@ -0,0 +1,58 @@
+import json
+import pytest
+from . import prompt_rendering
+from .prompt_rendering import PromptTokenCounter, render_context, render_history, use_prompt_format
+from .prompts import get_rag_prompt, get_relevant_rules_definitions_prompt
+from .token_count import count_tokens
+
+CONTEXT = {
+    "rules": {
+        f"17.I.{i}": 'A player may not stand within 3 meters of the thrower:\n"marking" is a defensive position.'
+        for i in range(1, 11)
+    },
+    "definitions": {"Marker": "The defensive player within 3 meters of the thrower."},
+}
+HISTORY = [{"role": "user", "content": "what is a pick?"}, {"role": "assistant", "content": "An obstruction.\n\n**Relevant rules:**"}]
+
+
+@pytest.fixture(autouse=True)
+def compact_format(monkeypatch):
+    monkeypatch.setattr(prompt_rendering, "_format", "compact")
+    monkeypatch.setattr(prompt_rendering, "_counter", PromptTokenCounter())
+    monkeypatch.setattr(prompt_rendering, "COUNT_PROMPT_TOKENS", True)
+
+
+def test_compact_context_keeps_rules_and_definitions_as_plain_text():
+    rendered = render_context(CONTEXT)
+    assert rendered.startswith("<rules>\n17.I.1: A player may not stand")
+    assert '"marking" is a defensive position.\n17.I.2:' in rendered
+    assert rendered.endswith("<definitions>\nMarker: The defensive player within 3 meters of the thrower.\n</definitions>")
+    assert render_context({}) == "(none)"
+    assert count_tokens(rendered) < count_tokens(json.dumps(CONTEXT, indent=2))
+
+
+def test_json_format_is_the_previous_rendering():
+    use_prompt_format("json")
+    assert render_context(CONTEXT) == json.dumps(CONTEXT, indent=2)
+    assert render_history(HISTORY) == json.dumps(HISTORY, indent=2)
+    assert json.dumps("a pick?", indent=2) in get_rag_prompt("a pick?", CONTEXT, HISTORY)
+    with pytest.raises(ValueError):
+        use_prompt_format("yaml")
+
+
+def test_prompts_are_counted_by_name():
+    compact = get_relevant_rules_definitions_prompt("a pick?", HISTORY, CONTEXT)
+    get_relevant_rules_definitions_prompt("a pick?", HISTORY, CONTEXT)
+    use_prompt_format("json")
+    get_rag_prompt("a pick?", CONTEXT, HISTORY)
+
+    stats = prompt_rendering.get_prompt_token_counter().stats()
+    assert stats["select_rules"]["calls"] == 2
+    assert stats["select_rules"]["tokens"] == 2 * count_tokens(compact)
+    assert stats["answer"]["calls"] == 1
+
+
+def test_prompts_are_not_counted_by_default(monkeypatch):
+    monkeypatch.setattr(prompt_rendering, "COUNT_PROMPT_TOKENS", False)
+    get_rag_prompt("a pick?", CONTEXT, HISTORY)
+    assert prompt_rendering.get_prompt_token_counter().stats() == {}
@@ -0,0 +1,211 @@
+import time
+import asyncio
+from .parsed_documents import ParsedDocument
+from .rag_chat import RagChat, RulesDefinitions, Answer, Verification, AnswerStreamSplitter
+from .async_rag_chat import AsyncRagChat
+from .stage_timer import StageTimer
+from .answer_cache import AnswerCache
+
+STREAMED_ANSWER = "A pick stops play.\n\n**Relevant rules**\n- **17.I.4**: picks\n- 17.I.5"
+DOCS = [{"id": 1, "content": "\n1.A. Spirit of the game.", "source": "rules"}]
+
+
+class FakeParsedDocuments:
+    version = 1
+
+    def needs_check(self):
+        return False
+
+    def refresh(self):
+        pass
+
+    def parse(self, documents):
+        return [ParsedDocument(doc["source"], doc["content"]) for doc in documents]
+
+
+class FakeRetriever:
+    def __init__(self):
+        self.parsed_documents = FakeParsedDocuments()
+        self.searches = []
+
+    def create_embedding(self, text):
+        return [1.0, 0.0]
+
+    def search(self, query, **kwargs):
+        self.searches.append(query)
+        return DOCS
+
+
+class FakeDB:
+    def __init__(self):
+        self.llm_calls = []
+        self.messages = []
+
+    def add_message(self, conversation_id, role, content):
+        self.messages.append((role, content))
+        return "m"
+
+    def get_conversation_history(self, conversation_id, message_limit):
+        return [{"role": "user", "content": "what is spirit?"}]
+
+    def add_llm_call(self, **kwargs):
+        self.llm_calls.append(kwargs)
+
+
+class FakeLLM:
+    """Answers every stage of the pipeline; `next_step` is what the classifier says."""
+
+    def __init__(self, next_step="retrieve", delay=0.0):
+        self.next_step = next_step
+        self.delay = delay
+        self.requests = []
+
+    def invoke(self, messages, config=None, response_format=None, return_usage=False):
+        self.requests.append((messages, config, response_format))
+        time.sleep(self.delay)
+        if response_format is RulesDefinitions:
+            return RulesDefinitions(rules=["1.A"], definitions=[]), {}
+        if response_format is Answer:
+            return Answer(answer="Play fair.", relevant_rules=["1.A"]), {}
+        if response_format is Verification:
+            return Verification(is_correct=True, revised_answer=None, explanation=None), {}
+        return (self.next_step if config["max_tokens"] == 10 else "none"), {}
+
+
+class AsyncFakeRetriever(FakeRetriever):
+    async def refresh_parsed_documents(self):
+        pass
+
+    async def create_embedding(self, text):
+        return FakeRetriever.create_embedding(self, text)
+
+    async def search(self, query, **kwargs):
+        return FakeRetriever.search(self, query, **kwargs)
+
+
+class AsyncFakeDB(FakeDB):
+    async def add_message(self, *args):
+        return FakeDB.add_message(self, *args)
+
+    async def get_conversation_history(self, *args):
+        return FakeDB.get_conversation_history(self, *args)
+
+    async def add_llm_call(self, **kwargs):
+        FakeDB.add_llm_call(self, **kwargs)
+
+
+class AsyncFakeLLM(FakeLLM):
+    async def ainvoke(self, messages, config=None, response_format=None, return_usage=False):
+        if config.get("stream"):
+            self.requests.append((messages, config, response_format))
+            return self._stream(STREAMED_ANSWER), {}
+        return self.invoke(messages, config, response_format, return_usage)
+
+    @staticmethod
+    async def _stream(text, size=7):
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+
+
+def make_chat(cls=RagChat, speculative=False, next_step="retrieve"):
+    fakes = (FakeLLM, FakeRetriever, FakeDB) if cls is RagChat else (AsyncFakeLLM, AsyncFakeRetriever, AsyncFakeDB)
+    return cls.model_construct(
+        llm_client=fakes[0](next_step), retriever=fakes[1](), db_client=fakes[2](), memory_size=3,
+        default_model="default", light_model="light", speculative=speculative, answer_cache=None, history_manager=None
+    )
+
+
+def test_async_pipeline_makes_the_same_llm_calls():
+    chat = make_chat()
+    answer = chat.answer_question("what is spirit?", "c")
+    async_chat = make_chat(AsyncRagChat)
+    async_answer = asyncio.run(async_chat.answer_question("what is spirit?", "c"))
+
+    assert answer == async_answer == "Play fair.\n\n**Relevant rules:**\n\n- **1.A**: Spirit of the game.\n"
+    assert chat.llm_client.requests == async_chat.llm_client.requests
+    assert chat.db_client.llm_calls == async_chat.db_client.llm_calls
+    assert [call["message_type"] for call in chat.db_client.llm_calls] == ["next_step", "reword", "select_rules", "answer", "verify"]
+
+
+def test_splitter_holds_back_the_rules_heading_split_anywhere():
+    for i in range(len(STREAMED_ANSWER) + 1):
+        splitter = AnswerStreamSplitter()
+        shown = splitter.feed(STREAMED_ANSWER[:i]) + splitter.feed(STREAMED_ANSWER[i:]) + splitter.finish()
+        assert shown == splitter.answer == "A pick stops play.\n\n", i
+        assert splitter.rule_numbers() == ["17.I.4", "17.I.5"], i
+
+    splitter = AnswerStreamSplitter()
+    shown = [splitter.feed(char) for char in "Relevant **Rel rules**: none"] + [splitter.finish()]
+    assert "".join(shown) == "Relevant **Rel rules**: none"
+    assert splitter.rule_numbers() == []
+
+
+def test_stream_events_and_context_match_answer_question():
+    chat = make_chat(AsyncRagChat)
+
+    async def collect():
+        return [event async for event in chat.answer_question_stream("what is spirit?", "c")]
+
+    events = asyncio.run(collect())
+    names = [event["event"] for event in events]
+    assert set(names[:-3]) == {"token"}
+    assert names[-3:] == ["rules", "verified", "done"]
+    assert "".join(event["data"] for event in events[:-3]) == "A pick stops play.\n\n"
+    assert [call["message_type"] for call in chat.db_client.llm_calls] == ["next_step", "reword", "select_rules", "answer", "verify"]
+    assert chat.db_client.messages[-1] == ("assistant", events[-2]["data"]["message"])
+
+
+def test_speculative_retrieval_is_discarded_when_the_classifier_says_answer():
+    chat = make_chat(speculative=True, next_step="answer")
+    assert chat._get_next_step_and_docs("what is spirit?", "m", [], {}, StageTimer()) == ("answer", None, None)
+    assert chat.retriever.searches == ["what is spirit?"]
+
+    chat.answer_question("what is spirit?", "c")
+    message_types = [call["message_type"] for call in chat.db_client.llm_calls]
+    assert "select_rules" not in message_types
+    answer_prompt = next(call["prompt"] for call in chat.db_client.llm_calls if call["message_type"] == "answer")
+    assert "Spirit of the game" not in answer_prompt
+
+
+def test_speculative_retrieval_matches_the_sequential_path():
+    sequential, speculative = make_chat(), make_chat(speculative=True)
+    assert (
+        sequential._get_next_step_and_docs("what is spirit?", "m", [], {}, StageTimer())
+        == speculative._get_next_step_and_docs("what is spirit?", "m", [], {}, StageTimer())
+        == ("retrieve", "what is spirit?", DOCS)
+    )
+    assert sequential.answer_question("what is spirit?", "c") == speculative.answer_question("what is spirit?", "c")
+    assert sorted(map(repr, sequential.db_client.llm_calls)) == sorted(map(repr, speculative.db_client.llm_calls))
+
+
+def test_stage_timer_reports_the_overlap_of_speculative_stages():
+    timers = {}
+    for speculative in (False, True):
+        chat = make_chat(speculative=speculative)
+        chat.llm_client.delay = 0.05
+        timers[speculative] = StageTimer()
+        chat._get_next_step_and_docs("what is spirit?", "m", [], {}, timers[speculative])
+
+    for timer in timers.values():
+        assert set(timer.summary()["stages"]) == {"next_step", "reword", "retrieve"}
+    assert timers[False].summary()["critical_path_saving_ms"] < 20
+    assert timers[True].summary()["critical_path_saving_ms"] >= 30
+
+
+def test_answer_cache_looks_up_and_stores_under_the_reworded_query_and_its_retrieval():
+    for cls in (RagChat, AsyncRagChat):
+        chat = make_chat(cls)
+        chat.answer_cache = AnswerCache(threshold=0.95, ttl=60, max_size=10)
+        answers = []
+        for _ in range(2):
+            answer = chat.answer_question("what is spirit?", "c")
+            answers.append(asyncio.run(answer) if cls is AsyncRagChat else answer)
+
+        assert answers[0] == answers[1]
+        # one retrieval per request, and the second is answered from the cache after the reword
+        assert chat.retriever.searches == ["what is spirit?", "what is spirit?"]
+        assert [call["message_type"] for call in chat.db_client.llm_calls] == [
+            "next_step", "reword", "answer_cache", "select_rules", "answer", "verify",
+            "next_step", "reword", "answer_cache"
+        ]
+        assert [call["response"] for call in chat.db_client.llm_calls if call["message_type"] == "answer_cache"] == ["miss", "hit"]
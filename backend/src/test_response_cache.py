@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from pydantic import BaseModel
+from .clients.base_client import BaseClient
+from .clients.response_cache import ResponseCache, response_key
+
+
+class Grade(BaseModel):
+    correct: int
+
+
+class CountingClient(BaseClient):
+    """A provider that answers from the request and counts its calls."""
+    calls: int = 0
+
+    def initialize_client(self, default_model):
+        self.default_model = default_model
+
+    def invoke(self, messages, config=None, response_format=None, return_usage=False):
+        self.calls += 1
+        output = Grade(correct=len(messages)) if response_format is Grade else f"answer to {messages}"
+        usage = {"input_tokens": 10, "output_tokens": 2}
+        return (output, usage) if return_usage else output
+
+    async def ainvoke(self, messages, config=None, response_format=None, return_usage=False):
+        return self.invoke(messages, config, response_format, return_usage)
+
+
+def test_key_is_canonical():
+    config = {"temperature": 0.1, "max_tokens": 10}
+    key = response_key("p", "hi", config, None, "m")
+    assert key == response_key("p", [{"role": "user", "content": "hi"}], {"max_tokens": 10, "temperature": 0.1, "model": "m"}, None, "m")
+    assert key != response_key("p", "hi", {**config, "temperature": 0.2}, None, "m")
+    assert key != response_key("p", "hi", config, Grade, "m")
+    assert key != response_key("p", "hi", {**config, "model": "other"}, None, "m")
+
+
+def test_repeated_calls_hit_the_cache(tmp_path):
+    client = CountingClient(default_model="m", response_cache=ResponseCache(str(tmp_path / "llm.sqlite3")))
+    first, usage = client.invoke("grade this", config={"temperature": 0.1}, response_format=Grade, return_usage=True)
+    again, cached_usage = client.invoke("grade this", config={"temperature": 0.1}, response_format=Grade, return_usage=True)
+
+    assert client.calls == 1
+    assert again == first and isinstance(again, Grade)
+    assert usage == {"input_tokens": 10, "output_tokens": 2}
+    assert cached_usage["input_tokens"] == 0 and cached_usage["cached"]
+    assert asyncio.run(client.ainvoke("grade this", config={"temperature": 0.1}, response_format=Grade)) == first
+
+    stats = client.response_cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["input_tokens_saved"] == 20
+
+
+def test_cache_survives_restart_and_skips_streams(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    CountingClient(default_model="m", response_cache=ResponseCache(path)).invoke("hi")
+
+    client = CountingClient(default_model="m", response_cache=ResponseCache(path))
+    assert client.invoke("hi") == "answer to hi"
+    assert client.calls == 0
+    client.invoke("hi", config={"stream": True})
+    assert client.calls == 1
+
+
+def test_async_lookups_run_off_the_event_loop_thread(tmp_path):
+    threads = []
+
+    class RecordingCache(ResponseCache):
+        def get(self, *args):
+            threads.append(threading.get_ident())
+            return super().get(*args)
+
+        def put(self, *args):
+            threads.append(threading.get_ident())
+            super().put(*args)
+
+    class AsyncClient(CountingClient):
+        # CountingClient.ainvoke goes through the cached sync invoke
+        async def ainvoke(self, messages, config=None, response_format=None, return_usage=False):
+            self.calls += 1
+            return ("answer", {}) if return_usage else "answer"
+
+    async def ask_twice():
+        threads.append(threading.get_ident())
+        await client.ainvoke("hi")
+        return await client.ainvoke("hi")
+
+    client = AsyncClient(default_model="m", response_cache=RecordingCache(str(tmp_path / "llm.sqlite3")))
+    assert asyncio.run(ask_twice()) == "answer"
+    assert client.calls == 1
+    loop_thread, *cache_threads = threads
+    assert len(cache_threads) == 3 and loop_thread not in cache_threads
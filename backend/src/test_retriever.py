@@ -0,0 +1,41 @@
+from .retriever import Retriever
+
+
+def make_retriever():
+    # Only the SQL building and row merging are exercised, so skip the client and pool setup
+    retriever = Retriever.__new__(Retriever)
+    retriever.hybrid_candidates = 0
+    return retriever
+
+
+def test_expanded_search_is_one_statement_for_any_size():
+    retriever = make_retriever()
+    for size in (1, 5):
+        sql_query, args = retriever._expanded_search_sql(
+            "hybrid", "stall count", 3, size, "OR", 60, 0.5, 0.5, [0.1, 0.2], "%s::VECTOR"
+        )
+        assert sql_query.count("%s") == len(args)
+        assert "hybrid_search(%s, %s::VECTOR" in sql_query
+        assert args[0] == "stall | count" and args[-2:] == (size, size)
+
+
+def test_merge_expanded_rows_groups_consecutive_positions():
+    rows = [
+        # hits, in rank order
+        (1, 12, "c", None, "rules", 0.9, None, None),
+        (2, 40, "term", None, "glossary", 0.8, None, None),
+        (3, 10, "a", None, "rules", 0.7, None, None),
+        (4, 30, "x", None, "rules", 0.6, None, None),
+        # neighbors by chunk_index; the windows of 10 and 12 overlap on 11 (id 7 after an incremental load)
+        (None, 10, "a", None, "rules", None, 10, 0),
+        (None, 7, "b", None, "rules", None, 10, 1),
+        (None, 7, "b", None, "rules", None, 12, 1),
+        (None, 12, "c", None, "rules", None, 12, 2),
+        (None, 30, "x", None, "rules", None, 30, 8),
+    ]
+    merged = make_retriever()._merge_expanded_rows(rows)
+    assert [doc["ids"] for doc in merged[:2]] == [[10, 7, 12], [30]]
+    assert merged[0]["content"] == "a\n\nb\n\nc"
+    assert merged[0]["id"] == 7 and merged[0]["first_appearance"] == 0
+    assert merged[1]["first_appearance"] == 3
+    assert merged[2] == {"id": 40, "content": "term", "source": "glossary"}
@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+from .vector_index import VectorIndex, top_k_indices
+
+
+def make_rows(n=50, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n, dim))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return [(i + 1, f"doc {i + 1}", None, "rules", embeddings[i].tolist()) for i in range(n)], embeddings
+
+
+def test_top_k_indices():
+    scores = np.array([0.1, 0.9, 0.5, 0.7])
+    assert top_k_indices(scores, 2).tolist() == [1, 3]
+    assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 0]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def test_similarity_search_matches_brute_force():
+    rows, embeddings = make_rows()
+    index = VectorIndex.from_rows(rows)
+    query = embeddings[7] + 0.1 * embeddings[3]
+
+    results = index.similarity_search(query, limit=5)
+
+    expected = np.argsort(-(embeddings @ query))[:5] + 1
+    assert [row[0] for row in results] == expected.tolist()
+    assert results[0][:4] == (8, "doc 8", None, "rules")
+    assert results[0][4] >= results[-1][4]
+    assert index.snapshot.matrix.dtype == np.float32
+    assert index.snapshot.matrix.flags["C_CONTIGUOUS"]
+
+
+def test_rows_without_embeddings_are_skipped():
+    rows, _ = make_rows(n=3)
+    rows.append((4, "no embedding", None, "rules", None))
+    assert len(VectorIndex.from_rows(rows)) == 3
+
+
+def test_hybrid_search_rrf():
+    rows, embeddings = make_rows(n=20)
+    index = VectorIndex.from_rows(rows)
+    query = embeddings[0]
+    vector_order = (np.argsort(-(embeddings @ query)) + 1).tolist()
+    fts_rows = [(vector_order[-1], "doc", None, "rules", 0.9)]
+
+    results = index.hybrid_search(query, fts_rows, limit=20, k=60, semantic_weight=0.5, fts_weight=0.5)
+    scores = {row[0]: row[4] for row in results}
+
+    last = vector_order[-1]
+    assert scores[last] == 0.5 / (60 + 20) + 0.5 / (60 + 1)
+    assert scores[vector_order[0]] == 0.5 / (60 + 1) + 0.5 / (60 + 1_000_000)
+    assert [row[0] for row in results][:2] == [last, vector_order[0]]
+
+
+def test_batched_search_matches_single_queries():
+    rows, embeddings = make_rows(n=30)
+    index = VectorIndex.from_rows(rows)
+    queries = [embeddings[2], embeddings[9] + embeddings[4], embeddings[20]]
+    fts_rows = [[(5, "", None, "rules", 1.0)], [], [(21, "", None, "rules", 1.0), (1, "", None, "rules", 0.5)]]
+
+    batched = index.similarity_search_many(queries, limit=4)
+    single = [index.similarity_search(q, limit=4) for q in queries]
+    assert [[row[0] for row in rows] for rows in batched] == [[row[0] for row in rows] for rows in single]
+    assert [row[4] for rows in batched for row in rows] == pytest.approx([row[4] for rows in single for row in rows], abs=1e-6)
+
+    assert index.hybrid_search_many(queries, fts_rows, limit=4) == [
+        index.hybrid_search(q, fts, limit=4) for q, fts in zip(queries, fts_rows)
+    ]
@@ -0,0 +1,47 @@
+"""Token counts for prompt budgets and reporting.
+
+Counts use tiktoken's o200k_base encoding (the GPT-4o tokenizer) when tiktoken
+is installed and the encoding can be loaded; tiktoken downloads encodings on
+first use, so an offline process may not have it. Otherwise counts are
+estimated at about 4 characters per token, which is close enough for budgets
+and for comparing two renderings of the same text.
+
+Loading the encoding can download it, so the API loads it at startup in a
+worker thread (`get_encoding`) rather than on the event loop at the first
+request.
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = os.getenv("TOKEN_COUNT_ENCODING", "o200k_base")  # a tiktoken encoding, or "estimate"
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tiktoken encoding used for counts, or None when counts are estimated."""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            if DEFAULT_ENCODING != "estimate":
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+                except Exception as e:
+                    logger.info(f"Token counts are estimated, could not load the {DEFAULT_ENCODING} encoding: {e}")
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in a text."""
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,228 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from .db_pool import get_db_pool, get_db_settings
+from .embedding_artifacts import load_artifact
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = float(os.getenv("VECTOR_INDEX_REFRESH_INTERVAL", 30))
+
+
+def top_k_indices(scores: np.ndarray, limit: int) -> np.ndarray:
+    """Indices of the `limit` highest scores along the last axis, best first.
+
+    Works on a single score vector or on a (queries, documents) score matrix.
+    """
+    n = scores.shape[-1]
+    limit = min(limit, n)
+    if limit <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if limit < n:
+        candidates = np.argpartition(-scores, limit - 1, axis=-1)[..., :limit]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class IndexSnapshot:
+    """Immutable copy of the documents table: one float32 row per embedding."""
+
+    def __init__(self, rows: list[tuple], version: int | None = None):
+        rows = [row for row in rows if row[4] is not None]
+        self.version = version
+        self.docs = [row[:4] for row in rows]  # (id, content, context, source)
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.positions = {int(doc_id): i for i, doc_id in enumerate(self.ids)}
+        if rows:
+            self.matrix = np.ascontiguousarray(np.vstack([row[4] for row in rows]), dtype=np.float32)
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+
+    @classmethod
+    def from_matrix(cls, docs: list[tuple], matrix: np.ndarray, version: int | None = None) -> "IndexSnapshot":
+        """Snapshot over an existing (documents, dimensions) float32 matrix, e.g. a memory-mapped artifact, without copying it."""
+        snapshot = cls([], version)
+        snapshot.docs = list(docs)
+        snapshot.ids = np.array([doc[0] for doc in docs], dtype=np.int64)
+        snapshot.positions = {int(doc_id): i for i, doc_id in enumerate(snapshot.ids)}
+        snapshot.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        return snapshot
+
+    def __len__(self):
+        return len(self.docs)
+
+    def scores(self, query_embeddings) -> np.ndarray:
+        """Inner products with one query (n,) or with a batch of queries (q, n) in one matmul."""
+        return np.asarray(query_embeddings, dtype=np.float32) @ self.matrix.T
+
+    def rows(self, indices, scores) -> list[tuple]:
+        return [(*self.docs[i], float(scores[i])) for i in indices]
+
+
+class VectorIndex:
+    """In-memory exact inner-product search over the embeddings in `documents`.
+
+    All embeddings are held in one contiguous float32 matrix, so a query is a
+    single matrix-vector product plus `argpartition`. The index reloads when
+    `corpus_version` (bumped by a trigger on `documents`) changes; the version is
+    checked at most every `refresh_interval` seconds.
+    """
+
+    def __init__(self, db_settings: dict | None = None, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.db_settings = db_settings or get_db_settings()
+        self.refresh_interval = refresh_interval
+        self.snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows: list[tuple], version: int | None = None) -> "VectorIndex":
+        """Build an index from (id, content, context, source, embedding) rows without touching the database."""
+        index = cls(db_settings={}, refresh_interval=float("inf"))
+        index.snapshot = IndexSnapshot(rows, version)
+        index._checked_at = time.monotonic()
+        return index
+
+    @classmethod
+    def from_artifacts(cls, prefixes: dict[str, str]) -> "VectorIndex":
+        """
+        Build an index from embedding artifacts without touching the database.
+
+        Args:
+            prefixes (dict[str, str]): Artifact prefix per source, in load order. Ids are
+                assigned from 1 in that order, as a fresh bulk load into `documents` would.
+        """
+        docs, matrices = [], []
+        for source, prefix in prefixes.items():
+            sidecar, matrix = load_artifact(prefix)
+            for item in sidecar["items"]:
+                docs.append((len(docs) + 1, item["chunk"], item.get("context"), source))
+            matrices.append(matrix)
+        index = cls(db_settings={}, refresh_interval=float("inf"))
+        # A single artifact stays memory-mapped; several are concatenated once
+        matrix = matrices[0] if len(matrices) == 1 else np.concatenate(matrices)
+        index.snapshot = IndexSnapshot.from_matrix(docs, matrix)
+        index._checked_at = time.monotonic()
+        return index
+
+    def _query(self, sql_query, args=()):
+        with get_db_pool(self.db_settings).connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql_query, args)
+                return cursor.fetchall()
+
+    def get_corpus_version(self) -> int:
+        return self._query("SELECT version FROM corpus_version")[0][0]
+
+    def load(self) -> IndexSnapshot:
+        start = time.perf_counter()
+        version = self.get_corpus_version()
+        rows = self._query("SELECT id, content, context, source, embedding FROM documents ORDER BY id")
+        self.snapshot = IndexSnapshot(rows, version)
+        self._checked_at = time.monotonic()
+        logger.info(
+            f"Loaded vector index: {len(self.snapshot)} documents, version {version}, "
+            f"{self.snapshot.matrix.nbytes / 1e6:.1f} MB in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        return self.snapshot
+
+    def needs_check(self) -> bool:
+        return self.snapshot is None or time.monotonic() - self._checked_at >= self.refresh_interval
+
+    def refresh(self) -> IndexSnapshot:
+        """Reload if the documents table changed since the last load. Blocks on the database."""
+        with self._lock:
+            if self.snapshot is None:
+                return self.load()
+            if not self.needs_check():
+                return self.snapshot
+            version = self.get_corpus_version()
+            self._checked_at = time.monotonic()
+            if version != self.snapshot.version:
+                logger.info(f"corpus_version changed ({self.snapshot.version} -> {version}), reloading vector index")
+                return self.load()
+            return self.snapshot
+
+    def get_snapshot(self) -> IndexSnapshot:
+        return self.refresh() if self.needs_check() else self.snapshot
+
+    def similarity_search(self, query_embedding, limit: int = 3) -> list[tuple]:
+        """Same rows as the `similarity_search` SQL function: (id, content, context, source, similarity)."""
+        return self.similarity_search_many([query_embedding], limit)[0]
+
+    def similarity_search_many(self, query_embeddings: list, limit: int = 3) -> list[list[tuple]]:
+        """`similarity_search` for a batch of queries, scored with a single matrix-matrix product."""
+        snapshot = self.get_snapshot()
+        if len(snapshot) == 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
+        scores = snapshot.scores(np.vstack(query_embeddings))
+        top = top_k_indices(scores, limit)
+        return [snapshot.rows(top[q], scores[q]) for q in range(len(top))]
+
+    def hybrid_search(
+            self,
+            query_embedding,
+            fts_rows: list[tuple],
+            limit: int = 3,
+            k: int = 60,
+            semantic_weight: float = 0.5,
+            fts_weight: float = 0.5
+        ) -> list[tuple]:
+        """Weighted reciprocal rank fusion of the in-memory ranking with full-text results.
+
+        Matches the `hybrid_search` SQL function: `fts_rows` are the `fts_search`
+        rows for the query (best first), documents without a text match get rank
+        1,000,000. Returns (id, content, context, source, rrf_score) rows.
+        """
+        return self.hybrid_search_many([query_embedding], [fts_rows], limit, k, semantic_weight, fts_weight)[0]
+
+    def hybrid_search_many(
+            self,
+            query_embeddings: list,
+            fts_rows_per_query: list[list[tuple]],
+            limit: int = 3,
+            k: int = 60,
+            semantic_weight: float = 0.5,
+            fts_weight: float = 0.5
+        ) -> list[list[tuple]]:
+        """`hybrid_search` for a batch of queries; ranks and fused scores are computed as (queries, documents) arrays."""
+        snapshot = self.get_snapshot()
+        n = len(snapshot)
+        if n == 0 or len(query_embeddings) == 0:
+            return [[] for _ in query_embeddings]
+        scores = snapshot.scores(np.vstack(query_embeddings))
+        order = np.argsort(-scores, axis=1, kind="stable")
+        vector_rank = np.empty(scores.shape, dtype=np.float64)
+        np.put_along_axis(vector_rank, order, np.arange(1, n + 1, dtype=np.float64)[None, :], axis=1)
+
+        text_rank = np.full(scores.shape, 1_000_000, dtype=np.float64)
+        for q, fts_rows in enumerate(fts_rows_per_query):
+            for rank, row in enumerate(fts_rows, start=1):
+                position = snapshot.positions.get(row[0])
+                if position is not None:
+                    text_rank[q, position] = rank
+
+        rrf_scores = semantic_weight / (k + vector_rank) + fts_weight / (k + text_rank)
+        top = top_k_indices(rrf_scores, limit)
+        return [snapshot.rows(top[q], rrf_scores[q]) for q in range(len(top))]
+
+    def __len__(self):
+        return len(self.get_snapshot())
+
+
+_vector_indexes = {}
+_vector_indexes_lock = threading.Lock()
+
+
+def get_vector_index(db_settings: dict | None = None) -> VectorIndex:
+    """Return the process-wide vector index for these connection settings."""
+    db_settings = db_settings or get_db_settings()
+    key = tuple(sorted((k, str(v)) for k, v in db_settings.items()))
+    with _vector_indexes_lock:
+        if key not in _vector_indexes:
+            _vector_indexes[key] = VectorIndex(db_settings)
+        return _vector_indexes[key]
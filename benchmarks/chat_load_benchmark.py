@@ -0,0 +1,132 @@
+"""Concurrent load benchmark for the /chat endpoint.
+
+Fires `--requests` chat requests at a running API with a fixed number of
+in-flight requests and reports throughput and latency percentiles for each
+concurrency level. While the load runs, /api/health is probed in the
+background. The probe shows whether a request waiting on an LLM call holds up
+other requests: that is what a blocking handler would do, and what the async
+pipeline should not do.
+
+No results are checked in, because a run needs a live API with its database
+and LLM keys. To compare before and after, run it against a server started
+from each revision:
+
+    uvicorn src.api.app:app --port 8000            # in backend/
+    python benchmarks/chat_load_benchmark.py --email me@example.com --password ... \
+        --concurrency 1 4 16 --requests 32 --out benchmarks/results/chat_load_async.csv
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import asyncio
+import csv
+import os
+import statistics
+import time
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "what is a callahan?",
+    "how many stall counts are there?",
+    "what happens after a pick is called?",
+    "what is a double team?",
+]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, round(pct / 100 * (len(values) - 1)))
+    return values[index]
+
+
+async def get_token(client: httpx.AsyncClient, email: str, password: str) -> str:
+    response = await client.post("/token", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def probe_health(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list[float], interval: float = 0.1):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            await client.get("/api/health")
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+
+
+async def run_level(client: httpx.AsyncClient, token: str, concurrency: int, n_requests: int, questions: list[str]) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/chat",
+                json={"message": questions[i % len(questions)]},
+                headers=headers
+            )
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    stop = asyncio.Event()
+    health_latencies = []
+    prober = asyncio.create_task(probe_health(client, stop, health_latencies))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await prober
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 2),
+        "latency_p95_s": round(percentile(latencies, 95), 2),
+        "latency_mean_s": round(statistics.mean(latencies), 2) if latencies else 0.0,
+        "health_p50_ms": round(percentile(health_latencies, 50) * 1000, 1),
+        "health_max_ms": round(max(health_latencies, default=0.0) * 1000, 1),
+    }
+
+
+async def main(args):
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+        token = await get_token(client, args.email, args.password)
+        results = []
+        for concurrency in args.concurrency:
+            print(f"concurrency={concurrency} ...", end="\r")
+            result = await run_level(client, token, concurrency, args.requests, DEFAULT_QUESTIONS)
+            results.append(result)
+            print(result)
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent /chat load benchmark")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the running API")
+    parser.add_argument("--email", required=True, help="Login email")
+    parser.add_argument("--password", required=True, help="Login password")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="In-flight request levels to test")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--out", default=None, help="Optional CSV path for the results")
+    asyncio.run(main(parser.parse_args()))
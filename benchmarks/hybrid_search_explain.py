@@ -0,0 +1,187 @@
+"""EXPLAIN ANALYZE benchmark of hybrid_search vs hybrid_search_indexed on a synthetic corpus.
+
+Builds a scratch schema with a `documents` table shaped like the real one (same
+generated tsvector column, HNSW and GIN indexes), fills it with `--docs` random
+documents server-side, then times both SQL functions on the same random queries.
+The functions resolve `documents` through the search_path, so they run against
+the scratch table. The nested plans are captured with auto_explain (needs a
+superuser, as in the docker-compose database) to show which indexes are used.
+
+    python benchmarks/hybrid_search_explain.py --docs 100000 --queries 20 --keep
+    python benchmarks/hybrid_search_explain.py --reuse --candidates 200   # rerun on the kept corpus
+
+Building 100k 1536-dimensional vectors plus the HNSW index takes a few minutes.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import argparse
+import os
+import statistics
+import time
+import numpy as np
+import psycopg2
+from pgvector.psycopg2 import register_vector
+
+SCHEMA = "hybrid_bench"
+VOCABULARY = [
+    "pick", "foul", "stall", "count", "disc", "marker", "thrower", "receiver", "callahan", "endzone",
+    "pull", "turnover", "contest", "observer", "timeout", "line", "point", "offense", "defense", "travel",
+    "strip", "block", "score", "field", "brick", "sideline", "possession", "check", "play", "call",
+    "violation", "double", "team", "spirit", "captain", "substitution", "injury", "half", "goal", "huck",
+]
+
+
+def connect():
+    conn = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+    )
+    conn.autocommit = True
+    register_vector(conn)
+    return conn
+
+
+def build_corpus(cursor, n_docs: int, words_per_doc: int = 40):
+    print(f"building {n_docs} synthetic documents in schema {SCHEMA} ...")
+    start = time.perf_counter()
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.documents (LIKE public.documents INCLUDING DEFAULTS INCLUDING GENERATED)")
+    cursor.execute(f"CREATE SEQUENCE {SCHEMA}.documents_id_seq OWNED BY {SCHEMA}.documents.id")
+    cursor.execute(f"ALTER TABLE {SCHEMA}.documents ALTER COLUMN id SET DEFAULT nextval('{SCHEMA}.documents_id_seq')")
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.documents (content, context, source, embedding)
+        SELECT words.content, NULL, 'rules', vec.embedding
+        FROM generate_series(1, %s) AS g
+        CROSS JOIN LATERAL (
+            SELECT string_agg((%s::TEXT[])[1 + floor(random() * %s)::INT], ' ') AS content
+            FROM generate_series(1, %s) WHERE g > 0
+        ) words
+        CROSS JOIN LATERAL (
+            SELECT array_agg(random() - 0.5)::VECTOR(1536) AS embedding
+            FROM generate_series(1, 1536) WHERE g > 0
+        ) vec
+    """, (n_docs, VOCABULARY, len(VOCABULARY), words_per_doc))
+    print(f"  rows loaded in {time.perf_counter() - start:.0f} s")
+
+    start = time.perf_counter()
+    cursor.execute("SET maintenance_work_mem = '1GB'")
+    cursor.execute(f"ALTER TABLE {SCHEMA}.documents ADD PRIMARY KEY (id)")
+    cursor.execute(f"CREATE INDEX ON {SCHEMA}.documents USING hnsw (embedding vector_ip_ops)")
+    cursor.execute(f"CREATE INDEX ON {SCHEMA}.documents USING GIN (content_tsv)")
+    cursor.execute(f"ANALYZE {SCHEMA}.documents")
+    print(f"  indexes built in {time.perf_counter() - start:.0f} s")
+
+
+def random_queries(n_queries: int, seed: int = 0) -> list[tuple[str, np.ndarray]]:
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(VOCABULARY, size=3, replace=False)
+        queries.append((" | ".join(words), (rng.random(1536) - 0.5).astype(np.float32)))
+    return queries
+
+
+FUNCTIONS = {
+    "hybrid_search": "SELECT * FROM hybrid_search(%s, %s::VECTOR, %s, %s, %s, %s)",
+    "hybrid_search_indexed": "SELECT * FROM hybrid_search_indexed(%s, %s::VECTOR, %s, %s, %s, %s, %s)",
+}
+
+
+def function_args(name, query_text, embedding, limit, candidates):
+    args = (query_text, embedding, limit, 60, 0.5, 0.5)
+    return args + (candidates,) if name == "hybrid_search_indexed" else args
+
+
+def time_function(cursor, name: str, queries, limit: int, candidates: int) -> dict:
+    latencies = []
+    for query_text, embedding in queries:
+        start = time.perf_counter()
+        cursor.execute(FUNCTIONS[name], function_args(name, query_text, embedding, limit, candidates))
+        cursor.fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "function": name,
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 1),
+        "max_ms": round(latencies[-1], 1),
+    }
+
+
+def overlap_with_exact(cursor, queries, limit: int, candidates: int) -> float:
+    """Mean fraction of the exhaustive hybrid_search results that hybrid_search_indexed also returns."""
+    overlaps = []
+    for query_text, embedding in queries:
+        results = {}
+        for name in FUNCTIONS:
+            cursor.execute(FUNCTIONS[name], function_args(name, query_text, embedding, limit, candidates))
+            results[name] = {row[0] for row in cursor.fetchall()}
+        exact = results["hybrid_search"]
+        overlaps.append(len(exact & results["hybrid_search_indexed"]) / len(exact) if exact else 1.0)
+    return round(statistics.mean(overlaps), 3)
+
+
+def explain_function(conn, name: str, query, limit: int, candidates: int) -> str:
+    """EXPLAIN ANALYZE of the statements run inside the function, via auto_explain."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("LOAD 'auto_explain'")
+    except psycopg2.Error as e:
+        return f"(auto_explain unavailable: {e.pgerror or e})"
+    cursor.execute("SET auto_explain.log_min_duration = 0")
+    cursor.execute("SET auto_explain.log_analyze = on")
+    cursor.execute("SET auto_explain.log_buffers = on")
+    cursor.execute("SET auto_explain.log_nested_statements = on")
+    cursor.execute("SET client_min_messages = log")
+    del conn.notices[:]
+    cursor.execute(FUNCTIONS[name], function_args(name, *query, limit, candidates))
+    cursor.fetchall()
+    cursor.execute("SET client_min_messages = notice")
+    cursor.execute("SET auto_explain.log_min_duration = -1")
+    # The nested statement plans are logged before the outer Function Scan
+    return "".join(conn.notices[:-1] or conn.notices)
+
+
+def main(args):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass(%s)", (f"{SCHEMA}.documents",))
+    exists = cursor.fetchone()[0] is not None
+    if exists and args.reuse:
+        cursor.execute(f"SELECT COUNT(*) FROM {SCHEMA}.documents")
+        print(f"reusing {cursor.fetchone()[0]} documents in {SCHEMA}")
+    else:
+        build_corpus(cursor, args.docs)
+
+    cursor.execute(f"SET search_path = {SCHEMA}, public")
+    queries = random_queries(args.queries)
+    # warm the caches once per function before timing
+    for name in FUNCTIONS:
+        time_function(cursor, name, queries[:1], args.limit, args.candidates)
+
+    for name in FUNCTIONS:
+        print(time_function(cursor, name, queries, args.limit, args.candidates))
+    print(f"overlap of indexed with exact top-{args.limit}: {overlap_with_exact(cursor, queries, args.limit, args.candidates)}")
+    for name in FUNCTIONS:
+        print(f"\n===== EXPLAIN ANALYZE {name} =====")
+        print(explain_function(conn, name, queries[0], args.limit, args.candidates))
+
+    if not args.keep:
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN ANALYZE benchmark of the hybrid search SQL functions")
+    parser.add_argument("--docs", type=int, default=100_000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=20, help="Queries timed per function")
+    parser.add_argument("--limit", type=int, default=5, help="Results per query")
+    parser.add_argument("--candidates", type=int, default=100, help="candidate_num for hybrid_search_indexed")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema after the run")
+    parser.add_argument("--reuse", action="store_true", help="Reuse the scratch schema from a previous --keep run")
+    main(parser.parse_args())
@@ -0,0 +1,159 @@
+"""Prompt tokens and latency of the compact prompt format vs indented JSON.
+
+Uses the multiple-choice eval set (evals/datasets/multiple_choice_qa.json),
+with each question formatted the way evaluate_multiple_choice.py asks it.
+
+By default only tokens are measured: the context is retrieved once per question
+and the select_rules and answer prompts are built from it in each format
+(the answer prompt from the unfiltered context, as no LLM is called). Needs
+the database and the embedding API, but makes no chat completions.
+
+With --latency every question is also answered end to end by RagChat once per
+format, alternating which format goes first so warm caches favour neither, and
+the wall time and prompt tokens of each request are recorded. The answer cache
+is disabled so every request runs the full pipeline.
+
+    python benchmarks/prompt_format_benchmark.py --limit 50
+    python benchmarks/prompt_format_benchmark.py --latency --limit 20 --client openai \
+        --email me@example.com --out benchmarks/results/prompt_format.csv
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import sys
+
+# Every request must reach the LLM: no answer reuse, no replayed responses
+os.environ["ANSWER_CACHE_SIZE"] = "0"
+os.environ["LLM_RESPONSE_CACHE"] = "none"
+# The --latency run reads the prompt tokens of each request from the prompt token counter
+os.environ["COUNT_PROMPT_TOKENS"] = "true"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import argparse
+import csv
+import json
+import statistics
+import time
+from src.prompt_rendering import PROMPT_FORMATS, use_prompt_format, get_prompt_token_counter
+from src.prompts import get_rag_prompt, get_relevant_rules_definitions_prompt
+from src.token_count import count_tokens, get_encoding
+from src.rag_chat import RagChat, Answer
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "evals", "datasets", "multiple_choice_qa.json")
+RETRIEVER_KWARGS = {
+    "search_type": "hybrid",
+    "fts_operator": "OR",
+    "limit": 6,
+    "expand_context": 0,
+}
+
+
+def load_questions(limit: int | None) -> list[str]:
+    with open(DATASET) as f:
+        questions = json.load(f)
+    texts = [
+        question["question"] + "\n" + "\n".join(f"{choice['letter']}. {choice['text']}" for choice in question["choices"])
+        for question in questions
+    ]
+    return texts[:limit] if limit else texts
+
+
+def prompt_tokens(rag_chat: RagChat, questions: list[str]) -> list[dict]:
+    """Tokens of the select_rules and answer prompts of each question, in each format."""
+    rows = []
+    for i, query in enumerate(questions, start=1):
+        print(f"question {i} of {len(questions)}", end="\r")
+        context = rag_chat._prepare_context(rag_chat._get_docs(query, **RETRIEVER_KWARGS))
+        history = [{"role": "user", "content": query}]
+        for prompt_format in PROMPT_FORMATS:
+            use_prompt_format(prompt_format)
+            rows.append({
+                "question": i,
+                "format": prompt_format,
+                "rules": len(context["rules"]),
+                "select_rules_tokens": count_tokens(get_relevant_rules_definitions_prompt(query, history, context)),
+                "answer_tokens": count_tokens(get_rag_prompt(query, context, history, response_format=Answer)),
+            })
+    print()
+    return rows
+
+
+def end_to_end(rag_chat: RagChat, questions: list[str], email: str) -> list[dict]:
+    """Wall time and prompt tokens of answering each question in each format."""
+    counter = get_prompt_token_counter()
+    rows = []
+    for i, query in enumerate(questions, start=1):
+        print(f"question {i} of {len(questions)}", end="\r")
+        formats = PROMPT_FORMATS if i % 2 else list(reversed(PROMPT_FORMATS))
+        for prompt_format in formats:
+            use_prompt_format(prompt_format)
+            conversation_id = rag_chat.create_conversation(email)
+            counter.reset()
+            start = time.perf_counter()
+            answer = rag_chat.answer_question(query, conversation_id, retriever_kwargs=RETRIEVER_KWARGS)
+            if not isinstance(answer, str):
+                answer = "".join(answer)
+            latency = time.perf_counter() - start
+            stats = counter.stats()
+            rows.append({
+                "question": i,
+                "format": prompt_format,
+                "latency_s": round(latency, 3),
+                "prompt_tokens": sum(stage["tokens"] for stage in stats.values()),
+                **{f"{name}_tokens": stage["tokens"] for name, stage in stats.items()},
+            })
+    print()
+    return rows
+
+
+def summarize(rows: list[dict]):
+    columns = [column for column in rows[0] if column.endswith("_tokens") or column == "latency_s"]
+    by_format = {prompt_format: [row for row in rows if row["format"] == prompt_format] for prompt_format in PROMPT_FORMATS}
+    print(f"{'':22}" + "".join(f"{prompt_format:>12}" for prompt_format in PROMPT_FORMATS) + f"{'change':>10}")
+    for column in columns:
+        means = [statistics.mean(row.get(column, 0) for row in by_format[prompt_format]) for prompt_format in PROMPT_FORMATS]
+        compact, baseline = means
+        change = f"{(compact - baseline) / baseline:+.1%}" if baseline else ""
+        print(f"{'mean ' + column:22}" + "".join(f"{mean:12.1f}" for mean in means) + f"{change:>10}")
+    if "latency_s" in columns:
+        for pct, label in ((50, "p50"), (95, "p95")):
+            values = []
+            for prompt_format in PROMPT_FORMATS:
+                latencies = sorted(row["latency_s"] for row in by_format[prompt_format])
+                values.append(latencies[min(len(latencies) - 1, round(pct / 100 * (len(latencies) - 1)))])
+            print(f"{label + ' latency_s':22}" + "".join(f"{value:12.2f}" for value in values))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=None, help="number of eval questions to use (default: all)")
+    parser.add_argument("--latency", action="store_true", help="also answer every question end to end in each format")
+    parser.add_argument("--client", default="openai", help="llm client type for --latency")
+    parser.add_argument("--email", default=os.getenv("BENCHMARK_EMAIL", "benchmark@example.com"), help="user the --latency conversations belong to")
+    parser.add_argument("--out", help="write the per-question results to this CSV file")
+    args = parser.parse_args()
+
+    print(f"token counts: {'tiktoken' if get_encoding() is not None else 'estimated (~4 characters per token)'}")
+    questions = load_questions(args.limit)
+    rag_chat = RagChat(llm_client_type=args.client, memory_size=0)
+
+    rows = prompt_tokens(rag_chat, questions)
+    summarize(rows)
+    if args.latency:
+        latency_rows = end_to_end(rag_chat, questions, args.email)
+        summarize(latency_rows)
+        rows = latency_rows
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+        with open(args.out, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,7 +12,9 @@ CREATE TABLE IF NOT EXISTS documents (
     content TEXT,
     source TEXT,
     embedding VECTOR(1536),
-    content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED
+    content_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', content)) STORED,
+    chunk_index INTEGER,  -- position of the chunk within its source document
+    content_hash TEXT  -- sha256 of content, context, source and embedding model (incremental loads)
 );
 
 -- Create users table
@@ -53,10 +55,22 @@ CREATE TABLE IF NOT EXISTS llm_calls (
     input_tokens INTEGER,
     output_tokens INTEGER,
     cost FLOAT,
+    ttft_ms FLOAT, -- time to first token for streamed calls, measured from the start of the request
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE
 );
 
+-- Per-conversation totals of llm_calls, kept current by a statement trigger on llm_calls
+CREATE TABLE IF NOT EXISTS conversation_costs (
+    conversation_id UUID PRIMARY KEY,
+    llm_calls INTEGER NOT NULL DEFAULT 0,
+    input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    cost FLOAT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
+);
+
 -- CREATE MODELS TABLE
 CREATE TABLE IF NOT EXISTS models (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -65,9 +79,27 @@ CREATE TABLE IF NOT EXISTS models (
     output_token_cost FLOAT
 );
 
+-- Create corpus version table (single row, bumped whenever documents change)
+CREATE TABLE IF NOT EXISTS corpus_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO corpus_version (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+-- Create embedding cache table (persistent tier of the query-embedding cache)
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    embedding BYTEA NOT NULL,
+    last_used TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- ADD INDECES FOR SEARCH
 CREATE INDEX IF NOT EXISTS documents_embedding_idx ON documents USING hnsw (embedding vector_ip_ops);
-CREATE INDEX IF NOT EXISTS documents_content_tsv_idx ON documents USING GiST (content_tsv);
+CREATE INDEX IF NOT EXISTS documents_content_tsv_idx ON documents USING GIN (content_tsv);
+CREATE INDEX IF NOT EXISTS documents_source_chunk_index_idx ON documents(source, chunk_index);
+CREATE INDEX IF NOT EXISTS documents_content_hash_idx ON documents(content_hash);
 
 -- Add index for faster message retrieval by conversation with timestamp ordering
 CREATE INDEX IF NOT EXISTS messages_conversation_id_created_at_idx 
@@ -75,6 +107,7 @@ CREATE INDEX IF NOT EXISTS messages_conversation_id_created_at_idx
 
 -- Add after other indices
 CREATE INDEX IF NOT EXISTS users_email_idx ON users(email);
+CREATE INDEX IF NOT EXISTS embedding_cache_last_used_idx ON embedding_cache(last_used);
 
 --------- FUNCTIONS ---------
 
@@ -159,6 +192,72 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- INDEXED HYBRID SEARCH
+-- Same result columns as hybrid_search, but ranks only the top candidate_num documents from
+-- each side: an HNSW index scan for the vector side and a GIN-indexed @@ match for the text
+-- side, fused with weighted RRF. Documents missing from one side get rank 1000000 there.
+CREATE OR REPLACE FUNCTION hybrid_search_indexed(
+    query_text TEXT,
+    query_embedding VECTOR(1536),
+    limit_num INT,
+    k INTEGER DEFAULT 60,
+    semantic_weight FLOAT DEFAULT 0.5,
+    fts_weight FLOAT DEFAULT 0.5,
+    candidate_num INT DEFAULT 100
+)
+RETURNS TABLE(id INT, content TEXT, context TEXT, source TEXT, rrf_score FLOAT8) AS $$
+DECLARE
+    ts_query TSQUERY := to_tsquery('english', query_text);
+BEGIN
+    -- HNSW returns at most ef_search rows, so widen it to the candidate count for this transaction,
+    -- within pgvector's range for ef_search (at most 1000; larger candidate counts get 1000 vector rows)
+    PERFORM set_config('hnsw.ef_search', LEAST(GREATEST(candidate_num, 40), 1000)::TEXT, true);
+
+    RETURN QUERY
+    WITH vector_candidates AS (
+        SELECT 
+            nearest.id,
+            ROW_NUMBER() OVER (ORDER BY nearest.distance) AS vector_rank
+        FROM (
+            SELECT documents.id, documents.embedding <#> query_embedding AS distance
+            FROM documents
+            ORDER BY documents.embedding <#> query_embedding
+            LIMIT candidate_num
+        ) nearest
+    ),
+    text_candidates AS (
+        SELECT 
+            matches.id,
+            ROW_NUMBER() OVER (ORDER BY matches.text_score DESC) AS text_rank
+        FROM (
+            SELECT documents.id, ts_rank(documents.content_tsv, ts_query) AS text_score
+            FROM documents
+            WHERE documents.content_tsv @@ ts_query
+            ORDER BY text_score DESC
+            LIMIT candidate_num
+        ) matches
+    ),
+    fused AS (
+        SELECT 
+            COALESCE(v.id, t.id) AS doc_id,
+            (semantic_weight * 1.0 / (k + COALESCE(v.vector_rank, 1000000)) + 
+             fts_weight * 1.0 / (k + COALESCE(t.text_rank, 1000000))) AS score
+        FROM vector_candidates v
+        FULL OUTER JOIN text_candidates t ON v.id = t.id
+    )
+    SELECT 
+        documents.id,
+        documents.content,
+        documents.context,
+        documents.source,
+        fused.score::FLOAT8
+    FROM fused
+    JOIN documents ON documents.id = fused.doc_id
+    ORDER BY fused.score DESC
+    LIMIT limit_num;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Get conversation history function
 CREATE OR REPLACE FUNCTION get_conversation_history(
     _conversation_id UUID,
@@ -179,7 +278,7 @@ BEGIN
         m.created_at
     FROM messages m
     WHERE m.conversation_id = _conversation_id
-    ORDER BY m.created_at
+    ORDER BY m.created_at DESC
     LIMIT _message_limit;
 END;
 $$ LANGUAGE plpgsql;
@@ -199,6 +298,7 @@ RETURNS TABLE(
     input_tokens INTEGER,
     output_tokens INTEGER,
     cost FLOAT,
+    ttft_ms FLOAT,
     created_at TIMESTAMP WITH TIME ZONE
 ) AS $$
 BEGIN
@@ -216,6 +316,7 @@ BEGIN
             NULL as input_tokens,
             NULL as output_tokens,
             NULL as cost,
+            NULL as ttft_ms,
             m.created_at
         FROM messages m
         WHERE m.conversation_id = _conversation_id
@@ -234,6 +335,7 @@ BEGIN
             l.input_tokens,
             l.output_tokens,
             l.cost,
+            l.ttft_ms,
             l.created_at
         FROM llm_calls l
         WHERE l.message_id IN (SELECT id FROM messages WHERE conversation_id = _conversation_id)
@@ -290,11 +392,77 @@ END;
 $$ LANGUAGE plpgsql;
 
 -- create the trigger
+-- The application prices calls from an in-process copy of models and inserts the cost,
+-- so the lookup only runs for rows inserted without one
 CREATE TRIGGER set_llm_call_cost
     BEFORE INSERT ON llm_calls
     FOR EACH ROW
+    WHEN (NEW.cost IS NULL)
     EXECUTE FUNCTION calculate_llm_call_cost();
 
+-- Add the calls inserted by a statement to conversation_costs, one upsert per conversation
+CREATE OR REPLACE FUNCTION add_conversation_costs()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO conversation_costs AS c (conversation_id, llm_calls, input_tokens, output_tokens, cost)
+    SELECT
+        m.conversation_id,
+        COUNT(*),
+        COALESCE(SUM(n.input_tokens), 0),
+        COALESCE(SUM(n.output_tokens), 0),
+        COALESCE(SUM(n.cost), 0)
+    FROM new_llm_calls n
+    JOIN messages m ON m.id = n.message_id
+    GROUP BY m.conversation_id
+    ON CONFLICT (conversation_id) DO UPDATE SET
+        llm_calls = c.llm_calls + EXCLUDED.llm_calls,
+        input_tokens = c.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = c.output_tokens + EXCLUDED.output_tokens,
+        cost = c.cost + EXCLUDED.cost,
+        updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER llm_calls_conversation_costs
+    AFTER INSERT ON llm_calls
+    REFERENCING NEW TABLE AS new_llm_calls
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION add_conversation_costs();
+
+-- Backfill the totals of calls logged before the trigger existed
+INSERT INTO conversation_costs (conversation_id, llm_calls, input_tokens, output_tokens, cost)
+SELECT m.conversation_id, COUNT(*), COALESCE(SUM(l.input_tokens), 0), COALESCE(SUM(l.output_tokens), 0), COALESCE(SUM(l.cost), 0)
+FROM llm_calls l
+JOIN messages m ON m.id = l.message_id
+GROUP BY m.conversation_id
+ON CONFLICT (conversation_id) DO NOTHING;
+
+-- Bump corpus_version on any change to documents so in-process indexes know to reload
+CREATE OR REPLACE FUNCTION bump_corpus_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE corpus_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documents_corpus_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON documents
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION bump_corpus_version();
+
+-- Answer cache hit rate by day, from the lookups logged in llm_calls
+CREATE OR REPLACE VIEW answer_cache_hit_rate AS
+SELECT
+    date_trunc('day', created_at) AS day,
+    COUNT(*) AS lookups,
+    COUNT(*) FILTER (WHERE response = 'hit') AS hits,
+    ROUND(AVG((response = 'hit')::INT), 4) AS hit_rate
+FROM llm_calls
+WHERE message_type = 'answer_cache'
+GROUP BY 1;
+
 -- INITIAL DATA INSERTION --
 
 INSERT INTO users (email, password) 
@@ -306,4 +474,5 @@ INSERT INTO models (name, input_token_cost, output_token_cost) VALUES
     ('claude-3-5-haiku-20241022', 0.25/1e6, 1.25/1e6),
     ('claude-3-5-sonnet-20241022', 3/1e6, 15/1e6),
     ('llama3.1-70b', 0/1e6, 0/1e6),
-    ('llama3.1-8b', 0/1e6, 0/1e6);
\ No newline at end of file
+    ('llama3.1-8b', 0/1e6, 0/1e6),
+    ('answer_cache', 0, 0);  -- answer cache lookups logged in llm_calls
\ No newline at end of file
@@ -1,30 +1,34 @@
 from ultimate_rules_rag.clients.get_abstract_client import get_abstract_client
+from ultimate_rules_rag.clients.batch import run_batch
 from ultimate_rules_rag.rag_chat_session import RagChatSession
 import os
 import json
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import time
 
 load_dotenv()
 
 grading_client = get_abstract_client(client_type="openai", default_model="gpt-4o-mini")
+# "auto" grades through the OpenAI Batch API; "local" runs the grading calls concurrently instead
+GRADING_BATCH_BACKEND = os.getenv("GRADING_BATCH_BACKEND", "auto")
+
+
+class GradedQuestion(BaseModel):
+    number_of_expected_correct_answers: int
+    number_of_generated_correct_answers: int
+    number_of_generated_incorrect_answers: int
+
 
 def process_question(session, question: dict, retriever_kwargs: dict):
     
     print("generating answer  ", end = "\r")
     question_text, generated_answer = answer_question(session, question, retriever_kwargs)
-    processed_question = {
+    return {
         "question": question_text,
         "expected_answer": question["answers"],
         "generated_answer": generated_answer
     }
 
-    print("grading answer  ", end = "\r")
-    graded_question = grade_question(processed_question)
-
-    return processed_question | graded_question
-
 def answer_question(session, question: dict, retriever_kwargs: dict):
     session.history.prune_history()
 
@@ -36,7 +40,8 @@ def answer_question(session, question: dict, retriever_kwargs: dict):
     return question_text, answer
 
 
-def grade_question(processed_question: dict):
+def grading_request(processed_question: dict) -> dict:
+    """`invoke` arguments of the grading call for one answered question."""
     prompt = f"""You are a quiz-marking assistant. Please assign a grade to the following multiple choice question.
     The respondant may have included some extraneous information, so please ignore that.
     We want to know which choices (A, B, C, etc) they selected.
@@ -79,15 +84,30 @@ def grade_question(processed_question: dict):
     {processed_question["generated_answer"]}
     """.replace("    ", "")
 
-    class GradedQuestion(BaseModel):
-        number_of_expected_correct_answers: int
-        number_of_generated_correct_answers: int
-        number_of_generated_incorrect_answers: int
+    return {"messages": prompt, "config": {"temperature": 0.1}, "response_format": GradedQuestion}
 
-    graded_question = grading_client.invoke(prompt, config={"temperature": 0.1}, response_format=GradedQuestion)
 
+def grade_question(processed_question: dict):
+    graded_question = grading_client.invoke(**grading_request(processed_question))
     return graded_question.model_dump()
 
+
+def grade_questions(processed_questions: list[dict]) -> list[dict]:
+    """Grade all answered questions in one batch; a failed grading call records its grading_error instead of the grades."""
+    results = run_batch(
+        grading_client,
+        [grading_request(processed_question) for processed_question in processed_questions],
+        backend=GRADING_BATCH_BACKEND
+    )
+    graded_questions = []
+    for processed_question, result in zip(processed_questions, results):
+        if result.ok and result.output is not None:
+            graded_questions.append(processed_question | result.output.model_dump())
+        else:
+            print(f"grading failed: {result.error}")
+            graded_questions.append(processed_question | {"grading_error": result.error})
+    return graded_questions
+
 # Example usage
 if __name__ == "__main__":
 
@@ -125,7 +145,11 @@ if __name__ == "__main__":
             processed_questions.append(processed_question)
             with open(f"{out_folder}/{out_filename}", "w") as f:
                 json.dump(processed_questions, f, indent=2)
-            time.sleep(5) # for anthropic rate limit
+
+        print(f"grading {len(processed_questions)} answers")
+        processed_questions = grade_questions(processed_questions)
+        with open(f"{out_folder}/{out_filename}", "w") as f:
+            json.dump(processed_questions, f, indent=2)
         
 
 
@@ -1,6 +1,9 @@
 import json
+import os
 import pandas as pd
 from ultimate_rules_rag.retriever import Retriever
+from ultimate_rules_rag.fusion import fuse
+from ultimate_rules_rag.vector_index import VectorIndex
 import argparse
 
 
@@ -9,18 +12,26 @@ def load_dataset(file_path):
         return json.load(file)
 
 
-def process_eval(eval, retriever, search_type, fts_operator, limit, expand_context):
+def process_evals(evals, retriever, search_type, fts_operator, limit, expand_context):
+    """Retrieve for every eval question in one batched search and score each result."""
+    retrieved_docs_per_eval = retriever.search_many(
+        [eval.get("question") for eval in evals],
+        search_type = search_type,
+        fts_operator = fts_operator or "OR",
+        limit=limit,
+        expand_context=expand_context,
+        query_embeddings = [eval.get("question_embedding") for eval in evals]
+    )
+    return [
+        process_eval(eval, retrieved_docs)
+        for eval, retrieved_docs in zip(evals, retrieved_docs_per_eval)
+    ]
+
+
+def process_eval(eval, retrieved_docs):
     target_rules = "\n" .join(eval.get("rules"))
     target_rule_numbers = extract_rule_numbers(target_rules)
     
-    retrieved_docs = retriever.search(
-        eval.get("question"), 
-        search_type = search_type, 
-        fts_operator = fts_operator,
-        limit=limit, 
-        expand_context=expand_context,
-        query_embedding = eval.get("question_embedding")
-    )
     retrieved_docs_str = "\n".join([doc["content"] for doc in retrieved_docs])
     retrieved_rule_numbers = extract_rule_numbers(retrieved_docs_str)
 
@@ -39,11 +50,14 @@ def extract_rule_numbers(text):
     return rule_numbers
 
 def save_results(results, search, limit, expand, chunk_size, folder="evals/results", basename="retrieval"):
+    os.makedirs(folder, exist_ok=True)
     path = f"{folder}/{basename}_chunk-{chunk_size}_search-{search}_lim-{limit}_expand-{expand}.csv"
     df = pd.DataFrame(results)
     df.to_csv(path, index=False)
 
-def test_retrieval(path, searches, limits, expand_contexts, chunk_size):
+def test_retrieval(path, searches, limits, expand_contexts, chunk_size, vector_index=None, basename="retrieval"):
+    retriever = Retriever(vector_index=vector_index)
+    evals = load_dataset(path)
     for search in searches:
         for fts_operator in ["AND", "OR"]:
             if fts_operator in search:
@@ -56,21 +70,38 @@ def test_retrieval(path, searches, limits, expand_contexts, chunk_size):
         for expand_context in expand_contexts:
             for limit in limits:
                 print(f"search: {search_type}{fts_operator if fts_operator else ''}, expand: {expand_context}, limit: {limit}")
-                retriever = Retriever()
-                results = []
-                evals = load_dataset(path)
-                for i, eval in enumerate(evals):
-                    print(f"\titem {i+1} of {len(evals)}", end = "\r")
-                    processed_eval = process_eval(eval, retriever, search_type, fts_operator, limit, expand_context)
-                    results.append(processed_eval)
-                #     # if i == 5:
-                #     #     break
+                results = process_evals(evals, retriever, search_type, fts_operator, limit, expand_context)
                 save_results(results, search, limit, expand_context, chunk_size,
-                             folder="evals/results/retrieval", basename="retrieval")
+                             folder="evals/results/retrieval", basename=basename)
+
+def test_fusion(path, methods, limits, semantic_weights, ks, chunk_size, candidate_num=100):
+    """Sweep client-side fusion settings over semantic/FTS candidates fetched once."""
+    retriever = Retriever()
+    evals = load_dataset(path)
+    candidates = retriever.get_fusion_candidates(
+        [eval.get("question") for eval in evals],
+        candidate_num=candidate_num,
+        query_embeddings=[eval.get("question_embedding") for eval in evals]
+    )
+    for method in methods:
+        for k in (ks if method == "rrf" else [60]):
+            for semantic_weight in semantic_weights:
+                search = f"{method}-k{k}-w{semantic_weight}" if method == "rrf" else f"{method}-w{semantic_weight}"
+                for limit in limits:
+                    print(f"fusion: {search}, limit: {limit}")
+                    rows_per_eval = fuse(candidates, method, limit, k, semantic_weight, 1 - semantic_weight)
+                    results = [
+                        process_eval(eval, retriever._format_docs(rows))
+                        for eval, rows in zip(evals, rows_per_eval)
+                    ]
+                    save_results(results, search, limit, 0, chunk_size,
+                                 folder="evals/results/fusion", basename="fusion")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Evaluate retrieval with specified chunk size')
     parser.add_argument('--chunk_size', type=int, help='Size of chunks to process')
+    parser.add_argument('--fusion', action='store_true', help='Sweep client-side fusion methods instead of the search grid')
+    parser.add_argument('--artifacts', action='store_true', help='Semantic search over the memory-mapped embedding artifacts, without the database')
     args = parser.parse_args()
 
     folder = "evals/datasets"
@@ -85,4 +116,14 @@ if __name__ == "__main__":
     expand_contexts = [0,1]
 
     path = f"{folder}/{eval_file}"
-    test_retrieval(path, searches, limits, expand_contexts, args.chunk_size) 
\ No newline at end of file
+    if args.artifacts:
+        vector_index = VectorIndex.from_artifacts({
+            "glossary": "texts/chunked_embedded/glossary_embeddings",
+            "rules": f"texts/chunked_embedded/rules_contextual_embeddings_chunk-{args.chunk_size}_expurgated"
+        })
+        # Full-text search and context expansion need the database
+        test_retrieval(path, ["semantic"], limits, [0], args.chunk_size, vector_index, basename="retrieval-artifacts")
+    elif args.fusion:
+        test_fusion(path, ["rrf", "weighted_sum", "combmnz"], limits, [0.3, 0.5, 0.7, 0.8], [10, 30, 60], args.chunk_size)
+    else:
+        test_retrieval(path, searches, limits, expand_contexts, args.chunk_size) 
\ No newline at end of file
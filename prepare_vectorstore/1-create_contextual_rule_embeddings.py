@@ -2,13 +2,39 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-import json
+import sys
+import time
+import random
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import anthropic
 from openai import OpenAI
+from anthropic import Anthropic
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from content_store import ContentStore, content_hash, DEFAULT_STORE_PATH
 
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from src.embedding_artifacts import save_items, OUTPUT_FORMATS
+
+# Retries are handled by `with_retry` so they share the rate limiter
+client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
+anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
 MODEL_NAME = "gpt-4o-mini"
+ANTHROPIC_MODEL_NAME = "claude-3-5-haiku-20241022"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+    anthropic.RateLimitError,
+    anthropic.APIConnectionError,
+    anthropic.APITimeoutError,
+    anthropic.InternalServerError,
+)
 
 DOCUMENT_CONTEXT_PROMPT = """
 You are a helpful assistant that is helping to situate a chunk of text within a larger document. 
@@ -58,10 +84,46 @@ If the chunk is a continuation of a rule definition, please summarize the rule a
 Answer only with the succinct context and nothing else. 
 """
 
+class RateLimiter:
+    """Spaces out request starts so at most `requests_per_minute` are sent, across all worker threads."""
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+def with_retry(fn, *args, rate_limiter: RateLimiter, max_retries: int = 5, base_delay: float = 1.0):
+    """Call fn(*args) after waiting for a rate-limit slot, retrying transient API errors with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        rate_limiter.wait()
+        try:
+            return fn(*args)
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            retry_after = None
+            response = getattr(e, "response", None)
+            if response is not None:
+                retry_after = response.headers.get("retry-after")
+            delay = float(retry_after) if retry_after else base_delay * 2 ** attempt + random.uniform(0, base_delay)
+            print(f"\n{type(e).__name__}, retrying in {delay:.1f} s (attempt {attempt + 1} of {max_retries})")
+            time.sleep(delay)
+
 def create_embedding(text):
-    response = client.embeddings.create(input=text, model="text-embedding-3-small")
+    response = client.embeddings.create(input=text, model=EMBEDDING_MODEL)
     return response.data[0].embedding
 
+def create_embeddings(texts: list[str]) -> list[list[float]]:
+    """Embed a batch of texts with one request, in input order."""
+    response = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
 def extract_sections(markdown_text):
     """Extract sections from the markdown text using regex."""
     named_sections = []
@@ -77,18 +139,58 @@ def extract_sections(markdown_text):
     
     return named_sections
 
-def situate_context_openai(section: str, chunk: str) -> str:
+# Both providers cache prompt prefixes, so each request starts with the section
+# (identical for every chunk of it) and only the trailing chunk part varies. Prefixes
+# under the provider minimum (1024 tokens for OpenAI, 2048 for Claude Haiku) are not cached.
+
+def situate_context_openai(section: dict, chunk: str) -> tuple[str, dict]:
+    """Situate a chunk within its section with OpenAI, relying on automatic prefix caching."""
     response = client.chat.completions.create(
         model=MODEL_NAME,
         max_tokens=250,
         temperature=0.1,
+        # Routes every chunk of a section to the same cache
+        prompt_cache_key=f"situate-{section['section_name']}",
         messages=[
             {
                 "role": "user", 
                 "content": [
                     {
                         "type": "text",
-                        "text": DOCUMENT_CONTEXT_PROMPT.format(section=section)
+                        "text": DOCUMENT_CONTEXT_PROMPT.format(section=section["text"])
+                    },
+                    {
+                        "type": "text",
+                        "text": CHUNK_CONTEXT_PROMPT.format(chunk=chunk)
+                    }
+                ]
+            }
+        ],
+    )
+    usage = response.usage
+    details = usage.prompt_tokens_details
+    tokens = {
+        "prompt": usage.prompt_tokens,
+        "completion": usage.completion_tokens,
+        "cached": (details.cached_tokens or 0) if details else 0,
+        "cache_write": 0
+    }
+    return response.choices[0].message.content, tokens
+
+def situate_context_anthropic(section: dict, chunk: str) -> tuple[str, dict]:
+    """Situate a chunk within its section with Claude, marking the section block for prompt caching."""
+    response = anthropic_client.messages.create(
+        model=ANTHROPIC_MODEL_NAME,
+        max_tokens=250,
+        temperature=0.1,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": DOCUMENT_CONTEXT_PROMPT.format(section=section["text"]),
+                        "cache_control": {"type": "ephemeral"}
                     },
                     {
                         "type": "text",
@@ -98,9 +200,59 @@ def situate_context_openai(section: str, chunk: str) -> str:
             }
         ],
     )
-    return response
+    usage = response.usage
+    cached = usage.cache_read_input_tokens or 0
+    cache_write = usage.cache_creation_input_tokens or 0
+    tokens = {
+        # input_tokens only counts the uncached remainder
+        "prompt": usage.input_tokens + cached + cache_write,
+        "completion": usage.output_tokens,
+        "cached": cached,
+        "cache_write": cache_write
+    }
+    return response.content[0].text, tokens
 
-def process_rules_document(chunk_size):
+SITUATE_CONTEXT = {
+    "openai": situate_context_openai,
+    "anthropic": situate_context_anthropic,
+}
+
+CONTEXT_MODELS = {
+    "openai": MODEL_NAME,
+    "anthropic": ANTHROPIC_MODEL_NAME,
+}
+
+def context_key(provider: str, section: dict, chunk: str) -> str:
+    """Store key of a chunk's context: everything that goes into the request, prompts included."""
+    return content_hash("context", CONTEXT_MODELS[provider], DOCUMENT_CONTEXT_PROMPT, CHUNK_CONTEXT_PROMPT, section["text"], chunk)
+
+def embedding_key(text: str) -> str:
+    return content_hash("embedding", EMBEDDING_MODEL, text)
+
+def process_rules_document(
+        chunk_size,
+        workers: int = 8,
+        requests_per_minute: float = 500,
+        embedding_batch_size: int = 100,
+        max_retries: int = 5,
+        provider: str = "openai",
+        store: ContentStore | None = None
+    ):
+    """
+    Situate and embed every chunk of the rules document.
+
+    Context requests run concurrently on a bounded thread pool behind a shared rate
+    limiter, then the chunk+context texts are embedded in batches. Results are
+    collected by chunk position, so the items come out in the same order as a
+    serial run.
+
+    The first chunk of every section is situated before the others, so the
+    section prefix is already cached when the rest of its chunks are sent.
+
+    With a `store`, contexts and embeddings produced by earlier runs are reused,
+    so only new or changed chunks cost API calls.
+    """
+    situate_context = SITUATE_CONTEXT[provider]
     # Read the rules document
     with open("texts/Official-Rules-of-Ultimate-2024-2025_expurgated.md", "r", encoding="utf-8") as f:
         rules_text = f.read()
@@ -116,44 +268,116 @@ def process_rules_document(chunk_size):
         separators=SEPARATORS
     )
     
-    items = []
+    jobs = []
     for section in sections:
         text = section["text"]
         chunks = splitter.split_text(text)
-        print(f"\nsection: {section['section_name']} ({len(chunks)} chunks)")
-        
-        for i, chunk in enumerate(chunks):
-            print(f"chunk {i+1} of {len(chunks)}     ", end="\r")
-            context_response = situate_context_openai(section["section_name"], chunk)
-            context = context_response.choices[0].message.content
-            usage = context_response.usage
-            embedding = create_embedding(f"{chunk}\n\n{context}")
-            
-            item = {
-                "context": context,
-                "chunk": chunk,
-                "tokens": {
-                    "prompt": usage.prompt_tokens, 
-                    "completion": usage.completion_tokens
-                },
-                "embedding": embedding
-            }
-            items.append(item)
+        print(f"section: {section['section_name']} ({len(chunks)} chunks)")
+        jobs.extend((section, chunk) for chunk in chunks)
+
+    rate_limiter = RateLimiter(requests_per_minute)
+    retry = lambda fn, *args: with_retry(fn, *args, rate_limiter=rate_limiter, max_retries=max_retries)
+
+    results = [None] * len(jobs)
+    context_keys = [context_key(provider, section, chunk) for section, chunk in jobs]
+    if store is not None:
+        stored = store.get_many(context_keys)
+        for i, key in enumerate(context_keys):
+            if key in stored:
+                results[i] = (stored[key]["context"], stored[key]["tokens"])
+    pending = [i for i, result in enumerate(results) if result is None]
+    print(f"contexts: {len(jobs) - len(pending)} reused, {len(pending)} to generate")
+
+    completed = 0
+    progress_lock = threading.Lock()
+    def situate(i):
+        nonlocal completed
+        section, chunk = jobs[i]
+        context, tokens = retry(situate_context, section, chunk)
+        if store is not None:
+            store.put(context_keys[i], {"context": context, "tokens": tokens})
+        with progress_lock:
+            completed += 1
+            print(f"context {completed} of {len(pending)}     ", end="\r")
+        return context, tokens
+
+    first_in_section = {}
+    for i in pending:
+        first_in_section.setdefault(jobs[i][0]["section_name"], i)
+    warm = sorted(first_in_section.values())
+    rest = sorted(set(pending) - set(warm))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # map returns results in job order regardless of completion order
+        for wave in (warm, rest):
+            for i, result in zip(wave, executor.map(situate, wave)):
+                results[i] = result
+        if pending:
+            print()
+
+        contexts = [context for context, _ in results]
+        texts = [f"{chunk}\n\n{context}" for (_, chunk), context in zip(jobs, contexts)]
+        embeddings = {}
+        if store is not None:
+            stored = store.get_many([embedding_key(text) for text in texts])
+            embeddings = {text: stored[embedding_key(text)] for text in texts if embedding_key(text) in stored}
+        missing = list(dict.fromkeys(text for text in texts if text not in embeddings))
+        batches = [missing[i:i + embedding_batch_size] for i in range(0, len(missing), embedding_batch_size)]
+        print(f"embeddings: {sum(text in embeddings for text in texts)} reused, {len(missing)} to create in {len(batches)} requests")
+        for batch, batch_embeddings in zip(batches, executor.map(lambda batch: retry(create_embeddings, batch), batches)):
+            new = dict(zip(batch, batch_embeddings))
+            if store is not None:
+                store.put_many({embedding_key(text): embedding for text, embedding in new.items()})
+            embeddings.update(new)
+        embeddings = [embeddings[text] for text in texts]
+
+    items = []
+    for (_, chunk), (context, tokens), embedding in zip(jobs, results, embeddings):
+        item = {
+            "context": context,
+            "chunk": chunk,
+            "tokens": tokens,
+            "embedding": embedding
+        }
+        items.append(item)
+
+    prompt_tokens = sum(item["tokens"]["prompt"] for item in items)
+    cached_tokens = sum(item["tokens"]["cached"] for item in items)
+    print(f"prompt tokens: {prompt_tokens}, cached: {cached_tokens} ({cached_tokens / max(prompt_tokens, 1):.0%})")
     
     return items
 
 def main():
     parser = argparse.ArgumentParser(description='Create contextual embeddings for rules document')
     parser.add_argument('--chunk_size', type=int, default=1500, help='Size of text chunks (default: 1500)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent context requests (default: 8)')
+    parser.add_argument('--requests_per_minute', type=float, default=500, help='Request rate limit, 0 for none (default: 500)')
+    parser.add_argument('--embedding_batch_size', type=int, default=100, help='Texts per embeddings request (default: 100)')
+    parser.add_argument('--max_retries', type=int, default=5, help='Retries per request on transient API errors (default: 5)')
+    parser.add_argument('--provider', choices=list(SITUATE_CONTEXT), default='openai', help='LLM used to situate chunks (default: openai)')
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help=f'Content-addressed store of contexts and embeddings (default: {DEFAULT_STORE_PATH})')
+    parser.add_argument('--no_store', action='store_true', help='Regenerate everything without reading or writing the store')
+    parser.add_argument('--output_format', choices=OUTPUT_FORMATS, default='npy', help='float32 .npy matrix + .meta.json sidecar, JSON, or both (default: npy)')
     args = parser.parse_args()
+
+    store = None if args.no_store else ContentStore(args.store)
     
-    items = process_rules_document(args.chunk_size)
+    items = process_rules_document(
+        args.chunk_size,
+        workers=args.workers,
+        requests_per_minute=args.requests_per_minute,
+        embedding_batch_size=args.embedding_batch_size,
+        max_retries=args.max_retries,
+        provider=args.provider,
+        store=store
+    )
     
     # Save the results
-    output_path = f"texts/chunked_embedded/rules_contextual_embeddings_chunk-{args.chunk_size}_expurgated.json"
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, "w") as f:
-        json.dump(items, f, indent=2)
+    output_prefix = f"texts/chunked_embedded/rules_contextual_embeddings_chunk-{args.chunk_size}_expurgated"
+    save_items(
+        output_prefix, items, args.output_format,
+        metadata={"embedding_model": EMBEDDING_MODEL, "chunk_size": args.chunk_size}
+    )
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -2,16 +2,34 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import sys
+import argparse
 from openai import OpenAI
-import json
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from content_store import ContentStore, content_hash, DEFAULT_STORE_PATH
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from src.embedding_artifacts import save_items, OUTPUT_FORMATS
+
+parser = argparse.ArgumentParser(description='Create embeddings for the glossary')
+parser.add_argument('--output_format', choices=OUTPUT_FORMATS, default='npy', help='float32 .npy matrix + .meta.json sidecar, JSON, or both (default: npy)')
+args = parser.parse_args()
 
 
 client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Embeddings from earlier runs are reused, keyed as in 1-create_contextual_rule_embeddings.py
+store = ContentStore(DEFAULT_STORE_PATH)
 
 def create_embedding(text):
-    response = client.embeddings.create(input=text, model="text-embedding-3-small")
-    return response.data[0].embedding
+    key = content_hash("embedding", EMBEDDING_MODEL, text)
+    embedding = store.get(key)
+    if embedding is None:
+        response = client.embeddings.create(input=text, model=EMBEDDING_MODEL)
+        embedding = response.data[0].embedding
+        store.put(key, embedding)
+    return embedding
 
 
 # load the definitions
@@ -35,5 +53,8 @@ for i, chunk in enumerate(chunks):
     }
     items.append(item)
    
-with open("texts/glossary_embeddings.json", "w") as f:
-    json.dump(items, f, indent = 2)
+# Same prefix that 3-add_to_vectorstore.py loads
+save_items(
+    "texts/chunked_embedded/glossary_embeddings", items, args.output_format,
+    metadata={"embedding_model": EMBEDDING_MODEL}
+)
@@ -2,13 +2,18 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-import psycopg2
-from pgvector.sqlalchemy import Vector
+import sys
+import psycopg
+from pgvector.psycopg import register_vector
 
-import json
 import time
-from psycopg2 import OperationalError
+from collections import defaultdict
+from psycopg import OperationalError
 import argparse
+from content_store import document_hash
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from src.embedding_artifacts import load_items
 
 # Database connection parameters from environment variables
 DB_NAME = os.getenv('POSTGRES_DB')
@@ -17,36 +22,164 @@ DB_PASSWORD = os.getenv('POSTGRES_PASSWORD')
 DB_HOST = os.getenv('POSTGRES_HOST')
 DB_PORT = os.getenv('POSTGRES_LOCAL_PORT')
 
-# Example: Insert a document with its embedding
-def insert_document(content, context, source, embedding):
-    with psycopg2.connect(
+GLOSSARY_CONTEXT = "This is taken from Ultiworld's Ultimate Glosssary"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Search indexes on documents (see db/1-setup_database.sql), rebuilt once after the load
+# instead of being updated row by row
+SEARCH_INDEXES = {
+    "documents_embedding_idx": "CREATE INDEX documents_embedding_idx ON documents USING hnsw (embedding vector_ip_ops)",
+    "documents_content_tsv_idx": "CREATE INDEX documents_content_tsv_idx ON documents USING GIN (content_tsv)",
+}
+
+def connect():
+    return psycopg.connect(
         dbname=DB_NAME,
         user=DB_USER,
         password=DB_PASSWORD,
         host=DB_HOST,
         port=DB_PORT
-    ) as conn:
+    )
+
+COPY_COLUMNS = "content, context, source, embedding, chunk_index, content_hash"
+COPY_TYPES = ["text", "text", "text", "vector", "int4", "text"]
+
+def ensure_schema(conn):
+    """Add the incremental-load columns to databases created before they existed."""
+    with conn.transaction():
+        conn.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS chunk_index INTEGER")
+        conn.execute("ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT")
+        # Rows from older full loads were inserted in file order
+        conn.execute("""
+            UPDATE documents d SET chunk_index = ranked.position
+            FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY source ORDER BY id) - 1 AS position FROM documents) ranked
+            WHERE d.id = ranked.id AND d.chunk_index IS NULL
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS documents_source_chunk_index_idx ON documents(source, chunk_index)")
+        conn.execute("CREATE INDEX IF NOT EXISTS documents_content_hash_idx ON documents(content_hash)")
+
+def iter_documents(prefixes):
+    """
+    Yield (content, context, source, embedding, chunk_index, content_hash) rows from each chunk file in turn.
+
+    Each prefix is read as a memory-mapped embedding artifact, or as <prefix>.json if there is none.
+    """
+    for source, prefix in prefixes.items():
+        print(f"Processing {prefix}...")
+        chunks = load_items(prefix)
+        for chunk_index, chunk in enumerate(chunks):
+            context = chunk["context"] if "context" in chunk else GLOSSARY_CONTEXT
+            yield (
+                chunk["chunk"],
+                context,
+                source,
+                chunk["embedding"],
+                chunk_index,
+                document_hash(chunk["chunk"], context, source, EMBEDDING_MODEL)
+            )
+
+def copy_rows(cursor, rows) -> int:
+    """Binary COPY of the rows into documents, returning the row count."""
+    n_rows = 0
+    with cursor.copy(f"COPY documents ({COPY_COLUMNS}) FROM STDIN WITH (FORMAT BINARY)") as copy:
+        copy.set_types(COPY_TYPES)
+        for row in rows:
+            copy.write_row(row)
+            n_rows += 1
+    return n_rows
+
+def bulk_load(conn, rows):
+    """
+    Load all rows with one binary COPY inside a single transaction.
+
+    The search indexes are dropped before the COPY and rebuilt after it, so a
+    failed load leaves the table and its indexes untouched.
+
+    Returns:
+        dict: Row count and timings of the load and the index rebuild
+    """
+    register_vector(conn)
+    with conn.transaction():
+        with conn.cursor() as cursor:
+            for name in SEARCH_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+            start = time.perf_counter()
+            n_rows = copy_rows(cursor, rows)
+            load_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            cursor.execute("SET LOCAL maintenance_work_mem = '256MB'")
+            for create_index in SEARCH_INDEXES.values():
+                cursor.execute(create_index)
+            cursor.execute("ANALYZE documents")
+            index_s = time.perf_counter() - start
+
+    return {"rows": n_rows, "load_s": load_s, "index_s": index_s}
+
+def incremental_load(conn, rows):
+    """
+    Bring documents in line with the rows by content hash, in a single transaction.
+
+    Rows whose hash is already in the table keep their embedding (only their
+    chunk_index is updated if they moved), new or changed rows are inserted and
+    rows no longer produced (including any without a hash) are deleted. The
+    search indexes stay in place, as only the changed rows touch them.
+
+    Returns:
+        dict: Counts of unchanged, moved, inserted and deleted rows, and the elapsed time
+    """
+    register_vector(conn)
+    start = time.perf_counter()
+    with conn.transaction():
         with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO documents (content, context, source, embedding)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id;
-            """, (content, context, source, embedding))
-            doc_id = cursor.fetchone()[0]
-            conn.commit()
-            return doc_id
+            cursor.execute("SELECT id, chunk_index, content_hash FROM documents")
+            existing = defaultdict(list)
+            for doc_id, chunk_index, row_hash in cursor.fetchall():
+                existing[row_hash].append((doc_id, chunk_index))
+
+            new_rows = []
+            moved = []
+            n_unchanged = 0
+            for row in rows:
+                matches = existing.get(row[-1])
+                if matches:
+                    doc_id, chunk_index = matches.pop()
+                    n_unchanged += 1
+                    if chunk_index != row[4]:
+                        moved.append((doc_id, row[4]))
+                else:
+                    new_rows.append(row)
+            stale_ids = [doc_id for matches in existing.values() for doc_id, _ in matches]
+
+            if stale_ids:
+                cursor.execute("DELETE FROM documents WHERE id = ANY(%s)", (stale_ids,))
+            if moved:
+                cursor.execute(
+                    """
+                    UPDATE documents d SET chunk_index = m.chunk_index
+                    FROM unnest(%s::INT[], %s::INT[]) AS m(id, chunk_index)
+                    WHERE d.id = m.id
+                    """,
+                    ([doc_id for doc_id, _ in moved], [chunk_index for _, chunk_index in moved])
+                )
+            n_inserted = copy_rows(cursor, new_rows)
+            if stale_ids or moved or new_rows:
+                cursor.execute("ANALYZE documents")
+
+    return {
+        "unchanged": n_unchanged,
+        "moved": len(moved),
+        "inserted": n_inserted,
+        "deleted": len(stale_ids),
+        "s": time.perf_counter() - start
+    }
 
 def wait_for_db(max_retries=5, delay=5):
     retries = 0
     while retries < max_retries:
         try:
-            conn = psycopg2.connect(
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                host=DB_HOST,
-                port=DB_PORT
-            )
+            conn = connect()
             conn.close()
             print("Successfully connected to the database")
             return
@@ -56,34 +189,38 @@ def wait_for_db(max_retries=5, delay=5):
             time.sleep(delay)
     raise Exception("Max retries reached. Unable to connect to the database.")
 
-# Example usage
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Process embeddings with specified chunk size')
     parser.add_argument('--chunk_size', type=int, default=2000,
                        help='Size of chunks to process (default: 2000)')
-    
+    parser.add_argument('--incremental', action='store_true',
+                       help='Only insert new or changed chunks and delete stale ones')
+
     args = parser.parse_args()
 
     wait_for_db()
 
     expurgated = True
-    
-    paths = {
-        "glossary": f"texts/chunked_embedded/glossary_embeddings.json",
-        "rules": f"texts/chunked_embedded/rules_contextual_embeddings_chunk-{args.chunk_size}{'_expurgated' if expurgated else ''}.json"
+
+    prefixes = {
+        "glossary": f"texts/chunked_embedded/glossary_embeddings",
+        "rules": f"texts/chunked_embedded/rules_contextual_embeddings_chunk-{args.chunk_size}{'_expurgated' if expurgated else ''}"
     }
-    for path in paths:
-        print(f"Processing {path}...")
-        with open(paths[path], "r") as f:
-            chunks = json.load(f)
-
-        for i, chunk in enumerate(chunks):
-            print(f"{i+1} of {len(chunks)}   ", end = "\r")
-            doc_id = insert_document(
-                content = chunk["chunk"],
-                context = chunk["context"] if "context" in chunk else "This is taken from Ultiworld's Ultimate Glosssary",
-                source = path,
-                embedding = chunk["embedding"]
-            )
-            print(f"Inserted document with ID: '{doc_id}' for sentence: '{chunk['chunk']}' ")
-        
\ No newline at end of file
+    with connect() as conn:
+        ensure_schema(conn)
+        if args.incremental:
+            stats = incremental_load(conn, iter_documents(prefixes))
+        else:
+            stats = bulk_load(conn, iter_documents(prefixes))
+
+    if args.incremental:
+        print(
+            f"Inserted {stats['inserted']} and deleted {stats['deleted']} documents, "
+            f"{stats['unchanged']} unchanged ({stats['moved']} moved), in {stats['s']:.2f} s"
+        )
+    else:
+        print(
+            f"Inserted {stats['rows']} documents in {stats['load_s']:.2f} s "
+            f"({stats['rows'] / max(stats['load_s'], 1e-9):.0f} rows/s), "
+            f"rebuilt indexes in {stats['index_s']:.2f} s"
+        )
@@ -0,0 +1,70 @@
+"""Local content-addressed store shared by the vectorstore preparation scripts.
+
+Contexts and embeddings are stored under the sha256 of everything that produced
+them (model, prompt, section and chunk text), so a rebuild after a rulebook edit
+or a new chunk size only calls the APIs for chunks that actually changed.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+
+DEFAULT_STORE_PATH = "texts/content_store.sqlite3"
+
+
+def content_hash(*parts: str) -> str:
+    """Hex sha256 of the parts, joined with NUL so part boundaries are unambiguous."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def document_hash(content: str, context: str | None, source: str, embedding_model: str) -> str:
+    """Identity of a `documents` row: its text, context, source and embedding model."""
+    return content_hash(content, context or "", source, embedding_model)
+
+
+class ContentStore:
+    """JSON values keyed by content hash in a SQLite file. Safe to share between threads."""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS content (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.conn.commit()
+
+    def get_many(self, keys: list[str]) -> dict:
+        """Return {key: value} for the keys that are present."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self.lock:
+            # stay well under SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, value FROM content WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: dict):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO content (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in items.items()]
+            )
+            self.conn.commit()
+
+    def put(self, key: str, value):
+        self.put_many({key: value})
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM content").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()